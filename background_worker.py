@@ -0,0 +1,56 @@
+import logging
+import threading
+
+
+class BackgroundWorker:
+    """Runs ``run_once()`` over and over on a daemon thread
+
+    ``run_once()`` returns the seconds to wait before the next round;
+    ``wake()`` cuts that wait short. A round that raises is logged to the
+    subclass's module logger and tried again after ``retry_delay()`` seconds.
+    ``stop()`` sets ``_stopped``, which long rounds can check to return early.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._logger = logging.getLogger(type(self).__module__)
+
+    def start(self):
+        """Start the background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the background thread"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Run the next round now"""
+        self._wakeup.set()
+
+    def run_once(self):
+        """Do one round of work and return the seconds until the next one"""
+        raise NotImplementedError
+
+    def retry_delay(self):
+        """Seconds to wait after a failed round"""
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                delay = self.retry_delay()
+                self._logger.warning("%s round failed, retrying in %.1fs: %s", self.name, delay, e)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
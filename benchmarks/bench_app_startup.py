@@ -0,0 +1,85 @@
+"""Cold start and rerun latency of the Streamlit app
+
+Starts an in-process dev chain with the PaymentGateway deployed, then launches
+SAMPLES fresh Python processes that each render blockchain_payment_app.py once
+(cold start: imports, node connection, contract, caches and workers) followed by
+RERUNS reruns of the Merchant Dashboard, which is what every widget change costs.
+
+    SAMPLES=5 RERUNS=50 python benchmarks/bench_app_startup.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "blockchain_payment_app.py")
+
+SAMPLES = int(os.getenv("SAMPLES", "3"))
+RERUNS = int(os.getenv("RERUNS", "20"))
+
+
+def measure_app():
+    """Render the app once cold and RERUNS times warm, print timings as JSON"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    reruns = []
+    for _ in range(RERUNS):
+        start = time.perf_counter()
+        at.run()
+        reruns.append(time.perf_counter() - start)
+    print(json.dumps({'cold': cold, 'reruns': reruns}))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    sys.path.insert(0, REPO_DIR)
+    from local_chain import LocalChain
+
+    chain = LocalChain().start()
+    env = dict(
+        os.environ,
+        BLOCKCHAIN_URL=chain.url,
+        SMART_CONTRACT_ADDRESS=chain.deploy_payment_gateway(),
+        ADMIN_ADDRESS=chain.accounts[0],
+    )
+    cold = []
+    reruns = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in range(SAMPLES):
+            env['LEDGER_DB_PATH'] = os.path.join(tmp, f"ledger-{n}.db")
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "child"],
+                env=env, cwd=REPO_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            cold.append(result['cold'])
+            reruns.extend(result['reruns'])
+    chain.stop()
+
+    print(f"cold start  samples={SAMPLES} median={statistics.median(cold) * 1000:7.1f}ms "
+          f"max={max(cold) * 1000:7.1f}ms")
+    print(f"rerun       samples={len(reruns)} median={statistics.median(reruns) * 1000:7.1f}ms "
+          f"p95={percentile(reruns, 0.95) * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["child"]:
+        measure_app()
+    else:
+        main()
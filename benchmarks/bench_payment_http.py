@@ -0,0 +1,236 @@
+"""End-to-end benchmark of the mobile payment HTTP path
+
+Starts an in-process dev chain with the PaymentGateway deployed and a merchant
+registered, then runs the Streamlit app in a child process (which starts the
+mobile payment server on port 8000) and issues one payment link from the
+Merchant Dashboard. CLIENTS concurrent clients then drive:
+
+- ``qr_get``: GET of the short payment link, the page a phone opens after scanning
+- ``status_get``: GET /status/<paymentId> as JSON
+- ``approve_post``: POST /approve with a fresh payment ID from one funded payer
+  per client, through process_mobile_payment to broadcast
+
+For each scenario it records requests/s, latency percentiles, failures, JSON-RPC
+calls per request as seen by the chain (background pollers of the app included)
+and the resident memory of the app process. Results are written as JSON to
+OUTPUT; with BASELINE pointing at an earlier results file, the changes in
+requests/s and p95 latency are printed too.
+
+    CLIENTS=8 REQUESTS=500 APPROVALS=200 OUTPUT=bench_payment_http.json \\
+        BASELINE=previous.json python benchmarks/bench_payment_http.py
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(REPO_DIR, "blockchain_payment_app.py")
+SERVER_URL = "http://127.0.0.1:8000"
+
+CLIENTS = int(os.getenv("CLIENTS", "8"))
+REQUESTS = int(os.getenv("REQUESTS", "300"))
+APPROVALS = int(os.getenv("APPROVALS", "100"))
+OUTPUT = os.getenv("OUTPUT", "bench_payment_http.json")
+BASELINE = os.getenv("BASELINE")
+
+
+def serve_app():
+    """Child process: render the app, issue a payment link and keep the server up until stdin closes"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    at.text_input[0].set_value(os.environ['BENCH_MERCHANT'])
+    next(button for button in at.button if button.label == "Generate Payment QR").click()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    print(json.dumps({
+        'payment_url': at.session_state['payment_url'],
+        'payment_id': at.session_state['payment_id'],
+    }), flush=True)
+    sys.stdin.read()
+
+
+def memory_kb(pid):
+    """Return (current, peak) resident memory of a process in kB, where /proc is available"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields['VmRSS'].split()[0]), int(fields['VmHWM'].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(name, chain, app_pid, requests, clients, make_request):
+    """Run ``requests`` calls of make_request(n) on ``clients`` threads and return the scenario result"""
+    latencies = []
+    failures = {}
+    lock = threading.Lock()
+
+    def one(n):
+        start = time.perf_counter()
+        try:
+            make_request(n)
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            if error:
+                failures[error] = failures.get(error, 0) + 1
+            else:
+                latencies.append(elapsed)
+
+    chain.reset_counts()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(requests)))
+    seconds = time.perf_counter() - start
+    rss_kb, peak_rss_kb = memory_kb(app_pid)
+    rpc_calls = sum(chain.rpc_counts.values())
+    result = {
+        'requests': requests,
+        'clients': clients,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'failures': failures,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            'max': round(max(latencies) * 1000, 2) if latencies else None,
+        },
+        'rpc_calls_per_request': round(rpc_calls / requests, 2),
+        'rpc_http_requests_per_request': round(chain.http_requests / requests, 2),
+        'rpc_calls': dict(chain.rpc_counts.most_common()),
+        'app_rss_kb': rss_kb,
+        'app_peak_rss_kb': peak_rss_kb,
+    }
+    print(f"{name:<13} requests={requests:<5} req/s={result['requests_per_second']:8.1f} "
+          f"p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+          f"p99={result['latency_ms']['p99']}ms rpc/req={result['rpc_calls_per_request']} "
+          f"failed={sum(failures.values())} rss={rss_kb}kB")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"compared with {baseline_path} ({baseline.get('revision')}):")
+    for name, result in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        rps_change = result['requests_per_second'] / max(before['requests_per_second'], 1e-9) - 1
+        p95_before, p95_after = before['latency_ms']['p95'], result['latency_ms']['p95']
+        p95_change = (p95_after / p95_before - 1) if p95_before and p95_after else 0
+        print(f"  {name:<13} req/s {rps_change:+6.1%}  p95 {p95_change:+6.1%}")
+
+
+def main():
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    from local_chain import LocalChain
+    from contract_abi import CONTRACT_ABI
+
+    chain = LocalChain().start()
+    contract_address = chain.deploy_payment_gateway()
+    contract = chain.w3.eth.contract(address=contract_address, abi=CONTRACT_ABI)
+    merchant = chain.accounts[1]
+    contract.functions.addMerchant(merchant).transact({'from': chain.accounts[0]})
+    payers = chain.funded_accounts(CLIENTS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            BLOCKCHAIN_URL=chain.url,
+            SMART_CONTRACT_ADDRESS=contract_address,
+            ADMIN_ADDRESS=chain.accounts[0],
+            LEDGER_DB_PATH=os.path.join(tmp, "ledger.db"),
+            BENCH_MERCHANT=merchant,
+        )
+        app = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"], env=env, cwd=REPO_DIR,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            ready = json.loads(app.stdout.readline())
+            link_path = urllib.parse.urlparse(ready['payment_url']).path
+            status_path = "/status/" + urllib.parse.quote(ready['payment_id'])
+            run_tag = str(int(time.time()))
+
+            def qr_get(n):
+                urllib.request.urlopen(SERVER_URL + link_path, timeout=30).read()
+
+            def status_get(n):
+                urllib.request.urlopen(SERVER_URL + status_path, timeout=30).read()
+
+            payer_locks = [threading.Lock() for _ in payers]
+
+            def approve_post(n):
+                payer, private_key = payers[n % len(payers)]
+                body = urllib.parse.urlencode({
+                    'payment_data': json.dumps({'merchant': merchant, 'amount': 0.001,
+                                                'paymentId': f"BENCH-{run_tag}-{n}"}),
+                    'account_id': payer,
+                    'secret_key': private_key,
+                }).encode('utf-8')
+                request = urllib.request.Request(SERVER_URL + "/approve", data=body,
+                                                 headers={'Accept': 'application/json'})
+                # One approval per payer at a time keeps its nonces in order
+                with payer_locks[n % len(payers)]:
+                    answer = json.loads(urllib.request.urlopen(request, timeout=60).read())
+                if not answer['success']:
+                    raise RuntimeError(answer['result'])
+
+            results = {
+                'revision': git_revision(),
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'clients': CLIENTS,
+                'scenarios': {
+                    'qr_get': run_scenario("qr_get", chain, app.pid, REQUESTS, CLIENTS, qr_get),
+                    'status_get': run_scenario("status_get", chain, app.pid, REQUESTS, CLIENTS, status_get),
+                    'approve_post': run_scenario("approve_post", chain, app.pid, APPROVALS, CLIENTS, approve_post),
+                },
+            }
+        finally:
+            app.stdin.close()
+            app.wait(timeout=30)
+            app.stdout.close()
+    chain.stop()
+
+    with open(OUTPUT, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {OUTPUT}")
+    if BASELINE:
+        compare(results, BASELINE)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve"]:
+        serve_app()
+    else:
+        main()
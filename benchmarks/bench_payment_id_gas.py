@@ -0,0 +1,86 @@
+"""Gas and encoding cost of string vs bytes32 payment IDs
+
+For PAYMENTS payment IDs, compares PaymentGateway (string IDs) with
+PaymentGatewayBytes32 (keccak256 of the ID as bytes32):
+
+- client side: time to ABI-encode processedPayments() lookups, and the size
+  and calldata gas of processPayment() transactions
+- on chain: average gasUsed of processPayment() on an in-process dev chain;
+  contracts without an up-to-date Truffle artifact are compiled with py-solc-x
+
+    PAYMENTS=200 python benchmarks/bench_payment_id_gas.py
+"""
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from web3 import Web3
+
+from contract_abi import CONTRACT_ABI, CONTRACT_ABI_BYTES32, payment_id_key
+from local_chain import ArtifactError, LocalChain, load_artifact
+
+PAYMENTS = int(os.getenv("PAYMENTS", "100"))
+
+VARIANTS = [
+    ("string", CONTRACT_ABI, "PaymentGateway"),
+    ("bytes32", CONTRACT_ABI_BYTES32, "PaymentGatewayBytes32"),
+]
+
+
+def payment_ids():
+    return [f"PAY-{1760000000 + n}-INV{n:06d}" for n in range(PAYMENTS)]
+
+
+def calldata_gas(data):
+    """Intrinsic gas of transaction data: 4 per zero byte, 16 per non-zero byte"""
+    return sum(4 if byte == 0 else 16 for byte in data)
+
+
+def measure_encoding(name, abi):
+    contract = Web3().eth.contract(address="0x" + "11" * 20, abi=abi)
+    merchant = "0x" + "22" * 20
+    ids = payment_ids()
+
+    start = time.perf_counter()
+    for payment_id in ids:
+        contract.functions.processedPayments(payment_id_key(contract, payment_id))._encode_transaction_data()
+    elapsed = time.perf_counter() - start
+
+    calldata = [
+        Web3.to_bytes(hexstr=contract.functions.processPayment(
+            merchant, payment_id_key(contract, payment_id))._encode_transaction_data())
+        for payment_id in ids
+    ]
+    print(f"{name:<8} lookup_encode={elapsed / len(ids) * 1e6:6.1f}us "
+          f"processPayment_calldata={sum(map(len, calldata)) // len(calldata)}B "
+          f"calldata_gas={sum(map(calldata_gas, calldata)) // len(calldata)}")
+
+
+def measure_gas(name, abi, contract_name):
+    chain = LocalChain().start()
+    contract = chain.w3.eth.contract(
+        address=chain.deploy_payment_gateway(contract_name, allow_stale=False), abi=abi)
+    merchant, payer = chain.accounts[0], chain.accounts[1]
+    gas_used = []
+    for payment_id in payment_ids():
+        tx_hash = contract.functions.processPayment(merchant, payment_id_key(contract, payment_id)).transact(
+            {'from': payer, 'value': 10 ** 12}
+        )
+        gas_used.append(chain.w3.eth.get_transaction_receipt(tx_hash)['gasUsed'])
+    chain.stop()
+    print(f"{name:<8} processPayment_gas_used={sum(gas_used) // len(gas_used)}")
+
+
+if __name__ == "__main__":
+    for name, abi, _ in VARIANTS:
+        measure_encoding(name, abi)
+    try:
+        for _, _, contract_name in VARIANTS:
+            load_artifact(contract_name)
+    except ArtifactError as e:
+        sys.exit(f"on-chain gas needs both contracts built: {e}")
+    for name, abi, contract_name in VARIANTS:
+        measure_gas(name, abi, contract_name)
@@ -0,0 +1,63 @@
+"""QR code render time for payment links
+
+Compares the original per-request QRCode(version=1, fit=True) PNG encoding with
+QRRenderer encoding (PNG and SVG, version chosen up front) and with a QRRenderer
+cache hit, for ITERATIONS distinct payment links.
+
+    ITERATIONS=500 python benchmarks/bench_qr_render.py
+"""
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qrcode
+
+from qr_render import QRRenderer
+
+ITERATIONS = int(os.getenv("ITERATIONS", "100"))
+MERCHANT = "0xFFcf8FDEE72ac11b5c542428B35EEF5769C409f0"
+
+
+def payment_urls():
+    return [
+        "http://192.168.1.10:8000/?payment_data=" + json.dumps(
+            {'merchant': MERCHANT, 'amount': 0.01, 'paymentId': f"PAY-{1760000000 + n}"}
+        )
+        for n in range(ITERATIONS)
+    ]
+
+
+def render_original(url):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+
+def measure(name, render, urls):
+    start = time.perf_counter()
+    sizes = [len(render(url)) for url in urls]
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} per_image={elapsed / len(urls) * 1000:7.2f}ms "
+          f"bytes={sum(sizes) // len(sizes)}")
+
+
+if __name__ == "__main__":
+    urls = payment_urls()
+    renderer = QRRenderer(max_entries=2 * len(urls))
+    measure("original", render_original, urls)
+    measure("png", lambda url: renderer.render(url, "png"), urls)
+    measure("svg", lambda url: renderer.render(url, "svg"), urls)
+    measure("cached png", lambda url: renderer.render(url, "png"), urls)
@@ -0,0 +1,96 @@
+"""RPC traffic needed to confirm many outstanding payments
+
+Broadcasts PAYMENTS processPayment transactions to an in-process dev chain that
+mines a block every BLOCK_TIME seconds, then waits for all of them either with
+one wait_for_transaction_receipt loop per payment or with the shared batched
+ReceiptTracker, and reports the JSON-RPC traffic each approach generated.
+
+    PAYMENTS=500 python benchmarks/bench_receipt_polling.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web3 import Web3
+
+from local_chain import LocalChain, load_artifact
+from receipt_tracker import ReceiptTracker, CONFIRMED
+
+PAYMENTS = int(os.getenv("PAYMENTS", "100"))
+BLOCK_TIME = float(os.getenv("BLOCK_TIME", "0.5"))
+
+
+def broadcast_payments(w3, contract, merchant, payers, prefix):
+    """Sign and send one payment per payer account, return the tx hashes"""
+    hashes = []
+    for n, (payer, key) in enumerate(payers):
+        txn = contract.functions.processPayment(merchant, f"{prefix}-{n}").build_transaction({
+            'from': payer,
+            'value': 10 ** 12,
+            'gas': 100000,
+            'gasPrice': 10 ** 9,
+            'nonce': 0,
+        })
+        # eth-tester cannot mine queued EIP-155 txs with its large chain id; sign them unprotected
+        del txn['chainId']
+        signed = w3.eth.account.sign_transaction(txn, key)
+        hashes.append(w3.eth.send_raw_transaction(signed.raw_transaction))
+    return hashes
+
+
+def wait_individually(w3, hashes):
+    with ThreadPoolExecutor(max_workers=len(hashes)) as pool:
+        list(pool.map(lambda h: w3.eth.wait_for_transaction_receipt(h, timeout=600, poll_latency=0.1), hashes))
+
+
+def wait_with_tracker(w3, hashes):
+    tracker = ReceiptTracker(w3, confirmations=1, poll_interval=0.1, max_poll_interval=1.0)
+    for tx_hash in hashes:
+        tracker.track(tx_hash)
+    tracker.start()
+    while any(tracker.status(h)['status'] != CONFIRMED for h in hashes):
+        time.sleep(0.05)
+    tracker.stop()
+
+
+def run(name, wait):
+    chain = LocalChain().start()
+    # eth-tester needs ~0.1s per queued payment when it mines a block. Keep the timeout
+    # modest: web3 closes evicted per-thread sessions on a timer of this length.
+    w3 = Web3(Web3.HTTPProvider(chain.url, request_kwargs={'timeout': 90}))
+    contract = w3.eth.contract(address=chain.deploy_payment_gateway(), abi=_abi())
+    payers = chain.funded_accounts(PAYMENTS)
+    # eth-tester only accepts the next nonce per account, so use one fresh payer per payment
+    chain.set_auto_mine(False)
+    hashes = broadcast_payments(w3, contract, chain.accounts[0], payers, name)
+
+    stop = threading.Event()
+
+    def miner():
+        while not stop.wait(BLOCK_TIME):
+            chain.mine()
+
+    threading.Thread(target=miner, daemon=True).start()
+    chain.reset_counts()
+    start_block = chain.w3.eth.block_number
+    start = time.perf_counter()
+    wait(w3, hashes)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    blocks = chain.w3.eth.block_number - start_block
+    print(f"{name:<10} payments={PAYMENTS} blocks={blocks} seconds={elapsed:5.2f} "
+          f"http_requests={chain.http_requests} receipt_calls={chain.rpc_counts['eth_getTransactionReceipt']}")
+    chain.stop()
+
+
+def _abi():
+    return load_artifact(allow_stale=True)['abi']
+
+
+if __name__ == "__main__":
+    run("individual", wait_individually)
+    run("tracker", wait_with_tracker)
@@ -0,0 +1,63 @@
+"""Time and RPC traffic to reconcile many payment IDs
+
+Settles PAYMENTS payments on an in-process dev chain, then reconciles them
+together with UNKNOWN payment IDs that were never paid, once with one
+processedPayments().call() per ID and once with PaymentReconciler.
+
+    PAYMENTS=500 UNKNOWN=20000 python benchmarks/bench_reconciliation.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from web3 import Web3
+
+from contract_abi import CONTRACT_ABI
+from local_chain import LocalChain
+from reconcile_payments import PaymentReconciler
+
+PAYMENTS = int(os.getenv("PAYMENTS", "100"))
+UNKNOWN = int(os.getenv("UNKNOWN", "5000"))
+
+
+def settle_payments(chain, contract):
+    invoices = []
+    for n in range(PAYMENTS):
+        payment_id = f"PAY-PAID-{n}"
+        contract.functions.processPayment(chain.accounts[0], payment_id).transact(
+            {'from': chain.accounts[1], 'value': 10 ** 15}
+        )
+        invoices.append({'payment_id': payment_id, 'merchant': chain.accounts[0], 'amount': "0.001"})
+    return invoices
+
+
+def reconcile_individually(contract, invoices):
+    return sum(1 for invoice in invoices if contract.functions.processedPayments(invoice['payment_id']).call())
+
+
+def reconcile_batched(w3, contract, invoices):
+    reconciler = PaymentReconciler(w3, contract)
+    return sum(1 for row in reconciler.reconcile(invoices) if row['status'] != "missing")
+
+
+def measure(chain, name, reconcile):
+    chain.reset_counts()
+    start = time.perf_counter()
+    settled = reconcile()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} ids={PAYMENTS + UNKNOWN} settled={settled} seconds={elapsed:6.2f} "
+          f"http_requests={chain.http_requests}")
+
+
+if __name__ == "__main__":
+    chain = LocalChain().start()
+    w3 = Web3(Web3.HTTPProvider(chain.url, request_kwargs={'timeout': 90}))
+    contract = w3.eth.contract(address=chain.deploy_payment_gateway(), abi=CONTRACT_ABI)
+    invoices = settle_payments(chain, chain.w3.eth.contract(address=contract.address, abi=CONTRACT_ABI))
+    invoices += [{'payment_id': f"PAY-UNPAID-{n}"} for n in range(UNKNOWN)]
+
+    measure(chain, "individual", lambda: reconcile_individually(contract, invoices))
+    measure(chain, "reconciler", lambda: reconcile_batched(w3, contract, invoices))
+    chain.stop()
@@ -0,0 +1,85 @@
+"""Read latency with one degraded node, direct vs through the RPC router
+
+Puts two HTTP proxies in front of an in-process dev chain: a healthy one and a
+degraded one that adds SLOW_DELAY seconds to SLOW_SHARE of its requests. Then
+sends READS eth_call reads directly to the degraded node and through a
+RoutingProvider over both nodes plus one dead endpoint, and reports the
+latency percentiles and the router's view of each endpoint.
+
+    READS=500 SLOW_SHARE=0.2 python benchmarks/bench_rpc_router.py
+"""
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from web3 import Web3
+
+from contract_abi import CONTRACT_ABI
+from local_chain import LocalChain
+from web3_provider import make_web3
+
+READS = int(os.getenv("READS", "300"))
+SLOW_DELAY = float(os.getenv("SLOW_DELAY", "0.5"))
+SLOW_SHARE = float(os.getenv("SLOW_SHARE", "0.2"))
+# Delay every request to the degraded node gets, on top of the occasional SLOW_DELAY
+BASE_DELAY = float(os.getenv("BASE_DELAY", "0.002"))
+
+
+def start_proxy(target_url, slow_share):
+    """Forward JSON-RPC posts to target_url, stalling slow_share of them; return the proxy URL"""
+    session = requests.Session()
+
+    class Proxy(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(BASE_DELAY + (SLOW_DELAY if random.random() < slow_share else 0))
+            response = session.post(target_url, data=body, headers={'Content-Type': 'application/json'})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response.content)))
+            self.end_headers()
+            self.wfile.write(response.content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Proxy)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def measure(name, w3, contract_address, merchant):
+    contract = w3.eth.contract(address=contract_address, abi=CONTRACT_ABI)
+    latencies = []
+    for _ in range(READS):
+        start = time.perf_counter()
+        contract.functions.merchants(merchant).call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    print(f"{name:<8} reads={READS} p50={percentile(50):6.1f}ms p95={percentile(95):6.1f}ms "
+          f"p99={percentile(99):6.1f}ms max={latencies[-1] * 1000:6.1f}ms")
+
+
+if __name__ == "__main__":
+    chain = LocalChain().start()
+    contract_address = chain.deploy_payment_gateway()
+    degraded = start_proxy(chain.url, SLOW_SHARE)
+    healthy = start_proxy(chain.url, 0)
+
+    measure("direct", Web3(Web3.HTTPProvider(degraded)), contract_address, chain.accounts[0])
+    routed = make_web3(",".join([degraded, healthy, "http://127.0.0.1:9"]))
+    measure("router", routed, contract_address, chain.accounts[0])
+    for endpoint in routed.provider.stats():
+        print(f"  {endpoint['url']:<24} latency_ms={endpoint['latency_ms']} errors={endpoint['error_rate']:.0%} "
+              f"ejected={endpoint['ejected']} requests={endpoint['requests']} hedges_won={endpoint['hedges_won']}")
+    chain.stop()
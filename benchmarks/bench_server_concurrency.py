@@ -0,0 +1,82 @@
+"""Approval throughput of the mobile payment server versus concurrent clients
+
+Each POST /approve sleeps for APPROVAL_LATENCY seconds to stand in for
+process_mobile_payment waiting on the chain. The single-threaded HTTPServer
+serialises those waits; PooledHTTPServer should scale until it runs out of
+workers.
+
+    python benchmarks/bench_server_concurrency.py
+"""
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payment_server import PooledHTTPServer
+
+APPROVAL_LATENCY = float(os.getenv("APPROVAL_LATENCY", "0.05"))
+REQUESTS_PER_CLIENT = int(os.getenv("REQUESTS_PER_CLIENT", "10"))
+CLIENT_COUNTS = [1, 2, 4, 8, 16]
+
+
+class SlowApprovalHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(APPROVAL_LATENCY)
+        body = b"ok"
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_clients(port, clients):
+    """Return (approvals per second, failed count) for the given number of clients"""
+    url = f"http://127.0.0.1:{port}/approve"
+    failed = 0
+    lock = threading.Lock()
+
+    def client():
+        nonlocal failed
+        for _ in range(REQUESTS_PER_CLIENT):
+            try:
+                urllib.request.urlopen(url, data=b"payment_data=x").read()
+            except (urllib.error.URLError, ConnectionError):
+                # 503 from the pool, or a reset once the listen backlog overflows
+                with lock:
+                    failed += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client) for _ in range(clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return (clients * REQUESTS_PER_CLIENT - failed) / elapsed, failed
+
+
+def bench(name, make_server):
+    server = make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for clients in CLIENT_COUNTS:
+            throughput, failed = run_clients(server.server_address[1], clients)
+            print(f"{name:<24} clients={clients:<3} approvals/s={throughput:8.1f} failed={failed}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    bench("HTTPServer", lambda: HTTPServer(('127.0.0.1', 0), SlowApprovalHandler))
+    bench("PooledHTTPServer(16)", lambda: PooledHTTPServer(('127.0.0.1', 0), SlowApprovalHandler, max_workers=16, max_queue=16))
+    bench("PooledHTTPServer(4, q=0)", lambda: PooledHTTPServer(('127.0.0.1', 0), SlowApprovalHandler, max_workers=4, max_queue=0))
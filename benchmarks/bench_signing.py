@@ -0,0 +1,63 @@
+"""Time to sign a batch of payment transactions, inline vs on the signing pool
+
+Builds TRANSACTIONS processPayment transactions from PAYERS accounts offline and
+signs them once on the calling thread and once with TransactionSigner.sign_many
+on SIGNING_WORKERS processes (default: one per CPU). The pool is warmed up first
+so process start-up is not counted.
+
+    TRANSACTIONS=5000 python benchmarks/bench_signing.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eth_account import Account
+from web3 import Web3
+
+from contract_abi import CONTRACT_ABI
+from tx_signer import TransactionSigner, sign_chunk
+
+TRANSACTIONS = int(os.getenv("TRANSACTIONS", "2000"))
+PAYERS = int(os.getenv("PAYERS", "20"))
+
+
+def build_transactions():
+    contract = Web3().eth.contract(address="0x" + "11" * 20, abi=CONTRACT_ABI)
+    merchant = Web3.to_checksum_address("0x" + "22" * 20)
+    keys = [Account.create().key for _ in range(PAYERS)]
+    items = []
+    for n in range(TRANSACTIONS):
+        transaction = {
+            'to': contract.address,
+            'data': contract.functions.processPayment(merchant, f"PAY-{n}")._encode_transaction_data(),
+            'value': 10 ** 15,
+            'gas': 100000,
+            'maxFeePerGas': 2 * 10 ** 9,
+            'maxPriorityFeePerGas': 10 ** 9,
+            'nonce': n // PAYERS,
+            'chainId': 1337,
+        }
+        items.append((transaction, keys[n % PAYERS]))
+    return items
+
+
+if __name__ == "__main__":
+    items = build_transactions()
+
+    start = time.perf_counter()
+    inline = sign_chunk([(index, transaction, key) for index, (transaction, key) in enumerate(items)])
+    inline_seconds = time.perf_counter() - start
+
+    signer = TransactionSigner()
+    signer.sign_many(items[:signer.workers * signer.min_batch])
+    start = time.perf_counter()
+    pooled = signer.sign_many(items)
+    pooled_seconds = time.perf_counter() - start
+    signer.close()
+
+    assert pooled == inline, "pool returned different transactions or order"
+    print(f"inline   transactions={TRANSACTIONS} seconds={inline_seconds:6.2f} tx/s={TRANSACTIONS / inline_seconds:8.0f}")
+    print(f"pool     transactions={TRANSACTIONS} seconds={pooled_seconds:6.2f} tx/s={TRANSACTIONS / pooled_seconds:8.0f} "
+          f"workers={signer.workers}")
@@ -0,0 +1,221 @@
+"""In-process dev chain for the benchmarks
+
+Serves an eth-tester chain over JSON-RPC HTTP on 127.0.0.1 so the app code can
+talk to it through a normal ``Web3.HTTPProvider`` with no network and no Ganache.
+Requires ``pip install "web3[tester]"``. Contracts are deployed from their
+Truffle artifacts; an artifact that is missing or was built from an older
+source is compiled with py-solc-x (``pip install py-solc-x``, which downloads
+the solc version of truffle-config.js on first use) and written back.
+
+    chain = LocalChain()
+    chain.start()
+    contract_address = chain.deploy_payment_gateway()
+    ... chain.url, chain.rpc_counts ...
+    chain.stop()
+"""
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_tester import EthereumTester
+from eth_tester.exceptions import TransactionFailed
+from web3 import EthereumTesterProvider, Web3
+
+CONTRACT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "payment-contract")
+BUILD_DIR = os.path.join(CONTRACT_DIR, "build", "contracts")
+ARTIFACT_PATH = os.path.join(BUILD_DIR, "PaymentGateway.json")
+# Compiler version of payment-contract/truffle-config.js
+SOLC_VERSION = os.getenv("SOLC_VERSION", "0.8.21")
+
+
+class ArtifactError(RuntimeError):
+    """A contract artifact is missing or stale and could not be compiled"""
+
+
+def compile_contract(name):
+    """Compile contracts/<name>.sol with py-solc-x and write its Truffle-style artifact"""
+    source_path = os.path.join(CONTRACT_DIR, "contracts", f"{name}.sol")
+    with open(source_path) as f:
+        source = f.read()
+    try:
+        import solcx
+        if SOLC_VERSION not in {str(version) for version in solcx.get_installed_solc_versions()}:
+            solcx.install_solc(SOLC_VERSION)
+        output = solcx.compile_standard({
+            'language': "Solidity",
+            'sources': {f"{name}.sol": {'content': source}},
+            'settings': {'outputSelection': {'*': {'*': ["abi", "evm.bytecode.object", "evm.deployedBytecode.object"]}}},
+        }, solc_version=SOLC_VERSION)
+    except Exception as e:
+        raise ArtifactError(
+            f"{name}.json is missing or older than {name}.sol and could not be compiled "
+            f"({type(e).__name__}: {e}); run truffle compile in payment-contract/ or pip install py-solc-x"
+        ) from None
+    compiled = output['contracts'][f"{name}.sol"][name]
+    artifact = {
+        'contractName': name,
+        'abi': compiled['abi'],
+        'bytecode': "0x" + compiled['evm']['bytecode']['object'],
+        'deployedBytecode': "0x" + compiled['evm']['deployedBytecode']['object'],
+        'source': source,
+        'sourcePath': f"contracts/{name}.sol",
+        'compiler': {'name': "solc", 'version': SOLC_VERSION},
+    }
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(os.path.join(BUILD_DIR, f"{name}.json"), "w") as f:
+        json.dump(artifact, f, indent=2)
+    return artifact
+
+
+def load_artifact(name="PaymentGateway", allow_stale=False):
+    """Return the artifact of a contract built from its current source, compiling it if needed
+
+    With ``allow_stale`` an outdated artifact that cannot be rebuilt is returned
+    with a warning instead of raising ArtifactError.
+    """
+    artifact = None
+    artifact_path = os.path.join(BUILD_DIR, f"{name}.json")
+    if os.path.exists(artifact_path):
+        with open(artifact_path) as f:
+            artifact = json.load(f)
+        with open(os.path.join(CONTRACT_DIR, "contracts", f"{name}.sol")) as f:
+            if artifact.get('source') == f.read():
+                return artifact
+    try:
+        return compile_contract(name)
+    except ArtifactError as e:
+        if artifact is None or not allow_stale:
+            raise
+        print(f"warning: {e}; deploying the outdated build", file=sys.stderr)
+        return artifact
+
+
+def _to_wire(value):
+    """Encode web3-formatted results (ints, bytes, AttributeDicts) as JSON-RPC values"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict) or hasattr(value, "items"):
+        return {k: _to_wire(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(v) for v in value]
+    return value
+
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.chain.http_requests += 1
+        if isinstance(body, list):
+            response = [self.server.chain.handle(request) for request in body]
+        else:
+            response = self.server.chain.handle(body)
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalChain:
+    """eth-tester chain exposed over JSON-RPC HTTP with per-method call counts"""
+
+    def __init__(self, auto_mine=True):
+        self.tester = EthereumTester()
+        if not auto_mine:
+            self.tester.disable_auto_mine_transactions()
+        self.w3 = Web3(EthereumTesterProvider(self.tester))
+        self.rpc_counts = Counter()
+        self.http_requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def accounts(self):
+        return self.w3.eth.accounts
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _RPCHandler)
+        self._server.daemon_threads = True
+        self._server.chain = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.rpc_counts.clear()
+            self.http_requests = 0
+
+    def private_key(self, index):
+        """Private key of one of the funded eth-tester accounts"""
+        return self.tester.backend.account_keys[index].to_hex()
+
+    def set_auto_mine(self, enabled):
+        """Mine every transaction on arrival, or leave them pending until mine()"""
+        with self._lock:
+            if enabled:
+                self.tester.enable_auto_mine_transactions()
+            else:
+                self.tester.disable_auto_mine_transactions()
+
+    def funded_accounts(self, count, value=10 ** 18):
+        """Create and fund ``count`` fresh accounts, return [(address, private_key)]"""
+        accounts = []
+        for _ in range(count):
+            account = self.w3.eth.account.create()
+            with self._lock:
+                self.w3.eth.send_transaction({'from': self.accounts[0], 'to': account.address, 'value': value})
+                if not self.tester.auto_mine_transactions:
+                    self.tester.mine_blocks()
+            accounts.append((account.address, account.key.to_0x_hex()))
+        return accounts
+
+    def mine(self, blocks=1):
+        with self._lock:
+            self.tester.mine_blocks(blocks)
+
+    def deploy_payment_gateway(self, name="PaymentGateway", allow_stale=True):
+        """Deploy PaymentGateway, or the contract ``name``, built from its current source and return the address"""
+        artifact = load_artifact(name, allow_stale=allow_stale)
+        contract = self.w3.eth.contract(abi=artifact['abi'], bytecode=artifact['bytecode'])
+        with self._lock:
+            tx_hash = contract.constructor().transact({'from': self.accounts[0]})
+            if not self.tester.auto_mine_transactions:
+                self.tester.mine_blocks()
+        return self.w3.eth.get_transaction_receipt(tx_hash).contractAddress
+
+    def handle(self, request):
+        method = request.get('method')
+        response = {'jsonrpc': '2.0', 'id': request.get('id')}
+        with self._lock:
+            self.rpc_counts[method] += 1
+            try:
+                result = self.w3.manager.request_blocking(method, request.get('params', []))
+                response['result'] = _to_wire(result)
+            except TransactionFailed as e:
+                response['error'] = {'code': 3, 'message': str(e), 'data': None}
+            except Exception as e:
+                response['error'] = {'code': -32000, 'message': str(e)}
+        return response
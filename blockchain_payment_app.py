@@ -1,194 +1,231 @@
 import streamlit as st
 from web3 import Web3
 from web3.exceptions import ContractLogicError
-import qrcode
 from PIL import Image
 import io
+import html
 import json
 import os
-from dotenv import load_dotenv
 import time
 import socket
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler
 import urllib.parse
 import webbrowser
+import atexit
 
-# Load environment variables
-load_dotenv()
+# Load environment variables before the local modules read their settings
+import env_settings  # noqa: F401
+from payment_server import PooledHTTPServer, PAYMENT_SERVER_WORKERS, PAYMENT_SERVER_QUEUE
+from receipt_tracker import ReceiptTracker, normalize_tx_hash, PENDING, MINED, CONFIRMED, FAILED
+from payment_events import PaymentLogFollower
+from payment_ledger import PaymentLedger
+from merchant_registry import MerchantRegistry
+from merchant_onboarding import MerchantOnboarding
+from payment_batcher import PaymentBatcher, PAYMENT_BATCH_WINDOW
+from nonce_manager import NonceManager, broadcast, is_nonce_error, is_transport_error
+from gas_oracle import GasOracle
+from web3_provider import make_web3
+from rpc_router import RoutingProvider
+from tx_signer import TransactionSigner
+from load_generator import LoadGenerator, create_payers, payer_balance
+from rpc_batch import ReadBatch
+from contract_abi import payment_contract_at, payment_id_key
+from qr_render import QRRenderer
+from payment_tokens import PaymentTokenStore, is_valid_payment_id, new_payment_id
+from payment_status import PaymentStatusHub, AWAITING, SETTLED
+from payment_metrics import PaymentMetrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from bulk_invoices import generate_invoices, parse_invoices, supplied_payment_ids
 
 # Connect to blockchain
 BLOCKCHAIN_URL = os.getenv("BLOCKCHAIN_URL", "http://127.0.0.1:8545")
 SMART_CONTRACT_ADDRESS = os.getenv("SMART_CONTRACT_ADDRESS")
 ADMIN_ADDRESS = os.getenv("ADMIN_ADDRESS", "0x90F8bf6A479f320ead074411a4B0e7944Ea8c9C1")
+# Payment ID encoding of the deployed contract: "string", "bytes32" or "auto"
+PAYMENT_ID_FORMAT = os.getenv("PAYMENT_ID_FORMAT", "auto")
+# Seconds between refreshes of the payment status panel
+STATUS_REFRESH_SECONDS = float(os.getenv("STATUS_REFRESH_SECONDS", "2"))
+# Seconds between refreshes of the payment history table
+HISTORY_REFRESH_SECONDS = float(os.getenv("HISTORY_REFRESH_SECONDS", "10"))
+# Seconds between refreshes of the sidebar chain info; one block number read per interval for all sessions
+CHAIN_INFO_REFRESH_SECONDS = float(os.getenv("CHAIN_INFO_REFRESH_SECONDS", "5"))
 
-w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_URL))
-
-# Smart contract ABI
-CONTRACT_ABI = [
-    {
-        "inputs": [],
-        "stateMutability": "nonpayable",
-        "type": "constructor"
-    },
-    {
-        "anonymous": False,
-        "inputs": [
-            {
-                "indexed": True,
-                "internalType": "address",
-                "name": "merchant",
-                "type": "address"
-            },
-            {
-                "indexed": True,
-                "internalType": "address",
-                "name": "payer",
-                "type": "address"
-            },
-            {
-                "indexed": False,
-                "internalType": "uint256",
-                "name": "amount",
-                "type": "uint256"
-            },
-            {
-                "indexed": True,
-                "internalType": "string",
-                "name": "paymentId",
-                "type": "string"
-            }
-        ],
-        "name": "PaymentProcessed",
-        "type": "event"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "address",
-                "name": "merchant",
-                "type": "address"
-            }
-        ],
-        "name": "addMerchant",
-        "outputs": [],
-        "stateMutability": "nonpayable",
-        "type": "function"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "string",
-                "name": "paymentId",
-                "type": "string"
-            }
-        ],
-        "name": "isPaymentProcessed",
-        "outputs": [
-            {
-                "internalType": "bool",
-                "name": "",
-                "type": "bool"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "address",
-                "name": "",
-                "type": "address"
-            }
-        ],
-        "name": "merchants",
-        "outputs": [
-            {
-                "internalType": "bool",
-                "name": "",
-                "type": "bool"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [],
-        "name": "owner",
-        "outputs": [
-            {
-                "internalType": "address",
-                "name": "",
-                "type": "address"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "address payable",
-                "name": "merchant",
-                "type": "address"
-            },
-            {
-                "internalType": "string",
-                "name": "paymentId",
-                "type": "string"
-            }
-        ],
-        "name": "processPayment",
-        "outputs": [],
-        "stateMutability": "payable",
-        "type": "function"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "string",
-                "name": "",
-                "type": "string"
-            }
-        ],
-        "name": "processedPayments",
-        "outputs": [
-            {
-                "internalType": "bool",
-                "name": "",
-                "type": "bool"
-            }
-        ],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [
-            {
-                "internalType": "address",
-                "name": "merchant",
-                "type": "address"
-            }
-        ],
-        "name": "removeMerchant",
-        "outputs": [],
-        "stateMutability": "nonpayable",
-        "type": "function"
+@st.cache_resource
+def get_metrics():
+    """Process-wide metrics served by the mobile payment server at /metrics"""
+    return PaymentMetrics()
+
+metrics = get_metrics()
+
+@st.cache_resource
+def get_web3():
+    """Process-wide Web3 client so reruns reuse warm node connections"""
+    return make_web3(BLOCKCHAIN_URL, metrics=metrics)
+
+w3 = get_web3()
+
+@st.cache_resource
+def get_payment_contract():
+    """Process-wide contract handle, or None without SMART_CONTRACT_ADDRESS"""
+    if not SMART_CONTRACT_ADDRESS:
+        return None
+    return payment_contract_at(w3, SMART_CONTRACT_ADDRESS, PAYMENT_ID_FORMAT)
+
+try:
+    payment_contract = get_payment_contract()
+except Exception as e:
+    # Nothing is cached on failure; the next rerun detects the contract variant again
+    st.error(f"Could not read the payment contract from the node: {e}")
+    st.stop()
+
+@st.cache_resource
+def get_receipt_tracker():
+    """Shared background tracker that follows broadcast transactions to confirmation"""
+    tracker = ReceiptTracker(w3)
+    tracker.start()
+    return tracker
+
+receipt_tracker = get_receipt_tracker()
+
+@st.cache_resource
+def get_payment_log_follower():
+    """Shared follower of PaymentGateway events, or None without a contract"""
+    if not payment_contract:
+        return None
+    follower = PaymentLogFollower(w3, payment_contract)
+    follower.start()
+    return follower
+
+payment_log_follower = get_payment_log_follower()
+
+@st.cache_resource
+def get_payment_ledger():
+    """Shared SQLite index of PaymentGateway events, or None without a contract"""
+    if not payment_contract:
+        return None
+    ledger = PaymentLedger(w3, payment_contract)
+    ledger.start()
+    return ledger
+
+payment_ledger = get_payment_ledger()
+
+@st.cache_resource
+def get_merchant_registry():
+    """Shared merchant registry cache kept current by contract events"""
+    if not payment_contract:
+        return None
+    registry = MerchantRegistry(payment_contract)
+    registry.attach(payment_log_follower)
+    # Loaded on the ledger's thread; lookups go through cached merchants() calls until then
+    registry.attach_ledger(payment_ledger)
+    return registry
+
+merchant_registry = get_merchant_registry()
+
+@st.cache_resource
+def get_nonce_manager():
+    """Shared per-sender nonce allocator that refills nonce gaps in the background"""
+    manager = NonceManager(w3)
+    manager.start()
+    return manager
+
+nonce_manager = get_nonce_manager()
+
+@st.cache_resource
+def get_gas_oracle():
+    """Shared fee quote cache and gas estimator, fed by confirmed receipts"""
+    oracle = GasOracle(w3)
+    receipt_tracker.subscribe(oracle.note_receipt)
+    return oracle
+
+gas_oracle = get_gas_oracle()
+
+@st.cache_resource
+def get_transaction_signer():
+    """Shared signer; large batches are signed on a pool of worker processes"""
+    return TransactionSigner()
+
+transaction_signer = get_transaction_signer()
+
+@st.cache_resource
+def get_qr_renderer():
+    """Shared LRU cache of rendered payment QR codes"""
+    return QRRenderer()
+
+qr_renderer = get_qr_renderer()
+
+@st.cache_resource
+def get_payment_tokens():
+    """Shared store of short payment link tokens, read by the mobile payment server"""
+    return PaymentTokenStore()
+
+payment_tokens = get_payment_tokens()
+
+def payment_status_snapshot(payment_id):
+    """Status of a payment from the receipt tracker and the log follower
+
+    Only while the follower is behind or failing is the contract asked.
+    """
+    snapshot = {
+        'paymentId': payment_id,
+        'status': AWAITING,
+        'tx_hash': None,
+        'block_number': None,
+        'confirmations': 0,
     }
-]
+    tracked = receipt_tracker.status_for_payment(payment_id)
+    if tracked:
+        snapshot.update(
+            status=tracked['status'],
+            tx_hash=tracked['tx_hash'],
+            block_number=tracked['block_number'],
+            confirmations=tracked['confirmations'],
+        )
+    if snapshot['status'] == CONFIRMED:
+        snapshot['status'] = SETTLED
+    else:
+        try:
+            if check_payment_status(payment_id):
+                snapshot['status'] = SETTLED
+        except Exception:
+            # The node is unreachable too; report what the tracker knows
+            pass
+    return snapshot
 
-# Initialize contract
-payment_contract = None
-if SMART_CONTRACT_ADDRESS:
-    payment_contract = w3.eth.contract(address=Web3.to_checksum_address(SMART_CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+@st.cache_resource
+def get_payment_status_hub():
+    """Shared watcher that pushes payment status to /status/<paymentId> clients"""
+    hub = PaymentStatusHub(payment_status_snapshot)
+    receipt_tracker.subscribe(hub.notify)
+    if payment_log_follower:
+        payment_log_follower.subscribe(hub.notify)
+    hub.start()
+    return hub
 
-# Local server setup
-local_server = None
-local_server_thread = None
+payment_status_hub = get_payment_status_hub()
+
+@st.cache_resource
+def register_metric_sources():
+    """Expose in-flight work and cache counters of the shared resources at /metrics once per process"""
+    metrics.gauge("payment_transactions_in_flight", "Broadcast transactions not yet confirmed, by status",
+                  ("status",), function=receipt_tracker.in_flight)
+    metrics.gauge("payment_status_watchers", "Open /status connections waiting for updates",
+                  function=payment_status_hub.watchers)
+    metrics.watch_cache("qr", qr_renderer)
+    if merchant_registry:
+        metrics.watch_cache("merchant_registry", merchant_registry)
+    receipt_tracker.subscribe(
+        lambda tx_hash, receipt: metrics.observe_confirmation(receipt_tracker.status(tx_hash))
+    )
+
+register_metric_sources()
+
+# Rows per page in the payment history table
+HISTORY_PAGE_SIZE = 20
 
+@st.cache_resource
 def get_local_ip():
-    """Get the local IP address of the machine"""
+    """Get the local IP address of the machine once per process"""
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
@@ -200,31 +237,94 @@ def get_local_ip():
 
 local_ip = get_local_ip()
 
+def metrics_route(path):
+    """Route label of a request path, with tokens and payment IDs left out"""
+    path = urllib.parse.urlparse(path).path
+    if path.startswith('/p/'):
+        return '/p/<token>'
+    if path.startswith('/status/'):
+        return '/status/<paymentId>'
+    if path in ('/', '/approve', '/cancel', '/metrics'):
+        return path
+    return 'other'
+
 class PaymentRequestHandler(BaseHTTPRequestHandler):
+    def handle_one_request(self):
+        """Handle one request and record its handler time"""
+        self.status_code = None
+        start = time.perf_counter()
+        metrics.http_in_flight.inc()
+        try:
+            super().handle_one_request()
+        finally:
+            metrics.http_in_flight.dec()
+            if getattr(self, 'command', None):
+                metrics.http_duration.observe(
+                    time.perf_counter() - start,
+                    method=self.command,
+                    route=metrics_route(self.path),
+                    status=self.status_code or 'detached',
+                )
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
     def do_GET(self):
         """Handle GET requests from mobile devices"""
         parsed_path = urllib.parse.urlparse(self.path)
         query = urllib.parse.parse_qs(parsed_path.query)
         
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        if 'payment_data' in query:
+        if parsed_path.path == '/metrics':
+            self.send_metrics()
+            return
+        
+        if parsed_path.path.startswith('/status/'):
+            self.send_payment_status(urllib.parse.unquote(parsed_path.path[len('/status/'):]), query)
+            return
+        
+        if parsed_path.path.startswith('/p/'):
+            # Short link issued by generate_payment_qr
+            token = parsed_path.path[len('/p/'):]
+            payment_data = payment_tokens.resolve(token)
+            if payment_data is None:
+                self.send_response(404)
+                self.send_header('Content-type', 'text/html')
+                self.end_headers()
+                self.wfile.write("This payment request has expired or does not exist".encode('utf-8'))
+                return
+            hidden_field = ('token', token)
+        elif 'payment_data' in query:
             try:
                 payment_data = json.loads(query['payment_data'][0])
-            except:
+            except ValueError:
                 payment_data = None
+            hidden_field = ('payment_data', query['payment_data'][0])
         else:
             payment_data = {
                 'merchant': query.get('merchant', [''])[0],
-                'amount': float(query.get('amount', [0])[0]),
+                'amount': query.get('amount', ['0'])[0],
                 'paymentId': query.get('paymentId', [''])[0]
             }
+            hidden_field = ('payment_data', json.dumps(payment_data))
+        
+        if not isinstance(payment_data, dict):
+            payment_data = None
+        error = payment_request_error(payment_data) if payment_data and payment_data.get('merchant') else None
+        if error:
+            self.send_response(400)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            self.wfile.write(f"Invalid payment request: {html.escape(error)}".encode('utf-8'))
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
         
-        if payment_data and payment_data['merchant']:
+        if payment_data and payment_data.get('merchant'):
             try:
-                payment_data = json.loads(query['payment_data'][0])
                 response = f"""
                 <html>
                     <head>
@@ -263,12 +363,12 @@ class PaymentRequestHandler(BaseHTTPRequestHandler):
                         <div class="container">
                             <h1>Payment Request</h1>
                             <div class="payment-info">
-                                <p><strong>Merchant:</strong> {payment_data.get('merchant', '')}</p>
-                                <p><strong>Amount:</strong> {payment_data.get('amount', '')} ETH</p>
-                                <p><strong>Payment ID:</strong> {payment_data.get('paymentId', '')}</p>
+                                <p><strong>Merchant:</strong> {html.escape(str(payment_data['merchant']), quote=True)}</p>
+                                <p><strong>Amount:</strong> {html.escape(str(payment_data['amount']), quote=True)} ETH</p>
+                                <p><strong>Payment ID:</strong> {html.escape(str(payment_data['paymentId']), quote=True)}</p>
                             </div>
                             <form action="/approve" method="post">
-                                <input type="hidden" name="payment_data" value='{query['payment_data'][0]}'>
+                                <input type="hidden" name="{hidden_field[0]}" value="{html.escape(hidden_field[1], quote=True)}">
                                 <div class="form-group">
                                     <label for="account_id">Your Wallet Address:</label>
                                     <input type="text" id="account_id" name="account_id" required>
@@ -288,7 +388,7 @@ class PaymentRequestHandler(BaseHTTPRequestHandler):
                 """
                 self.wfile.write(response.encode('utf-8'))
             except Exception as e:
-                self.wfile.write(f"Error processing payment: {str(e)}".encode('utf-8'))
+                self.wfile.write(f"Error processing payment: {html.escape(str(e))}".encode('utf-8'))
         
         elif self.path == '/cancel':
             response = """
@@ -312,33 +412,79 @@ class PaymentRequestHandler(BaseHTTPRequestHandler):
         else:
             self.wfile.write("Invalid request".encode('utf-8'))
 
+    def send_metrics(self):
+        """Answer /metrics in the Prometheus text format"""
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_payment_status(self, payment_id, query):
+        """Answer /status/<paymentId> with JSON, as a long poll (?wait=&since=) or as server-sent events"""
+        stream = 'text/event-stream' in self.headers.get('Accept', '')
+        try:
+            wait = float(query.get('wait', ['0'])[0])
+        except ValueError:
+            wait = 0
+        since = query.get('since', [None])[0]
+        status = payment_status_hub.status(payment_id)
+        if stream or (wait > 0 and since == status['status']):
+            # The shared status watcher answers from here on; this worker is free again
+            if payment_status_hub.watch(self.connection, payment_id, stream, since=since, wait=wait):
+                self.server.detach(self.connection)
+                return
+            self.send_response(503)
+            self.send_header('Retry-After', '5')
+            self.end_headers()
+            return
+        body = json.dumps(status).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_POST(self):
         """Handle POST requests for payment approval"""
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length).decode('utf-8')
         post_params = urllib.parse.parse_qs(post_data)
+        # Scripted clients such as load_generator.py ask for a JSON answer
+        wants_json = 'application/json' in self.headers.get('Accept', '')
         
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', 'application/json' if wants_json else 'text/html')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
         
         if self.path == '/approve':
             try:
-                payment_data = json.loads(post_params['payment_data'][0])
+                if 'token' in post_params:
+                    payment_data = payment_tokens.resolve(post_params['token'][0])
+                    if payment_data is None:
+                        raise ValueError("this payment request has expired")
+                else:
+                    payment_data = json.loads(post_params['payment_data'][0])
                 account_id = post_params['account_id'][0]
                 secret_key = post_params['secret_key'][0]
                 
                 # Process the payment immediately
                 success, result = process_mobile_payment(payment_data, account_id, secret_key)
                 
+                if wants_json:
+                    self.wfile.write(json.dumps({'success': success, 'result': result}).encode('utf-8'))
+                    return
                 if success:
                     st.session_state.mobile_payment_data = payment_data
-                    st.session_state.last_payment_result = f"Payment successful! TX Hash: {result}"
+                    st.session_state.last_payment_result = f"Payment submitted! TX Hash: {result}"
                     response = f"""
                     <html>
                         <head>
-                            <title>Payment Successful</title>
+                            <title>Payment Submitted</title>
                             <meta name="viewport" content="width=device-width, initial-scale=1.0">
                             <style>
                                 body {{ font-family: Arial, sans-serif; padding: 20px; text-align: center; }}
@@ -347,9 +493,28 @@ class PaymentRequestHandler(BaseHTTPRequestHandler):
                         </head>
                         <body>
                             <div class="success">✓</div>
-                            <h1>Payment Successful</h1>
+                            <h1>Payment Submitted</h1>
                             <p>Transaction hash: {result}</p>
+                            <p id="payment-status" data-payment-id="{html.escape(str(payment_data['paymentId']), quote=True)}">Your payment has been broadcast and will be confirmed shortly.</p>
                             <p>You can close this window now.</p>
+                            <script>
+                                // The payment ID is read from an escaped attribute, never spliced into the script
+                                var paymentId = document.getElementById('payment-status').dataset.paymentId;
+                                var source = new EventSource('/status/' + encodeURIComponent(paymentId));
+                                source.addEventListener('status', function (e) {{
+                                    var status = JSON.parse(e.data);
+                                    var text = document.getElementById('payment-status');
+                                    if (status.status === 'settled') {{
+                                        text.textContent = 'Payment confirmed' + (status.block_number ? ' in block ' + status.block_number : '') + '.';
+                                        source.close();
+                                    }} else if (status.status === 'mined') {{
+                                        text.textContent = 'Payment mined in block ' + status.block_number + ', waiting for confirmations...';
+                                    }} else if (status.status === 'failed') {{
+                                        text.textContent = 'The payment transaction failed.';
+                                        source.close();
+                                    }}
+                                }});
+                            </script>
                         </body>
                     </html>
                     """
@@ -367,119 +532,285 @@ class PaymentRequestHandler(BaseHTTPRequestHandler):
                         <body>
                             <div class="error">✗</div>
                             <h1>Payment Failed</h1>
-                            <p>{result}</p>
+                            <p>{html.escape(str(result))}</p>
                         </body>
                     </html>
                     """
                 self.wfile.write(response.encode('utf-8'))
             except Exception as e:
-                self.wfile.write(f"Error processing payment: {str(e)}".encode('utf-8'))
+                if wants_json:
+                    self.wfile.write(json.dumps({'success': False, 'result': f"Error processing payment: {str(e)}"}).encode('utf-8'))
+                    return
+                self.wfile.write(f"Error processing payment: {html.escape(str(e))}".encode('utf-8'))
 
-def start_local_server():
-    """Start a local HTTP server to handle mobile payment requests"""
-    global local_server
+@st.cache_resource
+def get_local_server():
+    """Start the local HTTP server for mobile payment requests once per process"""
     server_address = ('', 8000)
-    local_server = HTTPServer(server_address, PaymentRequestHandler)
-    local_server.serve_forever()
-
-def start_server_in_thread():
-    """Start the local server in a separate thread"""
-    global local_server_thread
-    local_server_thread = threading.Thread(target=start_local_server)
-    local_server_thread.daemon = True
-    local_server_thread.start()
+    server = PooledHTTPServer(
+        server_address,
+        PaymentRequestHandler,
+        max_workers=PAYMENT_SERVER_WORKERS,
+        max_queue=PAYMENT_SERVER_QUEUE,
+    )
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return server
 
 def generate_payment_qr(merchant_address, amount, payment_id):
     """Generate a QR code with payment information"""
-    payment_data = {
-        "merchant": merchant_address,
-        "amount": amount,
-        "paymentId": payment_id,
-        "contract": SMART_CONTRACT_ADDRESS
-    }
-    
-    # Create a clean URL without complex encoding
-    base_url = f"http://{local_ip}:8000"
-    query_string = f"merchant={merchant_address}&amount={amount}&paymentId={payment_id}"
-    payment_url = f" http://{local_ip}:8000/?payment_data={json.dumps({'merchant': merchant_address, 'amount': payment_amount, 'paymentId': payment_id})}"
-    
-    # Generate QR code with the clean URL
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(payment_url)
-    qr.make(fit=True)
+    # The QR code carries a short token that the local server resolves to the request
+    token = payment_tokens.issue(merchant_address, amount, payment_id)
+    payment_url = f"http://{local_ip}:8000/p/{token}"
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
+    # Reprinting the same request is served from the render cache
+    qr_image = qr_renderer.render(payment_url)
     
     # Store the clean URL in session state for display
     st.session_state.payment_url = payment_url
     
-    return img_bytes.getvalue()
+    return qr_image
+
 def check_payment_status(payment_id):
     """Check if a payment has been processed"""
     if payment_contract:
-        return payment_contract.functions.processedPayments(payment_id).call()
+        if payment_log_follower and payment_log_follower.synced:
+            # Answered from the PaymentProcessed logs seen so far, no RPC needed
+            return payment_log_follower.is_settled(payment_id)
+        return payment_contract.functions.processedPayments(payment_id_key(payment_contract, payment_id)).call()
     return False
 
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def payment_status_panel(payment_id):
+    """Payment status that refreshes itself until the payment completes"""
+    if check_payment_status(payment_id):
+        st.success("✅ Payment completed")
+    else:
+        st.warning("⏳ Awaiting payment...")
+        tracked = receipt_tracker.status_for_payment(payment_id)
+        if tracked:
+            show_transaction_status(tracked)
+
+@st.cache_resource
+def get_chain_head():
+    """Latest chain head read by any session, as (block number, monotonic time read)"""
+    return {'value': None}
+
+def note_block_number(block_number):
+    """Share a chain head read elsewhere, e.g. by the page batch, with the sidebar"""
+    get_chain_head()['value'] = (block_number, time.monotonic())
+
+def latest_block_number():
+    """Chain head shared by every session, or None if the node did not answer"""
+    seen = get_chain_head()['value']
+    if seen and time.monotonic() - seen[1] < CHAIN_INFO_REFRESH_SECONDS:
+        return seen[0]
+    try:
+        block_number = w3.eth.block_number
+    except Exception:
+        return None
+    note_block_number(block_number)
+    return block_number
+
+@st.fragment(run_every=CHAIN_INFO_REFRESH_SECONDS)
+def chain_info_panel():
+    """Sidebar chain info that refreshes without rerunning the page"""
+    st.subheader("Blockchain Information")
+    block_number = latest_block_number()
+    if block_number is None:
+        st.error("Not connected to blockchain")
+        return
+    st.write(f"Connected to: {BLOCKCHAIN_URL}")
+    st.write(f"Current block: {block_number}")
+    if isinstance(w3.provider, RoutingProvider):
+        for endpoint in w3.provider.stats():
+            state = "ejected" if endpoint['ejected'] else f"{endpoint['latency_ms']} ms"
+            st.caption(f"{endpoint['url']}: {state}, {endpoint['error_rate']:.0%} errors")
+    gas_stats = gas_oracle.stats()
+    if gas_stats['transactions']:
+        st.write(f"Unused gas reserved: {gas_stats['unused_gas_ratio']:.0%} "
+                 f"over {gas_stats['transactions']} transactions")
+
+@st.fragment(run_every=HISTORY_REFRESH_SECONDS)
+def payment_history_panel(merchant_address):
+    """Merchant totals and payment history from the local ledger, refreshed on their own"""
+    st.subheader("Payment History")
+    payment_count, total_wei = payment_ledger.merchant_totals(merchant_address)
+    col1, col2 = st.columns(2)
+    col1.metric("Payments Received", payment_count)
+    col2.metric("Total Received (ETH)", str(Web3.from_wei(total_wei, 'ether')))
+    
+    pages = max(1, -(-payment_count // HISTORY_PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
+    history = payment_ledger.payment_history(
+        merchant=merchant_address,
+        limit=HISTORY_PAGE_SIZE,
+        offset=(page - 1) * HISTORY_PAGE_SIZE,
+    )
+    if history:
+        st.dataframe(history)
+    else:
+        st.info("No payments indexed for this merchant yet.")
+
 def is_registered_merchant(address):
     """Check if an address is registered as a merchant"""
-    if payment_contract and Web3.is_address(address):
-        return payment_contract.functions.merchants(Web3.to_checksum_address(address)).call()
+    if merchant_registry and Web3.is_address(address):
+        return merchant_registry.is_registered(address)
     return False
 
+@st.cache_resource
+def get_chain_id():
+    """Chain ID of the node, read once instead of on every build_transaction"""
+    return w3.eth.chain_id
+
+def send_contract_transaction(contract_function, sender_address, private_key, value=0):
+    """Build, sign and broadcast a contract call with a locally allocated nonce"""
+    for attempt in range(2):
+        try:
+            with nonce_manager.reserve(sender_address) as nonce:
+                txn_params = {'from': sender_address, 'value': value, 'nonce': nonce, 'chainId': get_chain_id()}
+                txn_params.update(gas_oracle.fee_fields())
+                txn_params['gas'] = gas_oracle.gas_limit(contract_function, txn_params)
+                txn = contract_function.build_transaction(txn_params)
+                txn_hash = broadcast(w3, transaction_signer.sign(txn, private_key))
+            gas_oracle.note_sent(normalize_tx_hash(txn_hash), txn)
+            return txn_hash
+        except Exception as e:
+            # The sender was used elsewhere; the nonce manager has resynced, try once more
+            if attempt or not is_nonce_error(e):
+                raise
+
+def send_contract_transactions(contract_functions, sender_address, private_key, values=None):
+    """Build, sign in parallel and broadcast several calls of one sender in nonce order
+
+    Returns (tx_hashes, error): the hashes broadcast before the first failure, and
+    that failure or None. Nonces of calls that were never broadcast are given back.
+    """
+    values = values or [0] * len(contract_functions)
+    nonces = []
+    txns = []
+    try:
+        fee_fields = gas_oracle.fee_fields()
+        for contract_function, value in zip(contract_functions, values):
+            nonces.append(nonce_manager.allocate(sender_address))
+            txn_params = {'from': sender_address, 'value': value, 'nonce': nonces[-1], 'chainId': get_chain_id()}
+            txn_params.update(fee_fields)
+            txn_params['gas'] = gas_oracle.gas_limit(contract_function, txn_params)
+            txns.append(contract_function.build_transaction(txn_params))
+        raw_txns = transaction_signer.sign_many([(txn, private_key) for txn in txns])
+    except Exception as e:
+        for nonce in nonces:
+            nonce_manager.release(sender_address, nonce)
+        return [], e
+    
+    txn_hashes = []
+    for index, (txn, raw_txn) in enumerate(zip(txns, raw_txns)):
+        try:
+            txn_hash = broadcast(w3, raw_txn)
+        except Exception as e:
+            if is_nonce_error(e):
+                nonce_manager.resync(sender_address)
+            else:
+                # A transaction lost in transport may still have reached the node; keep its nonce
+                unsent = nonces[index + 1:] if is_transport_error(e) else nonces[index:]
+                for nonce in unsent:
+                    nonce_manager.release(sender_address, nonce)
+            return txn_hashes, e
+        gas_oracle.note_sent(normalize_tx_hash(txn_hash), txn)
+        txn_hashes.append(txn_hash)
+    return txn_hashes, None
+
+def submit_payment(merchant_address, payment_id, amount_wei, sender_address, private_key):
+    """Sign and broadcast a processPayment transaction without waiting for it to be mined"""
+    txn_hash = send_contract_transaction(
+        payment_contract.functions.processPayment(merchant_address, payment_id_key(payment_contract, payment_id)),
+        sender_address,
+        private_key,
+        value=amount_wei,
+    )
+    
+    # The receipt tracker follows it to confirmation in the background
+    receipt_tracker.track(txn_hash, payment_id)
+    return normalize_tx_hash(txn_hash)
+
+@st.cache_resource
+def get_payment_batcher():
+    """Shared batcher that settles queued payments of one payer in a single transaction"""
+    if not payment_contract:
+        return None
+    batcher = PaymentBatcher(w3, payment_contract, send_contract_transaction,
+                             send_transactions=send_contract_transactions)
+    batcher.subscribe(lambda txn_hash, payment_ids: receipt_tracker.track(txn_hash, payment_ids=payment_ids))
+    metrics.gauge("payment_batcher_queued", "Payments queued for the next batch transaction",
+                  function=batcher.queued)
+    batcher.start()
+    return batcher
+
+payment_batcher = get_payment_batcher()
+
+def show_transaction_status(entry):
+    """Render a receipt tracker status entry"""
+    if entry['status'] == CONFIRMED:
+        st.success(f"✅ Transaction confirmed in block {entry['block_number']}")
+    elif entry['status'] == MINED:
+        st.info(f"⛏️ Mined in block {entry['block_number']} "
+                f"({entry['confirmations']}/{receipt_tracker.confirmations} confirmations)")
+    elif entry['status'] == PENDING:
+        st.info("⏳ Transaction broadcast, waiting to be mined...")
+    else:
+        st.error("Transaction failed")
+
 def process_mobile_payment(payment_data, payer_address, payer_private_key):
-    """Process payment from mobile device"""
+    """Submit payment from mobile device and return the tx hash once broadcast"""
+    start = time.perf_counter()
+    success, result = submit_mobile_payment(payment_data, payer_address, payer_private_key)
+    metrics.broadcast_duration.observe(time.perf_counter() - start, outcome="broadcast" if success else "rejected")
+    return success, result
+
+def payment_request_error(payment_data):
+    """Return why a payment request cannot be shown or paid, or None if it is well formed"""
+    if not Web3.is_address(str(payment_data.get('merchant', ''))):
+        return "invalid merchant address"
+    try:
+        amount = float(payment_data.get('amount'))
+    except (TypeError, ValueError):
+        return "invalid amount"
+    if not 0 < amount < float('inf'):
+        return "amount must be greater than 0"
+    if not is_valid_payment_id(payment_data.get('paymentId')):
+        return "invalid payment ID"
+    return None
+
+def submit_mobile_payment(payment_data, payer_address, payer_private_key):
+    """Validate a mobile payment and broadcast it; returns (success, tx hash or error message)"""
     try:
         if not payment_contract:
             return False, "Smart contract not configured"
         
         if not Web3.is_address(payer_address):
             return False, "Invalid payer address"
+        
+        error = payment_request_error(payment_data)
+        if error:
+            return False, f"Invalid payment request: {error}"
             
         merchant_address = Web3.to_checksum_address(payment_data['merchant'])
         payment_id = payment_data['paymentId']
         amount = float(payment_data['amount'])
         
         # Check for existing payment
-        is_processed = payment_contract.functions.processedPayments(payment_id).call()
+        is_processed = payment_contract.functions.processedPayments(payment_id_key(payment_contract, payment_id)).call()
         if is_processed:
             return False, "This payment ID has already been processed"
             
         # Convert ETH amount to Wei
         amount_wei = w3.to_wei(amount, 'ether')
         
-        # Get nonce for sender account
         sender_address = Web3.to_checksum_address(payer_address)
-        nonce = w3.eth.get_transaction_count(sender_address)
-        
-        # Prepare the transaction
-        txn = payment_contract.functions.processPayment(
-            merchant_address,
-            payment_id
-        ).build_transaction({
-            'from': sender_address,
-            'value': amount_wei,
-            'gas': 200000,
-            'gasPrice': w3.eth.gas_price,
-            'nonce': nonce,
-        })
+        txn_hash = submit_payment(merchant_address, payment_id, amount_wei, sender_address, payer_private_key)
         
-        # Sign the transaction
-        signed_txn = w3.eth.account.sign_transaction(txn, private_key=payer_private_key)
-        
-        # Send the transaction
-        txn_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        
-        # Wait for transaction receipt
-        txn_receipt = w3.eth.wait_for_transaction_receipt(txn_hash)
-        
-        return txn_receipt.status == 1, txn_hash.hex()
+        return True, txn_hash
     except ContractLogicError as e:
         return False, f"Contract error: {str(e)}"
     except ValueError as e:
@@ -491,12 +822,49 @@ def process_mobile_payment(payment_data, payer_address, payer_private_key):
 st.title("Blockchain Payment Gateway")
 
 # Start local server for mobile payments
-if 'server_started' not in st.session_state:
-    try:
-        start_server_in_thread()
-        st.session_state.server_started = True
-    except Exception as e:
-        st.warning(f"Could not start local server: {str(e)}")
+local_server = None
+try:
+    local_server = get_local_server()
+except Exception as e:
+    st.warning(f"Could not start local server: {str(e)}")
+
+# Clean up when app is closed
+def cleanup():
+    if local_server:
+        local_server.shutdown()
+        local_server.server_close()
+    receipt_tracker.stop()
+    payment_status_hub.stop()
+    if payment_log_follower:
+        payment_log_follower.stop()
+    if payment_ledger:
+        payment_ledger.stop()
+    if payment_batcher:
+        payment_batcher.stop()
+    nonce_manager.stop()
+    transaction_signer.close()
+
+def reload_resources():
+    """Stop the server and workers and drop the cached resources
+
+    The next rerun reconnects to the node and rebuilds the contract, caches and
+    background workers, e.g. after the node or contract was redeployed. The
+    payment token store is kept so QR codes already shown keep resolving.
+    """
+    cleanup()
+    for resource in (get_metrics, get_web3, get_payment_contract, get_receipt_tracker,
+                     get_payment_log_follower, get_payment_ledger, get_merchant_registry,
+                     get_nonce_manager, get_gas_oracle, get_transaction_signer, get_qr_renderer,
+                     get_payment_status_hub, register_metric_sources, get_local_ip, get_local_server,
+                     get_chain_head, get_chain_id, get_payment_batcher, register_cleanup):
+        resource.clear()
+
+@st.cache_resource
+def register_cleanup():
+    """Register cleanup() for the resources of this process once, not on every rerun"""
+    atexit.register(cleanup)
+
+register_cleanup()
 
 # App mode selection
 app_mode = st.sidebar.selectbox(
@@ -504,8 +872,23 @@ app_mode = st.sidebar.selectbox(
     ["Merchant Dashboard", "Payment Simulator", "Merchant Registration", "Mobile Payment"]
 )
 
+if st.sidebar.button("Reload connections"):
+    reload_resources()
+    st.rerun()
+
+# Every node read this render needs goes out in one JSON-RPC batch
+page_reads = ReadBatch(w3)
+chain_head = page_reads.block_number()
+owner_read = None
+if app_mode == "Merchant Registration" and payment_contract:
+    owner_read = page_reads.call(payment_contract.functions.owner())
+is_connected = page_reads.execute() and chain_head.error is None
+if is_connected:
+    # The sidebar shows this head instead of asking the node again
+    note_block_number(chain_head.value)
+
 # Check blockchain connection
-if w3.is_connected():
+if is_connected:
     st.sidebar.success("✅ Connected to blockchain network")
 else:
     st.sidebar.error("❌ Not connected to blockchain network. Please check your connection settings.")
@@ -541,28 +924,57 @@ if app_mode == "Merchant Dashboard":
         payment_description = st.text_input("Payment Description", "Product or service payment")
     
     with col2:
-        payment_id = st.text_input("Payment ID", f"PAY-{int(time.time())}")
+        if 'next_payment_id' not in st.session_state:
+            st.session_state.next_payment_id = new_payment_id()
+        payment_id = st.text_input("Payment ID", st.session_state.next_payment_id)
         generate_button = st.button("Generate Payment QR")
     
     # Generate QR code when button is clicked
     if generate_button:
         if not is_merchant:
             st.error("Cannot generate QR code - merchant not registered.")
+        elif not is_valid_payment_id(payment_id):
+            st.error("Payment IDs may only use letters, digits, '-' and '_', up to 64 characters.")
         else:
             qr_code = generate_payment_qr(merchant_address, payment_amount, payment_id)
+            if payment_ledger:
+                payment_ledger.remember_payment_id(payment_id)
             
             # Save QR code to session state
             st.session_state.qr_code = qr_code
             st.session_state.payment_id = payment_id
             st.session_state.payment_amount = payment_amount
             st.session_state.merchant_address = merchant_address
+            del st.session_state.next_payment_id
             
             # Display connection instructions for mobile
             st.info(f"To pay from your mobile device on the same WiFi network:")
             st.write(f"1. Connect to the same WiFi network as this computer")
             st.write(f"2. Open your camera or QR code scanner app")
             st.write(f"3. Scan the QR code below")
-            st.write(f"Or visit: http://{local_ip}:8000/?payment_data={json.dumps({'merchant': merchant_address, 'amount': payment_amount, 'paymentId': payment_id})}")
+            st.write(f"Or visit: {st.session_state.payment_url}")
+    
+    # Many payment requests at once, e.g. printed invoices for an event
+    with st.expander("Bulk Invoices"):
+        invoice_file = st.file_uploader("Invoice file (CSV or JSONL with merchant and amount)", type=["csv", "jsonl"])
+        if invoice_file and st.button("Generate Invoice QR Codes"):
+            invoice_zip = io.BytesIO()
+            invoice_lines = io.TextIOWrapper(invoice_file, encoding='utf-8')
+            jsonl = invoice_file.name.endswith(".jsonl")
+            with st.spinner("Rendering invoices..."):
+                # A first pass collects the supplied payment IDs so generated ones never clash
+                reserved_ids = supplied_payment_ids(parse_invoices(invoice_lines, jsonl=jsonl))
+                invoice_lines.seek(0)
+                summary = generate_invoices(
+                    parse_invoices(invoice_lines, jsonl=jsonl),
+                    invoice_zip,
+                    base_url=f"http://{local_ip}:8000",
+                    reserved_ids=reserved_ids,
+                )
+            st.write(f"Rendered {summary['rendered']} invoices in {summary['seconds']:.1f}s")
+            if summary['failed']:
+                st.warning(f"{summary['failed']} invoices were rejected, see manifest.csv")
+            st.download_button("Download invoices.zip", invoice_zip.getvalue(), "invoices.zip", "application/zip")
     
     # Display QR code and payment information if available
     if 'qr_code' in st.session_state:
@@ -580,17 +992,11 @@ if app_mode == "Merchant Dashboard":
             st.write(f"**Payment ID:** {st.session_state.payment_id}")
             
             # Payment status
-            status = check_payment_status(st.session_state.payment_id)
-            if status:
-                st.success("✅ Payment completed")
-            else:
-                st.warning("⏳ Awaiting payment...")
-                if st.button("Check Payment Status"):
-                    status = check_payment_status(st.session_state.payment_id)
-                    if status:
-                        st.success("✅ Payment completed")
-                    else:
-                        st.warning("⏳ Still awaiting payment...")
+            payment_status_panel(st.session_state.payment_id)
+    
+    # Payment history served from the local ledger index
+    if payment_ledger and is_merchant:
+        payment_history_panel(merchant_address)
 
 elif app_mode == "Payment Simulator":
     st.header("Payment Simulator")
@@ -614,12 +1020,17 @@ elif app_mode == "Payment Simulator":
     st.subheader("Payer Information")
     payer_address = st.text_input("Your Wallet Address")
     payer_private_key = st.text_input("Your Private Key (for demo only)", type="password")
+    batch_payment = st.checkbox(
+        "Settle together with other payments from this wallet",
+        help=f"Queued payments are sent in one transaction of up to {payment_batcher.max_batch if payment_batcher else 0} "
+             f"payments, at most {PAYMENT_BATCH_WINDOW:g}s after the first one was queued",
+    )
     
     # Process payment button
     if st.button("Process Payment"):
         if not payment_contract:
             st.error("Smart contract not configured")
-        elif not w3.is_connected():
+        elif not is_connected:
             st.error("Not connected to blockchain. Please check your connection.")
         elif not is_merchant:
             st.error("Cannot process payment - merchant not registered.")
@@ -636,7 +1047,7 @@ elif app_mode == "Payment Simulator":
                 merchant_address = Web3.to_checksum_address(sim_merchant)
                 
                 # Check for existing payment
-                is_processed = payment_contract.functions.processedPayments(sim_payment_id).call()
+                is_processed = payment_contract.functions.processedPayments(payment_id_key(payment_contract, sim_payment_id)).call()
                 if is_processed:
                     st.error("This payment ID has already been processed")
                     st.stop()
@@ -645,37 +1056,93 @@ elif app_mode == "Payment Simulator":
                 amount_wei = w3.to_wei(sim_amount, 'ether')
                 
                 # Build the transaction
-                if payer_private_key:
+                if payer_private_key and batch_payment:
                     sender_address = Web3.to_checksum_address(payer_address)
-                    nonce = w3.eth.get_transaction_count(sender_address)
-                    
-                    txn = payment_contract.functions.processPayment(
-                        merchant_address,
-                        sim_payment_id
-                    ).build_transaction({
-                        'from': sender_address,
-                        'value': amount_wei,
-                        'gas': 200000,
-                        'gasPrice': w3.eth.gas_price,
-                        'nonce': nonce,
-                    })
-                    
-                    signed_txn = w3.eth.account.sign_transaction(txn, private_key=payer_private_key)
-                    txn_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-                    
-                    with st.spinner('Processing transaction...'):
-                        txn_receipt = w3.eth.wait_for_transaction_receipt(txn_hash)
+                    st.session_state.sim_batch_payment = payment_batcher.submit(
+                        merchant_address, sim_payment_id, amount_wei, sender_address, payer_private_key
+                    )
+                    st.session_state.pop('sim_tx_hash', None)
+                    st.success(f"Payment of {sim_amount} ETH to {merchant_address} queued for batch settlement!")
+                elif payer_private_key:
+                    sender_address = Web3.to_checksum_address(payer_address)
+                    txn_hash = submit_payment(merchant_address, sim_payment_id, amount_wei, sender_address, payer_private_key)
                     
-                    if txn_receipt.status == 1:
-                        st.success(f"Payment of {sim_amount} ETH to {merchant_address} completed!")
-                        st.write(f"Transaction hash: {txn_hash.hex()}")
-                        st.balloons()
-                    else:
-                        st.error("Transaction failed")
+                    st.session_state.pop('sim_batch_payment', None)
+                    st.session_state.sim_tx_hash = txn_hash
+                    st.success(f"Payment of {sim_amount} ETH to {merchant_address} submitted!")
+                    st.balloons()
                 else:
                     st.error("Private key is required to sign the transaction")
             except Exception as e:
                 st.error(f"Error processing payment: {str(e)}")
+    
+    # Status of the last submitted payment
+    if 'sim_tx_hash' in st.session_state:
+        st.write(f"Transaction hash: {st.session_state.sim_tx_hash}")
+        tracked = receipt_tracker.status(st.session_state.sim_tx_hash)
+        if tracked:
+            show_transaction_status(tracked)
+        st.button("Refresh Transaction Status")
+    
+    # Status of the last payment queued for batch settlement
+    if 'sim_batch_payment' in st.session_state:
+        batch_payment_future = st.session_state.sim_batch_payment
+        if batch_payment_future.done() and batch_payment_future.exception():
+            st.error(f"Error processing payment: {str(batch_payment_future.exception())}")
+        elif batch_payment_future.done():
+            tracked = receipt_tracker.status(batch_payment_future.result())
+            st.write(f"Transaction hash: {tracked['tx_hash']} "
+                     f"({len(tracked['payment_ids'])} payments)")
+            show_transaction_status(tracked)
+        else:
+            st.info(f"⏳ Queued with {payment_batcher.queued()} payments waiting to be sent")
+            if st.button("Send Queued Payments Now"):
+                payment_batcher.flush()
+                st.rerun()
+        st.button("Refresh Transaction Status", key="refresh_batch_status")
+    
+    # Capacity planning against a local dev chain, through the same path as phone payments
+    with st.expander("Load Test"):
+        st.write("Creates payer accounts funded by the wallet above (or the node's first account) "
+                 "and sends payments to the merchant above through process_mobile_payment.")
+        col1, col2 = st.columns(2)
+        load_payers = col1.number_input("Payer Accounts", min_value=1, max_value=1000, value=10)
+        load_payments = col1.number_input("Payments", min_value=1, max_value=100000, value=100)
+        load_concurrency = col2.number_input("Concurrency", min_value=1, max_value=64, value=4)
+        load_rate = col2.number_input("Arrival Rate (payments/s, 0 = as fast as possible)", min_value=0.0, value=0.0)
+        if st.button("Run Load Test"):
+            if not payment_contract:
+                st.error("Smart contract not configured")
+            elif not is_merchant:
+                st.error("The merchant above must be registered to receive the payments")
+            else:
+                try:
+                    balance_wei = payer_balance(w3, sim_amount, load_payments, load_payers)
+                    with st.spinner("Funding payer accounts..."):
+                        payers = create_payers(w3, load_payers, balance_wei, payer_address or None,
+                                               payer_private_key or None, signer=transaction_signer)
+                    generator = LoadGenerator(
+                        process_mobile_payment, receipt_tracker.status_for_payment, payers,
+                        Web3.to_checksum_address(sim_merchant), sim_amount,
+                        concurrency=load_concurrency, rate=load_rate,
+                    )
+                    load_progress = st.progress(0.0, "Sending payments...")
+                    st.session_state.load_report = generator.run(
+                        load_payments,
+                        progress=lambda done, total: load_progress.progress(done / total, f"{done}/{total} payments finished"),
+                    )
+                except Exception as e:
+                    st.error(f"Load test failed: {str(e)}")
+        
+        if 'load_report' in st.session_state:
+            load_report = st.session_state.load_report
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Confirmed TPS", load_report['confirmed_tps'])
+            col2.metric("Submit p95 (ms)", load_report['submit_latency_ms']['p95'])
+            col3.metric("Confirm p95 (ms)", load_report['confirm_latency_ms']['p95'])
+            if load_report['failures']:
+                st.warning(f"{load_report['failed']} of {load_report['payments']} payments did not confirm")
+            st.json(load_report)
 
 elif app_mode == "Merchant Registration":
     st.header("Merchant Registration")
@@ -688,7 +1155,7 @@ elif app_mode == "Merchant Registration":
     
     # Show the contract owner
     try:
-        contract_owner = payment_contract.functions.owner().call()
+        contract_owner = owner_read.value
         st.write(f"Contract Owner: {contract_owner}")
     except Exception as e:
         st.error(f"Error getting contract owner: {str(e)}")
@@ -728,20 +1195,13 @@ elif app_mode == "Merchant Registration":
                 merchant_to_add = Web3.to_checksum_address(new_merchant)
                 admin_checksum = Web3.to_checksum_address(admin_address)
                 
-                nonce = w3.eth.get_transaction_count(admin_checksum)
-                
-                txn = payment_contract.functions.addMerchant(
-                    merchant_to_add
-                ).build_transaction({
-                    'from': admin_checksum,
-                    'gas': 200000,
-                    'gasPrice': w3.eth.gas_price,
-                    'nonce': nonce,
-                })
-                
-                signed_txn = w3.eth.account.sign_transaction(txn, admin_private_key)
-                txn_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+                txn_hash = send_contract_transaction(
+                    payment_contract.functions.addMerchant(merchant_to_add),
+                    admin_checksum,
+                    admin_private_key,
+                )
                 
+                receipt_tracker.track(txn_hash)
                 with st.spinner('Registering merchant...'):
                     txn_receipt = w3.eth.wait_for_transaction_receipt(txn_hash)
                 
@@ -752,6 +1212,41 @@ elif app_mode == "Merchant Registration":
                     st.error("Transaction failed")
             except Exception as e:
                 st.error(f"Error registering merchant: {str(e)}")
+    
+    # Many merchants at once, e.g. every store of a franchise
+    st.subheader("Bulk Registration")
+    bulk_merchants = st.text_area("Merchant Addresses (one per line)")
+    if st.button("Register All Merchants"):
+        if not admin_private_key:
+            st.error("Admin private key is required")
+        elif not Web3.is_address(admin_address):
+            st.error("Invalid admin address")
+        else:
+            try:
+                onboarding = MerchantOnboarding(w3, payment_contract, send_contract_transaction,
+                                                send_transactions=send_contract_transactions)
+                with st.spinner('Submitting registrations...'):
+                    result = onboarding.onboard(bulk_merchants.splitlines(), admin_address, admin_private_key)
+                for txn_hash in result['tx_hashes']:
+                    receipt_tracker.track(txn_hash)
+                st.session_state.onboarding_tx_hashes = [normalize_tx_hash(h) for h in result['tx_hashes']]
+                
+                st.write(f"{len(result['submitted'])} merchants submitted in {len(result['tx_hashes'])} transactions, "
+                         f"{len(result['registered'])} already registered")
+                if result['invalid']:
+                    st.warning(f"Skipped invalid addresses: {', '.join(result['invalid'])}")
+                if result['error']:
+                    st.error(f"Stopped after {len(result['tx_hashes'])} transactions: {str(result['error'])}")
+            except Exception as e:
+                st.error(f"Error registering merchants: {str(e)}")
+    
+    if st.session_state.get('onboarding_tx_hashes'):
+        statuses = [receipt_tracker.status(h) for h in st.session_state.onboarding_tx_hashes]
+        confirmed = sum(1 for entry in statuses if entry and entry['status'] == CONFIRMED)
+        failed = sum(1 for entry in statuses if entry and entry['status'] == FAILED)
+        st.info(f"Registration transactions: {confirmed} confirmed, {failed} failed, "
+                f"{len(statuses) - confirmed - failed} pending")
+        st.button("Refresh Registration Status")
 
 elif app_mode == "Mobile Payment":
     st.header("Mobile Payment Processing")
@@ -775,25 +1270,14 @@ elif app_mode == "Mobile Payment":
     else:
         st.info("No pending mobile payments. Scan a QR code from a merchant to initiate a payment.")
 
-# Display blockchain info
-st.sidebar.subheader("Blockchain Information")
-if w3.is_connected():
-    st.sidebar.write(f"Connected to: {BLOCKCHAIN_URL}")
-    st.sidebar.write(f"Current block: {w3.eth.block_number}")
-else:
-    st.sidebar.error("Not connected to blockchain")
+# Display blockchain info; fragments write to the sidebar from inside its context
+with st.sidebar:
+    chain_info_panel()
 
 # Display local server info
-if local_ip and 'server_started' in st.session_state:
+if local_ip and local_server:
     st.sidebar.subheader("Mobile Payment Server")
     st.sidebar.write(f"Local IP: {local_ip}")
     st.sidebar.write("Port: 8000")
+    st.sidebar.write(f"Workers: {PAYMENT_SERVER_WORKERS} (queue: {PAYMENT_SERVER_QUEUE})")
     st.sidebar.info("Mobile devices on the same network can connect to this server")
-
-# Clean up when app is closed
-def cleanup():
-    if local_server:
-        local_server.shutdown()
-
-import atexit
-atexit.register(cleanup)
\ No newline at end of file
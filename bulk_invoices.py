@@ -0,0 +1,240 @@
+"""Bulk payment request generation
+
+Reads invoices from a CSV or JSONL file with ``merchant`` and ``amount`` columns
+(``payment_id`` and ``description`` are optional), gives every invoice without
+one a payment ID that collides with no other ID in the file, renders the QR
+codes in parallel across a process pool and streams the images and a
+``manifest.csv`` to a zip file or a directory.
+
+    python bulk_invoices.py invoices.csv invoices.zip --base-url http://192.168.1.10:8000
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import urllib.parse
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from web3 import Web3
+
+from payment_tokens import is_valid_payment_id, new_payment_id
+from qr_render import QR_IMAGE_FORMAT, QRRenderer
+
+# Payment server the printed links point at
+PAYMENT_BASE_URL = os.getenv("PAYMENT_BASE_URL", "http://localhost:8000")
+# Invoices handed to a render process at a time
+INVOICE_CHUNK_SIZE = int(os.getenv("INVOICE_CHUNK_SIZE", "64"))
+# Chunks queued per render process; bounds how much of the input is held in memory
+INVOICE_CHUNKS_PER_WORKER = int(os.getenv("INVOICE_CHUNKS_PER_WORKER", "2"))
+
+MANIFEST_FIELDS = ["payment_id", "merchant", "amount", "description", "url", "file", "error"]
+
+
+def read_invoices(path):
+    """Yield invoice dicts from a .csv or .jsonl file"""
+    with open(path, newline='') as f:
+        yield from parse_invoices(f, jsonl=path.endswith(".jsonl"))
+
+
+def parse_invoices(lines, jsonl=False):
+    """Yield invoice dicts from an open CSV or JSONL text stream"""
+    if jsonl:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(lines)
+
+
+def supplied_payment_ids(invoices):
+    """Return the set of payment IDs the invoices bring themselves"""
+    return {payment_id for payment_id in ((invoice.get('payment_id') or '').strip() for invoice in invoices)
+            if payment_id}
+
+
+def payment_url(base_url, merchant, amount, payment_id):
+    """Return a self-contained payment link the mobile payment server accepts
+
+    Short ``/p/<token>`` links only resolve in the app process that issued
+    them, so printed invoices carry the request itself.
+    """
+    query = urllib.parse.urlencode({'merchant': merchant, 'amount': amount, 'paymentId': payment_id})
+    return f"{base_url.rstrip('/')}/?{query}"
+
+
+def prepare_invoices(invoices, base_url=PAYMENT_BASE_URL, reserved_ids=()):
+    """Validate invoices and assign payment IDs; yields manifest rows
+
+    Generated IDs avoid the IDs of earlier rows and ``reserved_ids``, which
+    should hold the IDs supplied further down the file.
+    """
+    seen = set()
+    for invoice in invoices:
+        row = {
+            'payment_id': (invoice.get('payment_id') or '').strip(),
+            'merchant': (invoice.get('merchant') or '').strip(),
+            'amount': invoice.get('amount'),
+            'description': invoice.get('description') or '',
+            'url': '',
+            'file': '',
+            'error': '',
+        }
+        try:
+            if not Web3.is_address(row['merchant']):
+                raise ValueError("invalid merchant address")
+            row['merchant'] = Web3.to_checksum_address(row['merchant'])
+            row['amount'] = float(row['amount'])
+            if not 0 < row['amount'] < float('inf'):
+                raise ValueError("amount must be greater than 0")
+            if not row['payment_id']:
+                row['payment_id'] = new_payment_id()
+                while row['payment_id'] in seen or row['payment_id'] in reserved_ids:
+                    row['payment_id'] = new_payment_id()
+            elif not is_valid_payment_id(row['payment_id']):
+                raise ValueError("invalid payment ID (1-64 letters, digits, '-' or '_')")
+            elif row['payment_id'] in seen:
+                raise ValueError("duplicate payment ID")
+        except (TypeError, ValueError) as e:
+            row['error'] = str(e)
+        else:
+            seen.add(row['payment_id'])
+            row['url'] = payment_url(base_url, row['merchant'], row['amount'], row['payment_id'])
+        yield row
+
+
+_renderer = None
+
+
+def render_row(row, image_format=QR_IMAGE_FORMAT):
+    """Render the QR code of a manifest row; runs in a pool process"""
+    global _renderer
+    if row['error']:
+        return row, None
+    if _renderer is None:
+        _renderer = QRRenderer()
+    return row, _renderer.encode(row['url'], image_format)
+
+
+def render_rows(rows, image_format=QR_IMAGE_FORMAT):
+    """Render a chunk of manifest rows; runs in a pool process"""
+    return [render_row(row, image_format) for row in rows]
+
+
+def _render_in_order(pool, rows, image_format, window):
+    # Only ``window`` chunks are submitted ahead of the one being written
+    pending = deque()
+    for chunk in iter(lambda: list(itertools.islice(rows, INVOICE_CHUNK_SIZE)), []):
+        pending.append(pool.submit(render_rows, chunk, image_format))
+        if len(pending) >= window:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+class InvoiceWriter:
+    """Writes images and the manifest to a zip file (path or file object) or a directory"""
+
+    def __init__(self, output):
+        self.directory = None
+        self.archive = None
+        if isinstance(output, str) and not output.endswith(".zip"):
+            self.directory = output
+            os.makedirs(output, exist_ok=True)
+        else:
+            # PNGs are already compressed
+            self.archive = zipfile.ZipFile(output, "w", zipfile.ZIP_STORED)
+        self.manifest = io.StringIO()
+        self.manifest_writer = csv.DictWriter(self.manifest, MANIFEST_FIELDS)
+        self.manifest_writer.writeheader()
+
+    def write(self, row, image, image_format):
+        if image is not None:
+            row['file'] = f"{_safe_name(row['payment_id'])}.{image_format}"
+            if isinstance(image, str):
+                image = image.encode('utf-8')
+            if self.archive:
+                self.archive.writestr(row['file'], image)
+            else:
+                with open(os.path.join(self.directory, row['file']), "wb") as f:
+                    f.write(image)
+        self.manifest_writer.writerow(row)
+
+    def close(self):
+        if self.archive:
+            self.archive.writestr("manifest.csv", self.manifest.getvalue())
+            self.archive.close()
+        else:
+            with open(os.path.join(self.directory, "manifest.csv"), "w", newline='') as f:
+                f.write(self.manifest.getvalue())
+
+
+def _safe_name(payment_id):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in payment_id)
+
+
+def generate_invoices(invoices, output, base_url=PAYMENT_BASE_URL,
+                      image_format=QR_IMAGE_FORMAT, workers=None, reserved_ids=None):
+    """Render QR codes for many invoices and return a summary of the run
+
+    ``reserved_ids`` are the payment IDs supplied in the input; when a stream
+    is passed without them, a list is read once up front to collect them.
+    """
+    start = time.perf_counter()
+    if reserved_ids is None:
+        invoices = list(invoices)
+        reserved_ids = supplied_payment_ids(invoices)
+    workers = workers or os.cpu_count() or 1
+    writer = InvoiceWriter(output)
+    rendered = failed = 0
+    try:
+        rows = prepare_invoices(invoices, base_url, reserved_ids)
+        # Spawned, not forked: the Streamlit app runs this too, and a child forked from its threads can start with a lock held
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = _render_in_order(pool, rows, image_format, workers * INVOICE_CHUNKS_PER_WORKER)
+            for row, image in results:
+                writer.write(row, image, image_format)
+                if image is None:
+                    failed += 1
+                else:
+                    rendered += 1
+    finally:
+        writer.close()
+    return {
+        'rendered': rendered,
+        'failed': failed,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate payment QR codes for a file of invoices")
+    parser.add_argument("invoices", help="CSV or JSONL file with merchant and amount per invoice")
+    parser.add_argument("output", help="zip file or directory to write the images and manifest.csv to")
+    parser.add_argument("--base-url", default=PAYMENT_BASE_URL, help="mobile payment server URL")
+    parser.add_argument("--format", default=QR_IMAGE_FORMAT, choices=["png", "svg"])
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    # The file is read twice so that it is never held in memory as a whole
+    summary = generate_invoices(
+        read_invoices(args.invoices),
+        args.output,
+        base_url=args.base_url,
+        image_format=args.format,
+        workers=args.workers,
+        reserved_ids=supplied_payment_ids(read_invoices(args.invoices)),
+    )
+    print(f"rendered {summary['rendered']} invoices in {summary['seconds']:.1f}s, "
+          f"{summary['failed']} rejected (see manifest.csv)")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import copy
+
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+
+# PaymentGateway ABI, kept out of the Streamlit script so reruns do not rebuild it
+CONTRACT_ABI = [
+    {
+        "inputs": [],
+        "stateMutability": "nonpayable",
+        "type": "constructor"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "merchant",
+                "type": "address"
+            },
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "payer",
+                "type": "address"
+            },
+            {
+                "indexed": False,
+                "internalType": "uint256",
+                "name": "amount",
+                "type": "uint256"
+            },
+            {
+                "indexed": True,
+                "internalType": "string",
+                "name": "paymentId",
+                "type": "string"
+            }
+        ],
+        "name": "PaymentProcessed",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "merchant",
+                "type": "address"
+            },
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "addedBy",
+                "type": "address"
+            }
+        ],
+        "name": "MerchantAdded",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "merchant",
+                "type": "address"
+            },
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "removedBy",
+                "type": "address"
+            }
+        ],
+        "name": "MerchantRemoved",
+        "type": "event"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address",
+                "name": "merchant",
+                "type": "address"
+            }
+        ],
+        "name": "addMerchant",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address[]",
+                "name": "newMerchants",
+                "type": "address[]"
+            }
+        ],
+        "name": "addMerchants",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "string",
+                "name": "paymentId",
+                "type": "string"
+            }
+        ],
+        "name": "isPaymentProcessed",
+        "outputs": [
+            {
+                "internalType": "bool",
+                "name": "",
+                "type": "bool"
+            }
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address",
+                "name": "",
+                "type": "address"
+            }
+        ],
+        "name": "merchants",
+        "outputs": [
+            {
+                "internalType": "bool",
+                "name": "",
+                "type": "bool"
+            }
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "owner",
+        "outputs": [
+            {
+                "internalType": "address",
+                "name": "",
+                "type": "address"
+            }
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address payable",
+                "name": "merchant",
+                "type": "address"
+            },
+            {
+                "internalType": "string",
+                "name": "paymentId",
+                "type": "string"
+            }
+        ],
+        "name": "processPayment",
+        "outputs": [],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address payable[]",
+                "name": "merchantList",
+                "type": "address[]"
+            },
+            {
+                "internalType": "string[]",
+                "name": "paymentIds",
+                "type": "string[]"
+            },
+            {
+                "internalType": "uint256[]",
+                "name": "amounts",
+                "type": "uint256[]"
+            }
+        ],
+        "name": "processPayments",
+        "outputs": [],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "string",
+                "name": "",
+                "type": "string"
+            }
+        ],
+        "name": "processedPayments",
+        "outputs": [
+            {
+                "internalType": "bool",
+                "name": "",
+                "type": "bool"
+            }
+        ],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {
+                "internalType": "address",
+                "name": "merchant",
+                "type": "address"
+            }
+        ],
+        "name": "removeMerchant",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    }
+]
+
+
+def supports_function(w3, contract, name):
+    """Return True if the deployed bytecode dispatches the named ABI function
+
+    Newer functions such as ``addMerchants`` are missing from older deployments;
+    their selector then never appears as a PUSH4 operand in the dispatcher.
+    """
+    code = bytes(w3.eth.get_code(contract.address))
+    for abi in contract.abi:
+        if abi.get('type') == 'function' and abi['name'] == name:
+            if b'\x63' + function_abi_to_4byte_selector(abi) in code:
+                return True
+    return False
+
+
+def _bytes32_variant(abi):
+    # Every string in the PaymentGateway ABI is a payment ID
+    variant = copy.deepcopy(abi)
+    for entry in variant:
+        for param in entry.get('inputs', []):
+            if param['type'] in ("string", "string[]"):
+                param['type'] = param['type'].replace("string", "bytes32")
+                param['internalType'] = param['type']
+    return variant
+
+
+# PaymentGatewayBytes32, which keys payments by keccak256 of the payment ID
+CONTRACT_ABI_BYTES32 = _bytes32_variant(CONTRACT_ABI)
+
+
+def payment_contract_at(w3, address, payment_id_format="auto"):
+    """Return the PaymentGateway at an address with the ABI of the deployed variant
+
+    ``payment_id_format`` is "string", "bytes32" or "auto", which checks the
+    deployed bytecode for the bytes32 ``processPayment``. With "auto" the
+    bytecode read raises when the node cannot be reached, rather than guessing
+    a variant that callers would keep for the life of the process.
+    """
+    address = Web3.to_checksum_address(address)
+    bytes32_contract = w3.eth.contract(address=address, abi=CONTRACT_ABI_BYTES32)
+    if payment_id_format == "bytes32":
+        return bytes32_contract
+    if payment_id_format == "auto" and supports_function(w3, bytes32_contract, "processPayment"):
+        return bytes32_contract
+    return w3.eth.contract(address=address, abi=CONTRACT_ABI)
+
+
+def uses_bytes32_payment_ids(contract):
+    """Return True if the contract takes payment IDs as bytes32 hashes"""
+    return any(entry.get('name') == "processPayment" and entry['inputs'][1]['type'] == "bytes32"
+               for entry in contract.abi)
+
+
+def payment_id_key(contract, payment_id):
+    """Return a payment ID in the form the contract's functions take it"""
+    if uses_bytes32_payment_ids(contract):
+        return Web3.keccak(text=payment_id)
+    return payment_id
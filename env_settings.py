@@ -0,0 +1,8 @@
+"""Loads the .env file into the environment on import
+
+Settings are module constants read with ``os.getenv`` when their module is
+imported, so entry points import this module before any other local one.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
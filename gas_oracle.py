@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from rpc_batch import to_int
+
+# Seconds a fee quote is reused before the latest block is read again
+GAS_PRICE_TTL = float(os.getenv("GAS_PRICE_TTL", "10"))
+# Headroom added on top of eth_estimateGas for the gas limit
+GAS_ESTIMATE_MARGIN = float(os.getenv("GAS_ESTIMATE_MARGIN", "0.2"))
+# Tip used when the node does not answer eth_maxPriorityFeePerGas
+DEFAULT_PRIORITY_FEE = int(os.getenv("DEFAULT_PRIORITY_FEE", str(10 ** 9)))
+# Memoized estimates kept, one per function and argument shape
+GAS_ESTIMATE_CACHE_SIZE = int(os.getenv("GAS_ESTIMATE_CACHE_SIZE", "10000"))
+# Broadcast transactions remembered until their receipt; older ones were most likely dropped
+GAS_SENT_MAX = int(os.getenv("GAS_SENT_MAX", "10000"))
+
+
+def call_shape(contract_function):
+    """Key gas estimates by function name and the sizes of dynamic arguments
+
+    Addresses only count by length, so every merchant shares one estimate and
+    an ``addMerchant`` batch of n addresses is estimated once per n. A
+    recipient that costs more than the estimate plus margin runs out of gas,
+    which drops the memoized estimates.
+    """
+    shape = []
+    for arg in contract_function.args:
+        if isinstance(arg, (str, bytes, bytearray, list, tuple)):
+            shape.append(len(arg))
+        else:
+            shape.append(type(arg).__name__)
+    return (contract_function.fn_name, tuple(shape))
+
+
+class GasOracle:
+    """Cached fee quotes and memoized gas estimates for contract calls
+
+    ``fee_fields()`` returns EIP-1559 ``maxFeePerGas``/``maxPriorityFeePerGas``
+    when the latest block has a base fee and a legacy ``gasPrice`` otherwise; the
+    quote is refreshed at most every ``GAS_PRICE_TTL`` seconds. ``gas_limit()``
+    estimates each call shape once and adds ``GAS_ESTIMATE_MARGIN``; a
+    transaction that runs out of gas drops the memoized estimates. Sent
+    transactions and their receipts feed ``stats()``, which reports how much gas
+    and fee was reserved compared to what was actually paid.
+    """
+
+    def __init__(self, w3, ttl=GAS_PRICE_TTL, margin=GAS_ESTIMATE_MARGIN,
+                 max_estimates=GAS_ESTIMATE_CACHE_SIZE, max_sent=GAS_SENT_MAX):
+        self.w3 = w3
+        self.ttl = ttl
+        self.margin = margin
+        self.max_estimates = max_estimates
+        self.max_sent = max_sent
+        self._lock = threading.Lock()
+        self._fees = None
+        self._fees_at = 0
+        self._estimates = OrderedDict()
+        self._sent = OrderedDict()
+        self._stats = {
+            'transactions': 0,
+            'gas_limit': 0,
+            'gas_used': 0,
+            'fee_reserved_wei': 0,
+            'fee_paid_wei': 0,
+        }
+
+    def fee_fields(self):
+        """Return the fee fields for a new transaction"""
+        with self._lock:
+            if self._fees and time.monotonic() - self._fees_at < self.ttl:
+                return dict(self._fees)
+        fees = self._quote()
+        with self._lock:
+            self._fees = fees
+            self._fees_at = time.monotonic()
+        return dict(fees)
+
+    def _quote(self):
+        latest = self.w3.eth.get_block('latest')
+        base_fee = latest.get('baseFeePerGas')
+        if base_fee is None:
+            return {'gasPrice': self.w3.eth.gas_price}
+        try:
+            priority_fee = self.w3.eth.max_priority_fee
+        except Exception:
+            priority_fee = DEFAULT_PRIORITY_FEE
+        # Room for the base fee to double before the transaction is priced out
+        return {
+            'maxFeePerGas': 2 * base_fee + priority_fee,
+            'maxPriorityFeePerGas': priority_fee,
+        }
+
+    def gas_limit(self, contract_function, tx_params):
+        """Return a gas limit for the call, estimating each call shape only once"""
+        # Value transfers cost more than calls without value
+        key = (call_shape(contract_function), bool(tx_params.get('value')))
+        with self._lock:
+            estimate = self._estimates.get(key)
+            if estimate is not None:
+                self._estimates.move_to_end(key)
+        if estimate is None:
+            estimate = contract_function.estimate_gas({
+                k: v for k, v in tx_params.items() if k in ('from', 'value')
+            })
+            with self._lock:
+                self._estimates[key] = estimate
+                while len(self._estimates) > self.max_estimates:
+                    self._estimates.popitem(last=False)
+        return int(estimate * (1 + self.margin))
+
+    def forget_estimates(self):
+        """Drop memoized estimates, e.g. after a contract upgrade"""
+        with self._lock:
+            self._estimates.clear()
+
+    def note_sent(self, tx_hash, txn):
+        """Remember the gas limit and fee cap of a broadcast transaction"""
+        fee_cap = txn.get('maxFeePerGas', txn.get('gasPrice', 0))
+        with self._lock:
+            self._sent[tx_hash] = (txn['gas'], fee_cap)
+            while len(self._sent) > self.max_sent:
+                self._sent.popitem(last=False)
+
+    def note_receipt(self, tx_hash, receipt):
+        """Account a receipt of a transaction passed to ``note_sent()``"""
+        with self._lock:
+            sent = self._sent.pop(tx_hash, None)
+            if not sent or receipt is None:
+                return
+            gas_limit, fee_cap = sent
+            gas_used = to_int(receipt['gasUsed'])
+            if to_int(receipt['status']) != 1 and gas_used >= gas_limit:
+                # Out of gas: a memoized estimate was too low, estimate again from now on
+                self._estimates.clear()
+            price = to_int(receipt.get('effectiveGasPrice') or fee_cap)
+            self._stats['transactions'] += 1
+            self._stats['gas_limit'] += gas_limit
+            self._stats['gas_used'] += gas_used
+            self._stats['fee_reserved_wei'] += gas_limit * fee_cap
+            self._stats['fee_paid_wei'] += gas_used * price
+
+    def stats(self):
+        """Return reserved vs used totals and the ratio of unused gas"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['unused_gas_ratio'] = (
+            1 - stats['gas_used'] / stats['gas_limit'] if stats['gas_limit'] else 0.0
+        )
+        return stats
@@ -0,0 +1,267 @@
+"""Load generator for the mobile payment path
+
+Creates PAYERS funded payer accounts, then fires PAYMENTS payments at a fixed
+arrival rate with at most CONCURRENCY in flight and reports throughput,
+submit and confirm latency percentiles and a breakdown of failures.
+
+Payments are approved through the running app's mobile payment server (the
+same ``POST /approve`` a phone sends, handled by ``process_mobile_payment``), so
+run the app against a local Ganache or other dev chain first. New payers are
+funded from the node's first unlocked account, or from ``--funder-key``.
+
+    python load_generator.py --merchant 0xFFcf8FDEE72ac11b5c542428B35EEF5769C409f0 \\
+        --payers 20 --payments 1000 --concurrency 8 --rate 50 --json load_report.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_account import Account
+from web3 import Web3
+
+import env_settings  # noqa: F401
+from nonce_manager import broadcast
+from payment_tokens import new_payment_id
+from receipt_tracker import CONFIRMED, FAILED, ReceiptTracker
+from tx_signer import TransactionSigner
+from web3_provider import make_web3
+
+# Seconds to wait for the last payments to confirm after the last one was submitted
+LOAD_CONFIRM_TIMEOUT = float(os.getenv("LOAD_CONFIRM_TIMEOUT", "120"))
+# Gas budgeted per payment when funding payers, with room for fee increases
+LOAD_GAS_PER_PAYMENT = int(os.getenv("LOAD_GAS_PER_PAYMENT", "300000"))
+
+
+def percentiles(samples):
+    """Return p50/p95/p99/max of a list of seconds, in milliseconds"""
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    samples = sorted(samples)
+
+    def at(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 1)
+
+    return {'p50': at(50), 'p95': at(95), 'p99': at(99), 'max': round(samples[-1] * 1000, 1)}
+
+
+def failure_reason(message):
+    """Group error messages that only differ in hashes, amounts or IDs"""
+    reason = str(message).split(" (", 1)[0]
+    return reason if len(reason) <= 80 else reason[:77] + "..."
+
+
+def payer_balance(w3, amount, payments, payers):
+    """Return the wei each payer needs for its share of the payments and their gas"""
+    per_payer = -(-payments // payers)
+    return per_payer * (Web3.to_wei(amount, 'ether') + LOAD_GAS_PER_PAYMENT * w3.eth.gas_price)
+
+
+def create_payers(w3, count, balance_wei, funder=None, funder_key=None, signer=None):
+    """Create and fund payer accounts; returns (address, private key hex) pairs
+
+    Funding comes from ``funder`` signed with ``funder_key``, or without a key
+    from the node's first unlocked account through eth_sendTransaction.
+    """
+    payers = [Account.create() for _ in range(count)]
+    if funder_key:
+        funder = Web3.to_checksum_address(funder or Account.from_key(funder_key).address)
+        nonce = w3.eth.get_transaction_count(funder, 'pending')
+        chain_id = w3.eth.chain_id
+        gas_price = w3.eth.gas_price
+        transfers = [({
+            'to': payer.address,
+            'value': balance_wei,
+            'gas': 21000,
+            'gasPrice': gas_price,
+            'nonce': nonce + n,
+            'chainId': chain_id,
+        }, funder_key) for n, payer in enumerate(payers)]
+        raw_transfers = (signer or TransactionSigner()).sign_many(transfers)
+        tx_hashes = [broadcast(w3, raw_transfer) for raw_transfer in raw_transfers]
+    else:
+        funder = funder or w3.eth.accounts[0]
+        tx_hashes = [w3.eth.send_transaction({'from': funder, 'to': payer.address, 'value': balance_wei})
+                     for payer in payers]
+    for tx_hash in tx_hashes:
+        w3.eth.wait_for_transaction_receipt(tx_hash)
+    return [(payer.address, Web3.to_hex(payer.key)) for payer in payers]
+
+
+class LoadGenerator:
+    """Submits payments at a fixed arrival rate and measures them to confirmation
+
+    ``submit(payment_data, payer, private_key)`` is the payment path under test
+    and returns ``(success, tx_hash or error message)`` like
+    ``process_mobile_payment``. ``status(payment_id)`` returns the receipt
+    tracker entry of the payment, or None while nothing is known.
+
+    With a ``rate`` arrivals are open loop: payment ``i`` is due at ``i / rate``
+    seconds, and its submit latency counts from then, so time spent waiting for
+    a free slot shows up in the numbers. With ``rate=0`` the run is closed loop:
+    each of ``concurrency`` workers sends its next payment as soon as the last
+    one returns, and latency counts from that dispatch. Payments go to the
+    payers round robin and each payer has one payment in flight at a time, so
+    its nonces are used in order.
+    """
+
+    def __init__(self, submit, status, payers, merchant, amount, concurrency=4, rate=0,
+                 confirm_timeout=LOAD_CONFIRM_TIMEOUT):
+        self.submit = submit
+        self.status = status
+        self.payers = payers
+        self.merchant = merchant
+        self.amount = amount
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.confirm_timeout = confirm_timeout
+        self._payer_locks = [threading.Lock() for _ in payers]
+
+    def run(self, payments, progress=None):
+        """Send ``payments`` payments, wait for them to confirm and return the report"""
+        results = [None] * payments
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as executor:
+            for index in range(payments):
+                due = start + (index / self.rate if self.rate else 0)
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._send, index, due if self.rate else None, results)
+        submitted_at = time.time()
+        self._wait_for_confirmations(results, progress)
+        return self.report(results, start, submitted_at)
+
+    def _send(self, index, due, results):
+        payer, private_key = self.payers[index % len(self.payers)]
+        payment_data = {'merchant': self.merchant, 'amount': self.amount, 'paymentId': new_payment_id("LOAD")}
+        with self._payer_locks[index % len(self.payers)]:
+            if due is None:
+                # Closed loop: queued payments are not late, they have not been sent yet
+                due = time.time()
+            try:
+                success, result = self.submit(payment_data, payer, private_key)
+            except Exception as e:
+                success, result = False, f"{type(e).__name__}: {e}"
+        results[index] = {
+            'payment_id': payment_data['paymentId'],
+            'due': due,
+            'submitted': time.time(),
+            'success': success,
+            'result': result,
+            'status': None,
+            'completed_at': None,
+        }
+
+    def _wait_for_confirmations(self, results, progress):
+        deadline = time.time() + self.confirm_timeout
+        waiting = [result for result in results if result and result['success']]
+        while waiting and time.time() < deadline:
+            still_waiting = []
+            for result in waiting:
+                entry = self.status(result['payment_id'])
+                if entry and entry['status'] in (CONFIRMED, FAILED):
+                    result['status'] = entry['status']
+                    result['completed_at'] = entry['completed_at']
+                else:
+                    still_waiting.append(result)
+            waiting = still_waiting
+            if progress:
+                progress(len(results) - len(waiting), len(results))
+            if waiting:
+                time.sleep(0.2)
+
+    def report(self, results, start, submitted_at):
+        """Summarize per-payment results"""
+        results = [result for result in results if result]
+        accepted = [result for result in results if result['success']]
+        confirmed = [result for result in accepted if result['status'] == CONFIRMED]
+        failures = Counter(failure_reason(result['result']) for result in results if not result['success'])
+        failures.update("transaction reverted" for result in accepted if result['status'] == FAILED)
+        failures.update("not confirmed in time" for result in accepted if result['status'] is None)
+        finished = max([result['completed_at'] for result in confirmed] + [submitted_at])
+        return {
+            'payments': len(results),
+            'payers': len(self.payers),
+            'concurrency': self.concurrency,
+            'rate': self.rate,
+            'submitted': len(accepted),
+            'confirmed': len(confirmed),
+            'failed': len(results) - len(confirmed),
+            'failures': dict(failures.most_common()),
+            'submit_seconds': round(submitted_at - start, 2),
+            'total_seconds': round(finished - start, 2),
+            'submit_tps': round(len(accepted) / max(submitted_at - start, 1e-9), 1),
+            'confirmed_tps': round(len(confirmed) / max(finished - start, 1e-9), 1),
+            'submit_latency_ms': percentiles([result['submitted'] - result['due'] for result in accepted]),
+            'confirm_latency_ms': percentiles([result['completed_at'] - result['due'] for result in confirmed]),
+        }
+
+
+def approve_over_http(server_url):
+    """Return a submit function that approves payments through the mobile payment server"""
+    def submit(payment_data, payer, private_key):
+        body = urllib.parse.urlencode({
+            'payment_data': json.dumps(payment_data),
+            'account_id': payer,
+            'secret_key': private_key,
+        }).encode('utf-8')
+        request = urllib.request.Request(f"{server_url}/approve", data=body,
+                                         headers={'Accept': 'application/json'})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            answer = json.loads(response.read())
+        return answer['success'], answer['result']
+    return submit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fire payments at the mobile payment server and report TPS and latency")
+    parser.add_argument("--merchant", required=True, help="registered merchant receiving the payments")
+    parser.add_argument("--server", default="http://127.0.0.1:8000", help="mobile payment server of the running app")
+    parser.add_argument("--url", default=os.getenv("BLOCKCHAIN_URL", "http://127.0.0.1:8545"))
+    parser.add_argument("--payers", type=int, default=10)
+    parser.add_argument("--payments", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="payments per second (0: as fast as possible)")
+    parser.add_argument("--amount", type=float, default=0.001, help="ETH per payment")
+    parser.add_argument("--funder", help="account that funds the payers (default: first node account)")
+    parser.add_argument("--funder-key", default=os.getenv("LOAD_FUNDER_KEY"), help="private key of --funder")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    w3 = make_web3(args.url)
+    balance_wei = payer_balance(w3, args.amount, args.payments, args.payers)
+    print(f"Funding {args.payers} payers...", file=sys.stderr)
+    payers = create_payers(w3, args.payers, balance_wei, args.funder, args.funder_key)
+
+    tracker = ReceiptTracker(w3, poll_interval=0.2, max_poll_interval=1.0)
+    tracker.start()
+    approve = approve_over_http(args.server.rstrip("/"))
+
+    def submit(payment_data, payer, private_key):
+        success, result = approve(payment_data, payer, private_key)
+        if success:
+            tracker.track(result, payment_data['paymentId'])
+        return success, result
+
+    generator = LoadGenerator(submit, tracker.status_for_payment, payers, Web3.to_checksum_address(args.merchant),
+                              args.amount, concurrency=args.concurrency, rate=args.rate)
+    print(f"Sending {args.payments} payments...", file=sys.stderr)
+    report = generator.run(args.payments)
+    tracker.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['confirmed'] == report['payments'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
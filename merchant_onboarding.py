@@ -0,0 +1,105 @@
+import os
+
+from web3 import Web3
+
+from contract_abi import supports_function
+from rpc_batch import ReadBatch
+
+# Merchants registered per addMerchants transaction
+MERCHANT_BATCH_SIZE = int(os.getenv("MERCHANT_BATCH_SIZE", "200"))
+
+
+class MerchantOnboarding:
+    """Registers many merchants with as few transactions and round trips as possible
+
+    ``split()`` checks every address with one batched ``merchants()`` read.
+    ``onboard()`` then registers the rest with one ``addMerchants`` transaction
+    per ``batch_size`` addresses, or, on deployments without that function, with
+    one ``addMerchant`` transaction per address, all broadcast back to back
+    without waiting for receipts.
+
+    ``send_transaction(contract_function, sender, private_key)`` signs and
+    broadcasts a call and returns its hash; it is expected to allocate nonces
+    locally so the transactions can be pipelined. When ``send_transactions(
+    contract_functions, sender, private_key)`` is given, all calls go to it at
+    once, so they can be signed in parallel; it returns ``(tx_hashes, error)``
+    for the calls broadcast before the first failure.
+    """
+
+    def __init__(self, w3, contract, send_transaction, batch_size=MERCHANT_BATCH_SIZE,
+                 send_transactions=None):
+        self.w3 = w3
+        self.contract = contract
+        self.send_transaction = send_transaction
+        self.send_transactions = send_transactions
+        self.batch_size = batch_size
+        self._batch_supported = None
+
+    @property
+    def batch_supported(self):
+        """True if the deployed contract has addMerchants"""
+        if self._batch_supported is None:
+            self._batch_supported = supports_function(self.w3, self.contract, "addMerchants")
+        return self._batch_supported
+
+    def split(self, addresses):
+        """Return (unregistered, registered, invalid) lists for a list of addresses"""
+        invalid = []
+        merchants = []
+        seen = set()
+        for address in addresses:
+            address = address.strip()
+            if not address:
+                continue
+            if not Web3.is_address(address):
+                invalid.append(address)
+                continue
+            merchant = Web3.to_checksum_address(address)
+            if merchant not in seen:
+                seen.add(merchant)
+                merchants.append(merchant)
+
+        reads = ReadBatch(self.w3)
+        lookups = [(merchant, reads.call(self.contract.functions.merchants(merchant)))
+                   for merchant in merchants]
+        if merchants and not reads.execute():
+            raise ConnectionError("Could not read merchant registrations from the node")
+        unregistered = [merchant for merchant, read in lookups if not read.value]
+        registered = [merchant for merchant, read in lookups if read.value]
+        return unregistered, registered, invalid
+
+    def onboard(self, addresses, admin_address, admin_key):
+        """Register every unregistered address and return the broadcast transactions"""
+        unregistered, registered, invalid = self.split(addresses)
+        result = {
+            'registered': registered,
+            'invalid': invalid,
+            'submitted': [],
+            'tx_hashes': [],
+            'error': None,
+        }
+        admin_address = Web3.to_checksum_address(admin_address)
+        if self.batch_supported:
+            batches = [unregistered[i:i + self.batch_size]
+                       for i in range(0, len(unregistered), self.batch_size)]
+            calls = [(batch, self.contract.functions.addMerchants(batch)) for batch in batches]
+        else:
+            calls = [([merchant], self.contract.functions.addMerchant(merchant))
+                     for merchant in unregistered]
+        if self.send_transactions and calls:
+            tx_hashes, result['error'] = self.send_transactions(
+                [contract_function for _, contract_function in calls], admin_address, admin_key)
+            for (merchants, _), tx_hash in zip(calls, tx_hashes):
+                result['submitted'].extend(merchants)
+                result['tx_hashes'].append(tx_hash)
+            return result
+        for merchants, contract_function in calls:
+            try:
+                tx_hash = self.send_transaction(contract_function, admin_address, admin_key)
+            except Exception as e:
+                # Earlier transactions are already broadcast; report how far we got
+                result['error'] = e
+                break
+            result['submitted'].extend(merchants)
+            result['tx_hashes'].append(tx_hash)
+        return result
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+from payment_events import LOG_MAX_BLOCK_RANGE, LOG_START_BLOCK, contract_events, read_logs
+
+# Lifetime and size of merchant lookups answered by the node
+MERCHANT_CACHE_TTL = float(os.getenv("MERCHANT_CACHE_TTL", "300"))
+MERCHANT_CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", "1024"))
+
+MERCHANT_EVENTS = ("MerchantAdded", "MerchantRemoved")
+
+
+class MerchantRegistry:
+    """Process-wide cache of which addresses are registered merchants
+
+    The full set of MerchantAdded and MerchantRemoved events is loaded either
+    by ``attach_ledger()``, on the ledger's thread once its index has caught
+    up, or by ``warm_up()`` straight from the node's logs. ``attach()`` keeps
+    the result current from a PaymentLogFollower. Once loaded, and while that
+    follower is synced, the registry is complete and ``is_registered()`` never
+    calls the node. Otherwise lookups go through ``merchants(addr).call()`` and
+    are kept in an LRU cache with a TTL, which the same events invalidate.
+
+    A ledger that rolls back a reorg hands its index over again, and the set
+    is rebuilt from it so merchants added on an orphaned fork are dropped.
+    """
+
+    def __init__(self, contract, ttl=MERCHANT_CACHE_TTL, max_entries=MERCHANT_CACHE_SIZE):
+        self.contract = contract
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.warm = False
+        self.follower = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._registered = {}
+        self._cache = OrderedDict()
+        self._events = contract_events(contract, MERCHANT_EVENTS)
+
+    def attach(self, follower):
+        """Apply merchant events seen by a PaymentLogFollower from now on"""
+        self.follower = follower
+        follower.subscribe(self.apply_event)
+
+    def attach_ledger(self, ledger):
+        """Load the merchant set from a PaymentLedger when it catches up and after each reorg"""
+        ledger.subscribe(self.load_ledger)
+
+    def load_ledger(self, ledger):
+        """Replace the merchant set with the one in a PaymentLedger's index"""
+        # Read the checkpoint first so no event the ledger indexes meanwhile counts as newer
+        indexed_to = ledger.next_block - 1
+        registered = {}
+        for row in ledger.merchant_events():
+            registered[row['merchant']] = (row['event'] == "MerchantAdded", (row['block_number'], row['log_index']))
+        with self._lock:
+            # The follower may already have delivered events past the index
+            for merchant, entry in self._registered.items():
+                if entry[1][0] > indexed_to and (merchant not in registered or registered[merchant][1] < entry[1]):
+                    registered[merchant] = entry
+            self._registered = registered
+            self._cache.clear()
+        self.warm = True
+
+    def warm_up(self, w3, from_block=LOG_START_BLOCK, max_block_range=LOG_MAX_BLOCK_RANGE):
+        """Load the full merchant set from the node's logs; afterwards lookups need no RPC"""
+        head = w3.eth.block_number
+        for _, _, events in read_logs(w3, self.contract.address, self._events, from_block, head, max_block_range):
+            for event in events:
+                self.apply_event(event)
+        self.warm = True
+
+    def apply_event(self, event):
+        """Update the registry from a decoded MerchantAdded or MerchantRemoved event"""
+        if event['event'] not in MERCHANT_EVENTS:
+            return
+        self._record(event['args']['merchant'], event['event'], (event['blockNumber'], event['logIndex']))
+
+    def _record(self, merchant, event_name, position):
+        registered = event_name == "MerchantAdded"
+        with self._lock:
+            # Warm-up and the follower can deliver the same range; keep the newest event
+            current = self._registered.get(merchant)
+            if current is None or current[1] < position:
+                self._registered[merchant] = (registered, position)
+            self._cache.pop(merchant, None)
+
+    def is_registered(self, address):
+        """Return True if the address is a registered merchant"""
+        merchant = Web3.to_checksum_address(address)
+        # Without a follower that keeps up, the warm set may miss recent changes
+        current = self.warm and (self.follower is None or self.follower.synced)
+        with self._lock:
+            if current:
+                self.hits += 1
+                entry = self._registered.get(merchant)
+                return bool(entry and entry[0])
+            cached = self._cache.get(merchant)
+            if cached and cached[1] > time.monotonic():
+                self._cache.move_to_end(merchant)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        registered = self.contract.functions.merchants(merchant).call()
+        with self._lock:
+            self._cache[merchant] = (registered, time.monotonic() + self.ttl)
+            self._cache.move_to_end(merchant)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return registered
+
+    def invalidate(self, address=None):
+        """Forget cached lookups for one address, or all of them"""
+        with self._lock:
+            if address is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(Web3.to_checksum_address(address), None)
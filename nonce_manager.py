@@ -0,0 +1,230 @@
+import heapq
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from web3 import Web3
+from web3.exceptions import ProviderConnectionError, TimeExhausted
+
+from background_worker import BackgroundWorker
+
+# Seconds a sender's mined count may stand still below its next nonce before a gap is refilled
+NONCE_GAP_TIMEOUT = float(os.getenv("NONCE_GAP_TIMEOUT", "60"))
+NONCE_GAP_CHECK_INTERVAL = float(os.getenv("NONCE_GAP_CHECK_INTERVAL", "15"))
+# Seconds after its last allocation that a sender with nothing unmined is forgotten
+NONCE_IDLE_TIMEOUT = float(os.getenv("NONCE_IDLE_TIMEOUT", "600"))
+
+# Fragments of node errors that mean our idea of the next nonce is wrong
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid transaction nonce",
+    "replacement transaction underpriced",
+)
+# Answers to a signed transaction the node already holds, e.g. one resent after a failover
+ALREADY_KNOWN_ERRORS = (
+    "already known",
+    "known transaction",
+)
+
+
+def is_nonce_error(error):
+    """Return True if a node error was caused by a stale or conflicting nonce"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+def is_already_known(error):
+    """Return True if the node refused a transaction because it already has that exact one"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in ALREADY_KNOWN_ERRORS)
+
+
+def is_transport_error(error):
+    """Return True if a request failed on the way, so the node may or may not have acted on it"""
+    # requests' exceptions are OSErrors as well
+    return isinstance(error, (OSError, ProviderConnectionError, TimeExhausted))
+
+
+def broadcast(w3, raw_transaction):
+    """Send a signed transaction and return its hash, also when the node already had it"""
+    try:
+        return w3.eth.send_raw_transaction(raw_transaction)
+    except Exception as e:
+        if not is_already_known(e):
+            raise
+    if isinstance(raw_transaction, str):
+        return Web3.keccak(hexstr=raw_transaction)
+    return Web3.keccak(raw_transaction)
+
+
+class NonceManager(BackgroundWorker):
+    """Thread-safe nonce allocator keyed by sender address
+
+    The first transaction of a sender reads ``eth_getTransactionCount(sender,
+    'pending')``; after that nonces are handed out locally so one wallet can keep
+    many transactions in flight. Nonces that were never broadcast are returned
+    with ``release()`` and handed out again first, and a nonce error from the
+    node triggers ``resync()``. Each sender has its own lock, so a node read for
+    one sender never holds up allocations for the others.
+
+    A transaction the node dropped leaves a gap: later nonces sit in the node's
+    queue without any error and never get mined. ``start()`` runs a background
+    check over the senders with nonces handed out but not yet mined. One whose
+    mined count has not moved for ``gap_timeout`` seconds while its pending
+    count sits below the next local nonce is resynced, so the missing nonce is
+    handed out again. Senders leave the check once their transactions are
+    mined, and are forgotten after ``idle_timeout`` seconds without one.
+    """
+
+    def __init__(self, w3, gap_timeout=NONCE_GAP_TIMEOUT, check_interval=NONCE_GAP_CHECK_INTERVAL,
+                 idle_timeout=NONCE_IDLE_TIMEOUT):
+        super().__init__("nonce-gaps")
+        self.w3 = w3
+        self.gap_timeout = gap_timeout
+        self.check_interval = check_interval
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._sender_locks = {}
+        self._next = {}
+        self._released = {}
+        self._stalled = {}
+        self._last_used = {}
+        self._unmined = set()
+
+    def run_once(self):
+        with self._lock:
+            senders = list(self._next)
+            unmined = set(self._unmined)
+        for sender in senders:
+            if sender in unmined:
+                self.recover(sender)
+            else:
+                self._forget_if_idle(sender)
+        return self.check_interval
+
+    def retry_delay(self):
+        return self.check_interval
+
+    def _sender_lock(self, sender):
+        with self._lock:
+            return self._sender_locks.setdefault(sender, threading.Lock())
+
+    @contextmanager
+    def _locked(self, sender):
+        # A forgotten sender's lock is dropped; holders of the old lock try again with the new one
+        while True:
+            lock = self._sender_lock(sender)
+            with lock:
+                with self._lock:
+                    current = self._sender_locks.get(sender) is lock
+                if current:
+                    yield
+                    return
+
+    def allocate(self, sender):
+        """Return the next nonce for a sender"""
+        sender = Web3.to_checksum_address(sender)
+        with self._locked(sender):
+            self._last_used[sender] = time.monotonic()
+            with self._lock:
+                self._unmined.add(sender)
+            released = self._released.get(sender)
+            if released:
+                return heapq.heappop(released)
+            if sender not in self._next:
+                self._next[sender] = self.w3.eth.get_transaction_count(sender, 'pending')
+            nonce = self._next[sender]
+            self._next[sender] = nonce + 1
+            return nonce
+
+    def release(self, sender, nonce):
+        """Give back a nonce whose transaction was never broadcast"""
+        sender = Web3.to_checksum_address(sender)
+        with self._locked(sender):
+            if nonce < self._next.get(sender, 0):
+                heapq.heappush(self._released.setdefault(sender, []), nonce)
+
+    def resync(self, sender):
+        """Reload the next nonce from the node's pending transaction count"""
+        sender = Web3.to_checksum_address(sender)
+        pending = self.w3.eth.get_transaction_count(sender, 'pending')
+        with self._locked(sender):
+            self._reset(sender, pending)
+        return pending
+
+    def _reset(self, sender, pending):
+        # Everything below the node's count is used and everything above is handed out again
+        self._next[sender] = pending
+        self._released.pop(sender, None)
+        self._stalled.pop(sender, None)
+
+    def _forget_if_idle(self, sender):
+        with self._locked(sender):
+            with self._lock:
+                if sender in self._unmined:
+                    return
+                if time.monotonic() - self._last_used.get(sender, 0) < self.idle_timeout:
+                    return
+                del self._sender_locks[sender]
+            for table in (self._next, self._released, self._stalled, self._last_used):
+                table.pop(sender, None)
+
+    def recover(self, sender):
+        """Resync a sender stuck behind a nonce gap; returns True if it was resynced
+
+        Costs one ``eth_getTransactionCount(sender, 'latest')`` per call, and a
+        pending count only once the mined count has stood still for
+        ``gap_timeout`` seconds. The node's pending count stops at the first
+        nonce it never received; if it is below the next local nonce, the
+        sender is resynced to it.
+        """
+        sender = Web3.to_checksum_address(sender)
+        mined = self.w3.eth.get_transaction_count(sender, 'latest')
+        now = time.monotonic()
+        with self._locked(sender):
+            if sender not in self._next:
+                return False
+            if mined >= self._next[sender]:
+                # Everything handed out is mined; nothing to watch until the next allocation
+                self._stalled.pop(sender, None)
+                with self._lock:
+                    self._unmined.discard(sender)
+                return False
+            stalled = self._stalled.get(sender)
+            if stalled is None or stalled[0] != mined:
+                self._stalled[sender] = (mined, now)
+                return False
+            if now - stalled[1] < self.gap_timeout:
+                return False
+        pending = self.w3.eth.get_transaction_count(sender, 'pending')
+        with self._locked(sender):
+            # Released nonces were never sent, so the node's count stops at the lowest of them
+            released = self._released.get(sender)
+            if sender not in self._next or pending >= (released[0] if released else self._next[sender]):
+                # Stuck for another reason, such as a low fee; look again after another timeout
+                self._stalled[sender] = (mined, now)
+                return False
+            self._reset(sender, pending)
+            return True
+
+    @contextmanager
+    def reserve(self, sender):
+        """Allocate a nonce for the body of a ``with`` block
+
+        If the block raises, the nonce is released, or the sender is resynced when
+        the error was about the nonce itself. Only wrap the build, sign and send
+        steps so a failure after broadcast does not hand the nonce out again.
+        After a transport error the nonce is kept: the node may have taken the
+        transaction, and if it did not, ``recover()`` refills the gap.
+        """
+        nonce = self.allocate(sender)
+        try:
+            yield nonce
+        except Exception as e:
+            if is_nonce_error(e):
+                self.resync(sender)
+            elif not is_transport_error(e):
+                self.release(sender, nonce)
+            raise
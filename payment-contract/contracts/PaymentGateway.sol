@@ -51,6 +51,18 @@ contract PaymentGateway {
         emit MerchantAdded(merchant, msg.sender);
     }
     
+    // Add many merchants in one transaction; already registered addresses are skipped
+    function addMerchants(address[] calldata newMerchants) external onlyOwner {
+        for (uint256 i = 0; i < newMerchants.length; i++) {
+            address merchant = newMerchants[i];
+            require(merchant != address(0), "Invalid merchant address");
+            if (!merchants[merchant]) {
+                merchants[merchant] = true;
+                emit MerchantAdded(merchant, msg.sender);
+            }
+        }
+    }
+    
     // Remove a merchant
     function removeMerchant(address merchant) external onlyOwner {
         require(merchants[merchant], "Merchant not registered");
@@ -77,6 +89,41 @@ contract PaymentGateway {
         emit PaymentProcessed(merchant, msg.sender, msg.value, paymentId);
     }
     
+    // Process several payments in one transaction; msg.value must equal the sum of amounts
+    function processPayments(
+        address payable[] calldata merchantList,
+        string[] calldata paymentIds,
+        uint256[] calldata amounts
+    ) external payable {
+        require(
+            merchantList.length == paymentIds.length && paymentIds.length == amounts.length,
+            "Array lengths do not match"
+        );
+        
+        uint256 total = 0;
+        for (uint256 i = 0; i < amounts.length; i++) {
+            require(amounts[i] > 0, "Payment amount must be greater than 0");
+            total += amounts[i];
+        }
+        require(total == msg.value, "Payment total does not match value sent");
+        
+        for (uint256 i = 0; i < merchantList.length; i++) {
+            address payable merchant = merchantList[i];
+            require(merchants[merchant], "Merchant not registered");
+            require(!processedPayments[paymentIds[i]], "Payment ID already processed");
+            
+            // Mark payment as processed
+            processedPayments[paymentIds[i]] = true;
+            
+            // Transfer funds to merchant
+            (bool sent, ) = merchant.call{value: amounts[i]}("");
+            require(sent, "Failed to send Ether");
+            
+            // Emit payment event
+            emit PaymentProcessed(merchant, msg.sender, amounts[i], paymentIds[i]);
+        }
+    }
+    
     // Check if a payment has been processed
     function isPaymentProcessed(string memory paymentId) external view returns (bool) {
         return processedPayments[paymentId];
@@ -0,0 +1,139 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// PaymentGateway keyed by bytes32 payment IDs. Clients pass keccak256 of the
+// UTF-8 payment ID string, which is also the topic the string variant emits,
+// so logs of both variants are looked up the same way.
+contract PaymentGatewayBytes32 {
+    address public owner;
+    
+    // Mapping to track registered merchants
+    mapping(address => bool) public merchants;
+    
+    // Mapping to track processed payments
+    mapping(bytes32 => bool) public processedPayments;
+    
+    // Events
+    event PaymentProcessed(
+        address indexed merchant,
+        address indexed payer,
+        uint256 amount,
+        bytes32 indexed paymentId
+    );
+    
+    event MerchantAdded(
+        address indexed merchant,
+        address indexed addedBy
+    );
+    
+    event MerchantRemoved(
+        address indexed merchant,
+        address indexed removedBy
+    );
+    
+    // Constructor
+    constructor() {
+        owner = msg.sender;
+        // Register the owner as the first merchant
+        merchants[owner] = true;
+        emit MerchantAdded(owner, owner);
+    }
+    
+    // Modifiers
+    modifier onlyOwner() {
+        require(msg.sender == owner, "Only owner can call this function");
+        _;
+    }
+    
+    // Add a new merchant
+    function addMerchant(address merchant) external onlyOwner {
+        require(merchant != address(0), "Invalid merchant address");
+        require(!merchants[merchant], "Merchant already registered");
+        
+        merchants[merchant] = true;
+        emit MerchantAdded(merchant, msg.sender);
+    }
+    
+    // Add many merchants in one transaction; already registered addresses are skipped
+    function addMerchants(address[] calldata newMerchants) external onlyOwner {
+        for (uint256 i = 0; i < newMerchants.length; i++) {
+            address merchant = newMerchants[i];
+            require(merchant != address(0), "Invalid merchant address");
+            if (!merchants[merchant]) {
+                merchants[merchant] = true;
+                emit MerchantAdded(merchant, msg.sender);
+            }
+        }
+    }
+    
+    // Remove a merchant
+    function removeMerchant(address merchant) external onlyOwner {
+        require(merchants[merchant], "Merchant not registered");
+        require(merchant != owner, "Cannot remove owner as merchant");
+        
+        merchants[merchant] = false;
+        emit MerchantRemoved(merchant, msg.sender);
+    }
+    
+    // Process a payment
+    function processPayment(address payable merchant, bytes32 paymentId) external payable {
+        require(merchants[merchant], "Merchant not registered");
+        require(!processedPayments[paymentId], "Payment ID already processed");
+        require(msg.value > 0, "Payment amount must be greater than 0");
+        
+        // Mark payment as processed
+        processedPayments[paymentId] = true;
+        
+        // Transfer funds to merchant
+        (bool sent, ) = merchant.call{value: msg.value}("");
+        require(sent, "Failed to send Ether");
+        
+        // Emit payment event
+        emit PaymentProcessed(merchant, msg.sender, msg.value, paymentId);
+    }
+    
+    // Process several payments in one transaction; msg.value must equal the sum of amounts
+    function processPayments(
+        address payable[] calldata merchantList,
+        bytes32[] calldata paymentIds,
+        uint256[] calldata amounts
+    ) external payable {
+        require(
+            merchantList.length == paymentIds.length && paymentIds.length == amounts.length,
+            "Array lengths do not match"
+        );
+        
+        uint256 total = 0;
+        for (uint256 i = 0; i < amounts.length; i++) {
+            require(amounts[i] > 0, "Payment amount must be greater than 0");
+            total += amounts[i];
+        }
+        require(total == msg.value, "Payment total does not match value sent");
+        
+        for (uint256 i = 0; i < merchantList.length; i++) {
+            address payable merchant = merchantList[i];
+            require(merchants[merchant], "Merchant not registered");
+            require(!processedPayments[paymentIds[i]], "Payment ID already processed");
+            
+            // Mark payment as processed
+            processedPayments[paymentIds[i]] = true;
+            
+            // Transfer funds to merchant
+            (bool sent, ) = merchant.call{value: amounts[i]}("");
+            require(sent, "Failed to send Ether");
+            
+            // Emit payment event
+            emit PaymentProcessed(merchant, msg.sender, amounts[i], paymentIds[i]);
+        }
+    }
+    
+    // Check if a payment has been processed
+    function isPaymentProcessed(bytes32 paymentId) external view returns (bool) {
+        return processedPayments[paymentId];
+    }
+    
+    // Get contract balance (for debugging)
+    function getContractBalance() external view onlyOwner returns (uint256) {
+        return address(this).balance;
+    }
+}
\ No newline at end of file
@@ -0,0 +1,5 @@
+const PaymentGatewayBytes32 = artifacts.require("PaymentGatewayBytes32");
+
+module.exports = function (deployer) {
+  deployer.deploy(PaymentGatewayBytes32);
+};
\ No newline at end of file
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from eth_account import Account
+from web3 import Web3
+
+from background_worker import BackgroundWorker
+from contract_abi import payment_id_key, supports_function
+
+# Payments settled per processPayments transaction
+PAYMENT_BATCH_SIZE = int(os.getenv("PAYMENT_BATCH_SIZE", "20"))
+# Seconds the first queued payment of a payer waits for others to join its batch
+PAYMENT_BATCH_WINDOW = float(os.getenv("PAYMENT_BATCH_WINDOW", "5.0"))
+
+
+class PaymentBatcher(BackgroundWorker):
+    """Settles queued payments of the same payer together in one transaction
+
+    ``submit()`` queues a payment and returns a Future for the hash of the
+    transaction that carries it. A payer's queue is sent as soon as it holds
+    ``max_batch`` payments or its oldest payment has waited ``window`` seconds,
+    as one ``processPayments`` call whose value is the sum of the amounts. On
+    deployments without ``processPayments`` every payment becomes its own
+    ``processPayment`` transaction.
+
+    The private key must belong to the payer; queues are per payer, so a key
+    is only ever used for the payments it was submitted with or that its own
+    account submitted. A batch is all or nothing: if one payment in it
+    reverts, none of them settle.
+    ``subscribe()`` callbacks receive ``(tx_hash, payment_ids)`` for every
+    broadcast transaction.
+
+    With ``send_transactions(contract_functions, sender, private_key, values)``
+    the separate ``processPayment`` transactions of a payer are signed together
+    and broadcast in order; it returns ``(tx_hashes, error)``.
+    """
+
+    def __init__(self, w3, contract, send_transaction, max_batch=PAYMENT_BATCH_SIZE,
+                 window=PAYMENT_BATCH_WINDOW, send_transactions=None):
+        super().__init__("payment-batcher")
+        self.w3 = w3
+        self.contract = contract
+        self.send_transaction = send_transaction
+        self.send_transactions = send_transactions
+        self.max_batch = max(1, max_batch)
+        self.window = window
+        self._batch_supported = None
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._subscribers = []
+
+    @property
+    def batch_supported(self):
+        """True if the deployed contract has processPayments"""
+        if self._batch_supported is None:
+            self._batch_supported = supports_function(self.w3, self.contract, "processPayments")
+        return self._batch_supported
+
+    def stop(self, timeout=5):
+        """Stop the background thread after sending whatever is still queued"""
+        super().stop(timeout)
+        self.flush()
+
+    def subscribe(self, callback):
+        """Call ``callback(tx_hash, payment_ids)`` for every broadcast transaction"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def submit(self, merchant, payment_id, amount_wei, payer, private_key):
+        """Queue a payment and return a Future for its transaction hash"""
+        payer = Web3.to_checksum_address(payer)
+        try:
+            key_owner = Account.from_key(private_key).address
+        except Exception:
+            # from_key's error can quote the key it was given; keep it out of the traceback
+            raise ValueError("Invalid private key") from None
+        if key_owner != payer:
+            raise ValueError("The private key does not belong to the payer address")
+        future = Future()
+        with self._lock:
+            queue = self._queues.setdefault(payer, {
+                'private_key': private_key,
+                'since': time.monotonic(),
+                'payments': [],
+            })
+            if any(payment['payment_id'] == payment_id for payment in queue['payments']):
+                raise ValueError("This payment ID is already queued")
+            queue['payments'].append({
+                'merchant': Web3.to_checksum_address(merchant),
+                'payment_id': payment_id,
+                'amount': amount_wei,
+                'future': future,
+            })
+            full = len(queue['payments']) >= self.max_batch
+        if full:
+            self.wake()
+        return future
+
+    def queued(self, payer=None):
+        """Return how many payments wait to be sent, for one payer or in total"""
+        with self._lock:
+            if payer is not None:
+                queue = self._queues.get(Web3.to_checksum_address(payer))
+                return len(queue['payments']) if queue else 0
+            return sum(len(queue['payments']) for queue in self._queues.values())
+
+    def flush(self):
+        """Send every queued payment now, on the calling thread"""
+        self._send_batches(self._take(force=True))
+
+    def run_once(self):
+        self._send_batches(self._take())
+        return self._next_deadline()
+
+    def retry_delay(self):
+        return self.window
+
+    def _next_deadline(self):
+        with self._lock:
+            if not self._queues:
+                return self.window
+            oldest = min(queue['since'] for queue in self._queues.values())
+        return max(0.0, oldest + self.window - time.monotonic())
+
+    def _take(self, force=False):
+        """Remove and return the batches that are full, due, or all of them"""
+        now = time.monotonic()
+        batches = []
+        with self._lock:
+            for payer in list(self._queues):
+                queue = self._queues[payer]
+                while queue['payments'] and (
+                        force or len(queue['payments']) >= self.max_batch
+                        or now - queue['since'] >= self.window):
+                    batches.append((payer, queue['private_key'], queue['payments'][:self.max_batch]))
+                    del queue['payments'][:self.max_batch]
+                    queue['since'] = now
+                if not queue['payments']:
+                    del self._queues[payer]
+        return batches
+
+    def _send_batches(self, batches):
+        for payer, private_key, payments in batches:
+            try:
+                self._send(payer, private_key, payments)
+            except Exception as e:
+                # The thread keeps running and no caller waits on an abandoned future
+                self._fail(payments, e)
+
+    def _fail(self, payments, error):
+        for payment in payments:
+            if not payment['future'].done():
+                payment['future'].set_exception(error)
+
+    def _send(self, payer, private_key, payments):
+        try:
+            batched = len(payments) > 1 and self.batch_supported
+        except Exception as e:
+            # Detection reads the contract code; try again with the next batch
+            self._fail(payments, e)
+            return
+        if batched:
+            groups = [payments]
+        else:
+            groups = [[payment] for payment in payments]
+        if len(groups) > 1 and self.send_transactions:
+            self._send_separately(payer, private_key, payments)
+            return
+        for group in groups:
+            try:
+                if len(group) == 1:
+                    contract_function = self.contract.functions.processPayment(
+                        group[0]['merchant'], payment_id_key(self.contract, group[0]['payment_id']))
+                else:
+                    contract_function = self.contract.functions.processPayments(
+                        [payment['merchant'] for payment in group],
+                        [payment_id_key(self.contract, payment['payment_id']) for payment in group],
+                        [payment['amount'] for payment in group],
+                    )
+                tx_hash = self.send_transaction(
+                    contract_function, payer, private_key,
+                    value=sum(payment['amount'] for payment in group),
+                )
+            except Exception as e:
+                self._fail(group, e)
+                continue
+            self._sent(tx_hash, group)
+
+    def _send_separately(self, payer, private_key, payments):
+        """Send one processPayment per payment through send_transactions"""
+        tx_hashes, error = self.send_transactions(
+            [self.contract.functions.processPayment(
+                payment['merchant'], payment_id_key(self.contract, payment['payment_id']))
+             for payment in payments],
+            payer, private_key,
+            values=[payment['amount'] for payment in payments],
+        )
+        for payment, tx_hash in zip(payments, tx_hashes):
+            self._sent(tx_hash, [payment])
+        self._fail(payments[len(tx_hashes):], error)
+
+    def _sent(self, tx_hash, group):
+        payment_ids = [payment['payment_id'] for payment in group]
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(tx_hash, payment_ids)
+        for payment in group:
+            payment['future'].set_result(tx_hash)
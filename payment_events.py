@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+
+from web3 import Web3
+
+from background_worker import BackgroundWorker
+
+# First block to read PaymentGateway logs from (the deployment block saves a full scan)
+LOG_START_BLOCK = int(os.getenv("LOG_START_BLOCK", "0"))
+LOG_POLL_INTERVAL = float(os.getenv("LOG_POLL_INTERVAL", "2.0"))
+# Largest block range asked for in one eth_getLogs call
+LOG_MAX_BLOCK_RANGE = int(os.getenv("LOG_MAX_BLOCK_RANGE", "2000"))
+# Missed poll intervals after which the follower no longer counts as synced
+LOG_STALE_POLLS = int(os.getenv("LOG_STALE_POLLS", "5"))
+
+CONTRACT_EVENTS = ("PaymentProcessed", "MerchantAdded", "MerchantRemoved")
+# Fragments of node errors that refuse an eth_getLogs window as too large
+LOG_RANGE_ERRORS = (
+    "block range",
+    "query returned more than",
+    "too many results",
+    "limit exceeded",
+    "response size",
+)
+
+
+def payment_id_topic(payment_id):
+    """Return the topic PaymentProcessed uses for an indexed string payment ID"""
+    return Web3.keccak(text=payment_id)
+
+
+def event_topic(event):
+    """Return topic0 (the signature hash) of a contract event"""
+    inputs = ",".join(arg['type'] for arg in event.abi['inputs'])
+    return Web3.keccak(text=f"{event.abi['name']}({inputs})")
+
+
+def contract_events(contract, names=CONTRACT_EVENTS):
+    """Return {topic0: event} for the named events of a contract"""
+    events = {}
+    for name in names:
+        event = getattr(contract.events, name)()
+        events[event_topic(event)] = event
+    return events
+
+
+def read_logs(w3, address, events, from_block, to_block, max_block_range=LOG_MAX_BLOCK_RANGE):
+    """Yield (first block, last block, decoded events) per eth_getLogs window up to ``to_block``
+
+    ``events`` is a ``contract_events()`` map; one call covers all of them.
+    Windows span at most ``max_block_range`` blocks, and a window the node
+    refuses as too large is halved until it is served.
+    """
+    topics = [[Web3.to_hex(topic) for topic in events]]
+    span = max(1, max_block_range)
+    start = from_block
+    while start <= to_block:
+        end = min(to_block, start + span - 1)
+        try:
+            logs = w3.eth.get_logs({'address': address, 'fromBlock': start, 'toBlock': end, 'topics': topics})
+        except Exception as e:
+            message = str(e).lower()
+            if end == start or not any(fragment in message for fragment in LOG_RANGE_ERRORS):
+                raise
+            span = max(1, (end - start + 1) // 2)
+            continue
+        yield start, end, [events[log['topics'][0]].process_log(log) for log in logs]
+        start = end + 1
+
+
+class PaymentLogFollower(BackgroundWorker):
+    """Follows PaymentGateway events with an eth_getLogs block-range cursor
+
+    One ``eth_getLogs`` call per poll covers every contract event from the cursor
+    up to the chain head. Settled payment IDs are kept in memory so
+    ``is_settled()`` answers without touching the node, and other parts of the
+    app can ``subscribe()`` to decoded events.
+
+    ``paymentId`` is an indexed string, so logs only carry its keccak hash; the
+    settled set is keyed by that hash.
+
+    ``synced`` is only True while the last poll that reached the head is at
+    most ``stale_polls`` intervals old, so callers stop trusting the settled
+    set when the node keeps failing and go back to asking the contract.
+    """
+
+    def __init__(self, w3, contract, from_block=LOG_START_BLOCK, poll_interval=LOG_POLL_INTERVAL,
+                 max_block_range=LOG_MAX_BLOCK_RANGE, stale_polls=LOG_STALE_POLLS):
+        super().__init__("payment-log-follower")
+        self.w3 = w3
+        self.contract = contract
+        self.next_block = from_block
+        self.poll_interval = poll_interval
+        self.max_block_range = max_block_range
+        self.stale_after = poll_interval * stale_polls
+        self.last_synced = None
+        self._settled = set()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._events = contract_events(contract)
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` for every decoded contract event from now on"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    @property
+    def synced(self):
+        """True if the follower reached the chain head within the last ``stale_polls`` intervals"""
+        last_synced = self.last_synced
+        return last_synced is not None and time.monotonic() - last_synced <= self.stale_after
+
+    def is_settled(self, payment_id):
+        """Return True if a PaymentProcessed log has been seen for the payment ID"""
+        with self._lock:
+            return payment_id_topic(payment_id) in self._settled
+
+    def run_once(self):
+        self.poll()
+        return self.poll_interval
+
+    def retry_delay(self):
+        return self.poll_interval
+
+    def poll(self):
+        """Read logs from the cursor up to the chain head and return the decoded events"""
+        head = self.w3.eth.block_number
+        decoded = []
+        for _, end, events in read_logs(self.w3, self.contract.address, self._events,
+                                        self.next_block, head, self.max_block_range):
+            self._apply(events)
+            decoded.extend(events)
+            self.next_block = end + 1
+        self.last_synced = time.monotonic()
+        return decoded
+
+    def _apply(self, events):
+        with self._lock:
+            for event in events:
+                if event['event'] == "PaymentProcessed":
+                    self._settled.add(bytes(event['args']['paymentId']))
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            for event in events:
+                callback(event)
@@ -0,0 +1,322 @@
+import os
+import sqlite3
+import threading
+
+from web3 import Web3
+from web3.exceptions import BlockNotFound
+
+from background_worker import BackgroundWorker
+from payment_events import LOG_MAX_BLOCK_RANGE, LOG_START_BLOCK, contract_events, payment_id_topic, read_logs
+
+LEDGER_DB_PATH = os.getenv("LEDGER_DB_PATH", "payment_ledger.db")
+# Blocks per eth_getLogs window and checkpoint
+LEDGER_CHUNK_SIZE = int(os.getenv("LEDGER_CHUNK_SIZE", str(LOG_MAX_BLOCK_RANGE)))
+LEDGER_POLL_INTERVAL = float(os.getenv("LEDGER_POLL_INTERVAL", "5.0"))
+# How far back a reorg is looked for before giving up and reindexing from scratch
+REORG_WINDOW = int(os.getenv("REORG_WINDOW", "64"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    next_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS source (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    chain_id INTEGER NOT NULL,
+    contract TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payments (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    merchant TEXT NOT NULL,
+    payer TEXT NOT NULL,
+    amount_wei TEXT NOT NULL,
+    payment_id_hash TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS merchant_events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    merchant TEXT NOT NULL,
+    actor TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS merchant_totals (
+    merchant TEXT PRIMARY KEY,
+    payment_count INTEGER NOT NULL,
+    total_wei TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payment_ids (
+    payment_id_hash TEXT PRIMARY KEY,
+    payment_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payments_merchant ON payments (merchant, block_number);
+CREATE INDEX IF NOT EXISTS payments_payer ON payments (payer, block_number);
+CREATE INDEX IF NOT EXISTS payments_payment_id ON payments (payment_id_hash);
+CREATE INDEX IF NOT EXISTS merchant_events_merchant ON merchant_events (merchant, block_number);
+"""
+
+
+class PaymentLedger(BackgroundWorker):
+    """Local SQLite index of PaymentGateway events
+
+    ``sync()`` backfills PaymentProcessed, MerchantAdded and MerchantRemoved logs
+    in chunks of ``chunk_size`` blocks and stores a checkpoint after every chunk,
+    so a restart resumes where it stopped. Indexed block hashes are kept for the
+    last ``REORG_WINDOW`` blocks; when the chain no longer agrees with them the
+    orphaned rows are rolled back and the range is indexed again.
+
+    The index belongs to one contract on one chain. When the database was
+    filled for another contract address or chain ID (a redeploy, a changed
+    ``SMART_CONTRACT_ADDRESS``) its events and checkpoint are dropped and the
+    new contract is indexed from ``from_block``.
+
+    Amounts are stored as decimal text because wei values overflow SQLite
+    integers; per-merchant totals are maintained alongside the payments.
+
+    ``subscribe()`` callbacks run on the syncing thread once the index first
+    reaches the chain head and again after every sync that rolled back a reorg,
+    so caches built from the index can be rebuilt.
+    """
+
+    def __init__(self, w3, contract, db_path=LEDGER_DB_PATH, from_block=LOG_START_BLOCK,
+                 chunk_size=LEDGER_CHUNK_SIZE, poll_interval=LEDGER_POLL_INTERVAL):
+        super().__init__("payment-ledger")
+        self.w3 = w3
+        self.contract = contract
+        self.from_block = from_block
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._subscribers = []
+        self._reached_head = False
+        self._source_checked = False
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._events = contract_events(contract)
+
+    def run_once(self):
+        self.sync()
+        return self.poll_interval
+
+    def retry_delay(self):
+        return self.poll_interval
+
+    @property
+    def next_block(self):
+        with self._lock:
+            row = self.db.execute("SELECT next_block FROM checkpoint WHERE id = 1").fetchone()
+        return row[0] if row else self.from_block
+
+    def sync(self):
+        """Index every block from the checkpoint up to the chain head"""
+        with self._sync_lock:
+            if not self._source_checked:
+                self._check_source()
+            head = self.w3.eth.block_number
+            rolled_back = self._handle_reorg()
+            for _, end, events in read_logs(self.w3, self.contract.address, self._events,
+                                            self.next_block, head, self.chunk_size):
+                self._index_range(end, events)
+                if self._stopped.is_set():
+                    return
+            with self._lock:
+                notify = rolled_back or not self._reached_head
+                self._reached_head = True
+                subscribers = list(self._subscribers) if notify else []
+        for callback in subscribers:
+            callback(self)
+
+    def subscribe(self, callback):
+        """Call ``callback(ledger)`` when the index first reaches the head and after each reorg
+
+        A ledger that already reached the head calls it right away.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+            reached_head = self._reached_head
+        if reached_head:
+            callback(self)
+
+    def _check_source(self):
+        """Drop the index when it was built for another contract or chain"""
+        source = (self.w3.eth.chain_id, Web3.to_checksum_address(self.contract.address))
+        with self._lock, self.db:
+            row = self.db.execute("SELECT chain_id, contract FROM source WHERE id = 1").fetchone()
+            if row is None or tuple(row) != source:
+                # Payment ID plaintexts do not depend on the contract and are kept
+                for table in ("checkpoint", "blocks", "payments", "merchant_events", "merchant_totals"):
+                    self.db.execute(f"DELETE FROM {table}")
+                self.db.execute("INSERT OR REPLACE INTO source (id, chain_id, contract) VALUES (1, ?, ?)", source)
+        self._source_checked = True
+
+    def _index_range(self, end, events):
+        end_hash = Web3.to_hex(self.w3.eth.get_block(end)['hash'])
+        with self._lock, self.db:
+            for event in events:
+                self._store_event(event)
+                self.db.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)",
+                                (event['blockNumber'], Web3.to_hex(event['blockHash'])))
+            self.db.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)", (end, end_hash))
+            self.db.execute("DELETE FROM blocks WHERE number < ?", (end - REORG_WINDOW,))
+            self.db.execute("INSERT OR REPLACE INTO checkpoint (id, next_block) VALUES (1, ?)", (end + 1,))
+
+    def _store_event(self, event):
+        args = event['args']
+        key = (event['blockNumber'], event['logIndex'], Web3.to_hex(event['transactionHash']))
+        if event['event'] == "PaymentProcessed":
+            inserted = self.db.execute(
+                "INSERT OR IGNORE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (args['merchant'], args['payer'], str(args['amount']), Web3.to_hex(args['paymentId'])),
+            ).rowcount
+            if inserted:
+                self._add_to_totals(args['merchant'], 1, args['amount'])
+        else:
+            actor = args['addedBy'] if event['event'] == "MerchantAdded" else args['removedBy']
+            self.db.execute(
+                "INSERT OR IGNORE INTO merchant_events VALUES (?, ?, ?, ?, ?, ?)",
+                key + (event['event'], args['merchant'], actor),
+            )
+
+    def _add_to_totals(self, merchant, count, amount):
+        row = self.db.execute(
+            "SELECT payment_count, total_wei FROM merchant_totals WHERE merchant = ?", (merchant,)
+        ).fetchone()
+        payment_count, total_wei = (row[0], int(row[1])) if row else (0, 0)
+        self.db.execute(
+            "INSERT OR REPLACE INTO merchant_totals VALUES (?, ?, ?)",
+            (merchant, payment_count + count, str(total_wei + amount)),
+        )
+
+    def _handle_reorg(self):
+        """Roll back everything after the newest recorded block that still matches the chain; True if it did
+
+        Only blocks with events and chunk ends are recorded, so the fork may lie
+        anywhere after the last match, not just at the lowest mismatching block.
+        """
+        with self._lock:
+            indexed = self.db.execute("SELECT number, hash FROM blocks ORDER BY number DESC").fetchall()
+        if not indexed:
+            return False
+        for position, (number, block_hash) in enumerate(indexed):
+            try:
+                if Web3.to_hex(self.w3.eth.get_block(number)['hash']) == block_hash:
+                    break
+            except BlockNotFound:
+                # The new chain is shorter than what was indexed
+                pass
+        else:
+            # Nothing in the window survived: start over
+            self.rollback(self.from_block)
+            return True
+        if position:
+            self.rollback(number + 1)
+        return bool(position)
+
+    def rollback(self, block_number):
+        """Delete everything indexed from ``block_number`` on and move the checkpoint back"""
+        with self._lock, self.db:
+            removed = self.db.execute(
+                "SELECT merchant, amount_wei FROM payments WHERE block_number >= ?", (block_number,)
+            ).fetchall()
+            for merchant, amount_wei in removed:
+                self._add_to_totals(merchant, -1, -int(amount_wei))
+            self.db.execute("DELETE FROM payments WHERE block_number >= ?", (block_number,))
+            self.db.execute("DELETE FROM merchant_events WHERE block_number >= ?", (block_number,))
+            self.db.execute("DELETE FROM blocks WHERE number >= ?", (block_number,))
+            self.db.execute("INSERT OR REPLACE INTO checkpoint (id, next_block) VALUES (1, ?)",
+                            (max(self.from_block, block_number),))
+
+    def remember_payment_id(self, payment_id):
+        """Record a plaintext payment ID so history can show it instead of its hash"""
+        with self._lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO payment_ids VALUES (?, ?)",
+                            (Web3.to_hex(payment_id_topic(payment_id)), payment_id))
+
+    def payment_history(self, merchant=None, payer=None, limit=20, offset=0):
+        """Return payments newest first as dicts, optionally filtered by merchant or payer"""
+        query = ("SELECT p.block_number, p.tx_hash, p.merchant, p.payer, p.amount_wei, "
+                 "COALESCE(i.payment_id, p.payment_id_hash) "
+                 "FROM payments p LEFT JOIN payment_ids i ON i.payment_id_hash = p.payment_id_hash")
+        clauses, params = [], []
+        if merchant:
+            clauses.append("p.merchant = ?")
+            params.append(Web3.to_checksum_address(merchant))
+        if payer:
+            clauses.append("p.payer = ?")
+            params.append(Web3.to_checksum_address(payer))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY p.block_number DESC, p.log_index DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self.db.execute(query, params + [limit, offset]).fetchall()
+        return [
+            {
+                'block_number': block_number,
+                'tx_hash': tx_hash,
+                'merchant': merchant,
+                'payer': payer,
+                'amount': format(Web3.from_wei(int(amount_wei), 'ether'), 'f'),
+                'payment_id': payment_id,
+            }
+            for block_number, tx_hash, merchant, payer, amount_wei, payment_id in rows
+        ]
+
+    def payments_by_id_hash(self, payment_id_hashes):
+        """Return indexed payments keyed by payment ID hash (hex) for many hashes at once"""
+        payment_id_hashes = list(payment_id_hashes)
+        payments = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(payment_id_hashes), 500):
+            chunk = payment_id_hashes[start:start + 500]
+            with self._lock:
+                rows = self.db.execute(
+                    "SELECT payment_id_hash, block_number, tx_hash, merchant, payer, amount_wei "
+                    f"FROM payments WHERE payment_id_hash IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            for payment_id_hash, block_number, tx_hash, merchant, payer, amount_wei in rows:
+                payments[payment_id_hash] = {
+                    'block_number': block_number,
+                    'tx_hash': tx_hash,
+                    'merchant': merchant,
+                    'payer': payer,
+                    'amount_wei': int(amount_wei),
+                }
+        return payments
+
+    def merchant_events(self):
+        """Return the indexed MerchantAdded and MerchantRemoved events as dicts, oldest first"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT block_number, log_index, tx_hash, event, merchant, actor FROM merchant_events "
+                "ORDER BY block_number, log_index"
+            ).fetchall()
+        return [
+            {
+                'block_number': block_number,
+                'log_index': log_index,
+                'tx_hash': tx_hash,
+                'event': event,
+                'merchant': merchant,
+                'actor': actor,
+            }
+            for block_number, log_index, tx_hash, event, merchant, actor in rows
+        ]
+
+    def merchant_totals(self, merchant):
+        """Return (payment count, total received in wei) for a merchant"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT payment_count, total_wei FROM merchant_totals WHERE merchant = ?",
+                (Web3.to_checksum_address(merchant),),
+            ).fetchone()
+        return (row[0], int(row[1])) if row else (0, 0)
@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+import urllib.parse
+
+from web3.providers import JSONBaseProvider
+
+
+def _buckets(value):
+    return tuple(sorted(float(bound) for bound in value.split(",") if bound.strip()))
+
+
+# Upper bounds in seconds of the JSON-RPC, broadcast and HTTP handler latency buckets
+METRICS_LATENCY_BUCKETS = _buckets(os.getenv(
+    "METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"))
+# Upper bounds in seconds of the broadcast-to-confirmation buckets
+METRICS_CONFIRM_BUCKETS = _buckets(os.getenv(
+    "METRICS_CONFIRM_BUCKETS", "1,2,5,10,15,30,60,120,300,600,1800"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def endpoint_label(url):
+    """Return scheme, host and port of a node URL, leaving out API keys in its path or credentials"""
+    if url.endswith(".ipc") or url.startswith("ipc://"):
+        return "ipc://" + os.path.basename(url)
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or ""
+    return f"{parts.scheme}://{host}:{parts.port}" if parts.port else f"{parts.scheme}://{host}"
+
+
+class Metric:
+    """A named metric with a fixed set of label names
+
+    Values are kept per label combination. A metric built with ``function``
+    reads its values when it is scraped instead: the function returns one
+    number, or a dict of label value (or tuple of label values) to number.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.function = function
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _collect(self):
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        values = self.function()
+        if not isinstance(values, dict):
+            return {(): values}
+        return {key if isinstance(key, tuple) else (key,): value for key, value in values.items()}
+
+    def samples(self):
+        """Yield (sample name, label pairs, value) for the exposition"""
+        for key, value in sorted(self._collect().items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, pairs, value in self.samples():
+            lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", pairs + [("le", _format_value(float(bound)))], cumulative
+            yield f"{self.name}_bucket", pairs + [("le", "+Inf")], count
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, count
+
+
+class MetricsRegistry:
+    """Metrics of one process, rendered in the Prometheus text format
+
+    Registering a name twice returns the metric registered first, so callers
+    that run more than once (e.g. on every Streamlit rerun) share one series.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=(), function=None):
+        return self.register(Counter(name, help, labels, function))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=METRICS_LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Return every metric as Prometheus exposition text"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing source must not take the whole scrape down
+                continue
+        return "\n".join(lines) + "\n"
+
+
+class PaymentMetrics(MetricsRegistry):
+    """The node, payment pipeline and HTTP server metrics of the app
+
+    JSON-RPC metrics are recorded by MetricsProvider around every request to a
+    node. The payment pipeline reports broadcast and confirmation times;
+    ``watch_cache()`` exposes the hit and miss counters of a cache object.
+    """
+
+    def __init__(self, latency_buckets=METRICS_LATENCY_BUCKETS, confirm_buckets=METRICS_CONFIRM_BUCKETS):
+        super().__init__()
+        self._caches = {}
+        self.rpc_duration = self.histogram(
+            "rpc_request_duration_seconds",
+            "JSON-RPC request latency by method and node; batches are labelled batch=\"true\"",
+            ("method", "endpoint", "batch"), latency_buckets)
+        self.rpc_calls = self.counter(
+            "rpc_calls_total", "JSON-RPC calls sent, counting every call inside a batch", ("method",))
+        self.rpc_errors = self.counter(
+            "rpc_errors_total", "JSON-RPC calls that failed in transport or with an error response",
+            ("method", "kind"))
+        self.rpc_in_flight = self.gauge("rpc_requests_in_flight", "JSON-RPC requests waiting for a node")
+        self.broadcast_duration = self.histogram(
+            "payment_broadcast_seconds", "Time from a payment approval to its transaction being broadcast",
+            ("outcome",), latency_buckets)
+        self.confirm_duration = self.histogram(
+            "payment_confirm_seconds", "Time from broadcast to a final receipt of payment transactions",
+            ("status",), confirm_buckets)
+        self.http_duration = self.histogram(
+            "http_request_duration_seconds", "Payment server handler time by route and status code",
+            ("method", "route", "status"), latency_buckets)
+        self.http_in_flight = self.gauge("http_requests_in_flight", "Payment server requests being handled")
+        self.counter("cache_hits_total", "Lookups answered from a cache", ("cache",),
+                     function=lambda: self._cache_counts("hits"))
+        self.counter("cache_misses_total", "Lookups a cache could not answer", ("cache",),
+                     function=lambda: self._cache_counts("misses"))
+        self.gauge("cache_hit_ratio", "Share of lookups answered from a cache since start", ("cache",),
+                   function=self._cache_ratios)
+
+    def watch_cache(self, name, cache):
+        """Expose ``cache.hits`` and ``cache.misses`` under the cache label ``name``"""
+        with self._lock:
+            self._caches[name] = cache
+
+    def _cache_counts(self, attribute):
+        with self._lock:
+            caches = dict(self._caches)
+        return {name: getattr(cache, attribute) for name, cache in caches.items()}
+
+    def _cache_ratios(self):
+        hits = self._cache_counts("hits")
+        misses = self._cache_counts("misses")
+        return {name: hits[name] / (hits[name] + misses[name]) if hits[name] + misses[name] else 0.0
+                for name in hits}
+
+    def observe_rpc(self, methods, endpoint, elapsed, responses=None, error=None):
+        """Record one request of ``methods`` (one name, or one per call of a batch)"""
+        batch = not isinstance(methods, str)
+        names = list(methods) if batch else [methods]
+        if batch:
+            label = names[0] if len(set(names)) == 1 else "mixed"
+        else:
+            label = methods
+        self.rpc_duration.observe(elapsed, method=label, endpoint=endpoint, batch="true" if batch else "false")
+        for method in names:
+            self.rpc_calls.inc(method=method)
+        if error is not None:
+            for method in names:
+                self.rpc_errors.inc(method=method, kind="transport")
+            return
+        if isinstance(responses, dict):
+            # A batch refused as a whole comes back as one error object
+            responses = [responses] * len(names) if 'error' in responses else []
+        for method, response in zip(names, responses or []):
+            if isinstance(response, dict) and 'error' in response:
+                self.rpc_errors.inc(method=method, kind="rpc")
+
+    def observe_confirmation(self, entry):
+        """Record the broadcast-to-final-receipt time of a receipt tracker entry that carries payments"""
+        if entry and entry['payment_ids'] and entry['completed_at']:
+            self.confirm_duration.observe(entry['completed_at'] - entry['submitted_at'], status=entry['status'])
+
+
+class MetricsProvider(JSONBaseProvider):
+    """Provider middleware that records every JSON-RPC request of the provider it wraps
+
+    Sits between Web3 and the node's provider, so requests made through
+    ``w3.eth`` and contract calls as well as direct ``w3.provider`` batches
+    (ReadBatch, the receipt tracker) are timed per method and node without
+    touching their call sites.
+    """
+
+    def __init__(self, provider, metrics, endpoint=None):
+        super().__init__()
+        self.provider = provider
+        self.metrics = metrics
+        self.endpoint = endpoint or endpoint_label(str(getattr(provider, 'endpoint_uri', '') or provider))
+
+    def __str__(self):
+        return f"MetricsProvider({self.provider})"
+
+    def make_request(self, method, params):
+        return self._timed(method, lambda: self.provider.make_request(method, params))
+
+    def make_batch_request(self, requests):
+        return self._timed([method for method, _ in requests], lambda: self.provider.make_batch_request(requests))
+
+    def _timed(self, methods, send):
+        self.metrics.rpc_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            response = send()
+        except Exception as e:
+            self.metrics.observe_rpc(methods, self.endpoint, time.perf_counter() - start, error=e)
+            raise
+        finally:
+            self.metrics.rpc_in_flight.dec()
+        if isinstance(methods, str):
+            responses = [response]
+        else:
+            responses = response
+        self.metrics.observe_rpc(methods, self.endpoint, time.perf_counter() - start, responses=responses)
+        return response
@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+# Concurrency settings for the mobile payment server
+PAYMENT_SERVER_WORKERS = int(os.getenv("PAYMENT_SERVER_WORKERS", "8"))
+PAYMENT_SERVER_QUEUE = int(os.getenv("PAYMENT_SERVER_QUEUE", "32"))
+
+BUSY_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"Content-Length: 40\r\n"
+    b"\r\n"
+    b"Payment server is busy, please try again"
+)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that handles requests on a bounded pool of worker threads
+
+    At most ``max_workers`` requests run at once and up to ``max_queue`` more
+    wait for a free worker. Anything beyond that is answered with a 503 right
+    away instead of stalling the accept loop.
+
+    A handler can ``detach()`` its connection to keep it open after the handler
+    returns, e.g. to hand a long-lived status stream to another thread; the
+    worker is freed and the new owner closes the socket.
+    """
+
+    # Accept bursts of phones scanning at once; the pool decides what gets served
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=PAYMENT_SERVER_WORKERS,
+                 max_queue=PAYMENT_SERVER_QUEUE):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="payment-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        """Queue the request on the worker pool or reject it when the pool is full"""
+        if not self._slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        try:
+            self.executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor is shutting down
+            self._slots.release()
+            self.reject_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._detached_lock:
+                detached = request in self._detached
+                self._detached.discard(request)
+            if not detached:
+                self.shutdown_request(request)
+            self._slots.release()
+
+    def detach(self, request):
+        """Leave the request's socket open when its handler returns"""
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def reject_request(self, request):
+        """Answer with 503 Service Unavailable and close the connection"""
+        try:
+            # Runs on the accept loop, so never wait on the client: read only what already
+            # arrived, which keeps the close from resetting the connection in most cases
+            request.setblocking(False)
+            try:
+                request.recv(65536)
+            except BlockingIOError:
+                pass
+            # A fresh socket's send buffer holds the short response without blocking
+            request.sendall(BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        """Close the listening socket and wait for in-flight requests to finish"""
+        super().server_close()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,229 @@
+import json
+import os
+import selectors
+import socket
+import threading
+import time
+
+from background_worker import BackgroundWorker
+
+# Seconds between rounds of the status watcher when nothing wakes it up
+STATUS_TICK = float(os.getenv("STATUS_TICK", "1.0"))
+# Seconds between keep-alive comments on an idle event stream
+STATUS_HEARTBEAT = float(os.getenv("STATUS_HEARTBEAT", "15"))
+# Event streams are closed after this many seconds; EventSource reconnects on its own
+STATUS_STREAM_TIMEOUT = float(os.getenv("STATUS_STREAM_TIMEOUT", "300"))
+# Longest wait a long-poll request may ask for
+STATUS_LONG_POLL_TIMEOUT = float(os.getenv("STATUS_LONG_POLL_TIMEOUT", "30"))
+# Open status connections held by the watcher at once
+STATUS_MAX_WATCHERS = int(os.getenv("STATUS_MAX_WATCHERS", "1000"))
+
+# Status of a payment ID that has nothing on chain or in flight yet
+AWAITING = "awaiting"
+# Final status: a PaymentProcessed log or a confirmed receipt was seen
+SETTLED = "settled"
+
+SSE_HEADERS = (
+    b"HTTP/1.0 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"\r\n"
+    b"retry: 3000\n\n"
+)
+
+
+def json_response(body):
+    """Return a complete HTTP/1.0 JSON response for a long-poll request"""
+    body = json.dumps(body).encode('utf-8')
+    return (
+        b"HTTP/1.0 200 OK\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Access-Control-Allow-Origin: *\r\n"
+        b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+        b"\r\n" + body
+    )
+
+
+def sse_event(body):
+    """Return one server-sent ``status`` event"""
+    return b"event: status\ndata: " + json.dumps(body).encode('utf-8') + b"\n\n"
+
+
+class PaymentStatusHub(BackgroundWorker):
+    """One watcher thread that pushes payment status to many open connections
+
+    ``lookup(payment_id)`` returns the current status dict of a payment from
+    in-memory state (the log follower and receipt tracker), so the watcher never
+    calls the node itself: however many phones and tabs are watching, node
+    traffic stays the follower's and tracker's own polling. ``notify()`` wakes
+    the watcher when that state changes; otherwise it looks again every ``tick``
+    seconds. Each payment ID is looked up once per round and the result is
+    written to all of its watchers.
+
+    ``watch()`` takes over a connection from the HTTP server, so a waiting
+    client does not hold a worker thread. Event streams get a ``status`` event
+    on every change and are closed once the payment settles; long-poll requests
+    get one JSON response as soon as the status differs from ``since``, or the
+    current status when their wait runs out. Writes are non-blocking and a
+    client that cannot keep up is dropped.
+    """
+
+    def __init__(self, lookup, tick=STATUS_TICK, heartbeat=STATUS_HEARTBEAT,
+                 stream_timeout=STATUS_STREAM_TIMEOUT, max_watchers=STATUS_MAX_WATCHERS):
+        super().__init__("payment-status")
+        self.lookup = lookup
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self.stream_timeout = stream_timeout
+        self.max_watchers = max_watchers
+        self._lock = threading.Lock()
+        self._watchers = {}
+        # Connections admitted under max_watchers that are still being set up
+        self._joining = 0
+
+    def stop(self, timeout=5):
+        """Stop the watcher thread and close every open connection"""
+        super().stop(timeout)
+        with self._lock:
+            watchers, self._watchers = list(self._watchers.values()), {}
+        for watcher in watchers:
+            self._close(watcher)
+
+    def notify(self, *args):
+        """Wake the watcher; accepts and ignores any subscriber callback arguments"""
+        self.wake()
+
+    def status(self, payment_id):
+        """Return the current status dict of a payment ID"""
+        return self.lookup(payment_id)
+
+    def watchers(self):
+        """Return how many connections are waiting for status updates"""
+        with self._lock:
+            return len(self._watchers)
+
+    def watch(self, connection, payment_id, stream, since=None, wait=STATUS_LONG_POLL_TIMEOUT):
+        """Take over a connection and answer it with status updates
+
+        Returns False without touching the connection when the hub is full.
+        """
+        now = time.monotonic()
+        timeout = self.stream_timeout if stream else min(wait, STATUS_LONG_POLL_TIMEOUT)
+        watcher = {
+            'connection': connection,
+            'payment_id': payment_id,
+            'stream': stream,
+            'last_status': since,
+            'deadline': now + timeout,
+            'last_write': now,
+            'new': True,
+        }
+        with self._lock:
+            if len(self._watchers) + self._joining >= self.max_watchers:
+                return False
+            self._joining += 1
+        try:
+            if stream:
+                connection.sendall(SSE_HEADERS)
+            connection.setblocking(False)
+        except OSError:
+            with self._lock:
+                self._joining -= 1
+            connection.close()
+            return True
+        with self._lock:
+            self._joining -= 1
+            self._watchers[connection] = watcher
+        self.wake()
+        return True
+
+    def run_once(self):
+        self.dispatch()
+        return self.tick
+
+    def retry_delay(self):
+        return self.tick
+
+    def dispatch(self):
+        """Run one round: drop closed clients and send every status change"""
+        with self._lock:
+            watchers = list(self._watchers.values())
+        if not watchers:
+            return
+        closed = self._closed_by_client(watchers)
+        statuses = {}
+        now = time.monotonic()
+        for watcher in watchers:
+            if watcher['connection'] in closed:
+                self._drop(watcher)
+                continue
+            payment_id = watcher['payment_id']
+            if payment_id not in statuses:
+                statuses[payment_id] = self.lookup(payment_id)
+            status = statuses[payment_id]
+            changed = status['status'] != watcher['last_status']
+            expired = now >= watcher['deadline']
+            if not watcher['stream']:
+                if changed or expired:
+                    self._send(watcher, json_response(status))
+                    self._drop(watcher)
+                continue
+            if changed or watcher['new']:
+                watcher['last_status'] = status['status']
+                if not self._send(watcher, sse_event(status)):
+                    continue
+            elif now - watcher['last_write'] >= self.heartbeat:
+                if not self._send(watcher, b": keep-alive\n\n"):
+                    continue
+            watcher['new'] = False
+            if status['status'] == SETTLED or expired:
+                self._drop(watcher)
+
+    def _closed_by_client(self, watchers):
+        # Clients send nothing after their request, so a readable socket means EOF
+        closed = set()
+        with selectors.DefaultSelector() as selector:
+            for watcher in watchers:
+                try:
+                    selector.register(watcher['connection'], selectors.EVENT_READ)
+                except (OSError, ValueError):
+                    closed.add(watcher['connection'])
+            for key, _ in selector.select(0):
+                connection = key.fileobj
+                try:
+                    if not connection.recv(4096):
+                        closed.add(connection)
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    closed.add(connection)
+        return closed
+
+    def _send(self, watcher, data):
+        """Write without blocking; drop the watcher and return False if it cannot take the data"""
+        try:
+            sent = watcher['connection'].send(data)
+        except OSError:
+            sent = 0
+        if sent < len(data):
+            self._drop(watcher)
+            return False
+        watcher['last_write'] = time.monotonic()
+        return True
+
+    def _drop(self, watcher):
+        with self._lock:
+            if self._watchers.pop(watcher['connection'], None) is None:
+                return
+        self._close(watcher)
+
+    def _close(self, watcher):
+        connection = watcher['connection']
+        try:
+            connection.setblocking(True)
+            connection.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        connection.close()
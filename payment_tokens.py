@@ -0,0 +1,89 @@
+import os
+import re
+import secrets
+import string
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a payment link stays valid after it was issued
+PAYMENT_TOKEN_TTL = float(os.getenv("PAYMENT_TOKEN_TTL", "3600"))
+PAYMENT_TOKEN_LENGTH = int(os.getenv("PAYMENT_TOKEN_LENGTH", "8"))
+
+BASE62 = string.digits + string.ascii_letters
+# Payment IDs are shown on the approval page and printed on invoices; keep them to new_payment_id's alphabet
+PAYMENT_ID_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+
+def new_token(length=PAYMENT_TOKEN_LENGTH):
+    """Return a random base62 token"""
+    return "".join(secrets.choice(BASE62) for _ in range(length))
+
+
+def new_payment_id(prefix="PAY"):
+    """Return a payment ID that stays unique when many are created in the same second"""
+    return f"{prefix}-{int(time.time())}-{new_token(6)}"
+
+
+def is_valid_payment_id(payment_id):
+    """Return True if a payment ID is 1-64 letters, digits, '-' or '_', starting with a letter or digit"""
+    return isinstance(payment_id, str) and PAYMENT_ID_PATTERN.fullmatch(payment_id) is not None
+
+
+class PaymentTokenStore:
+    """In-memory map of short payment link tokens to payment requests
+
+    ``issue()`` returns a short base62 token for a merchant, amount and payment
+    ID, so the QR code carries ``/p/<token>`` instead of the whole request, and
+    ``resolve()`` looks it up with one dict access. Tokens expire ``ttl`` seconds
+    after they were issued; issuing the same request again while its token is
+    live returns the same token, so reprinted QR codes stay identical.
+    """
+
+    def __init__(self, ttl=PAYMENT_TOKEN_TTL, length=PAYMENT_TOKEN_LENGTH):
+        self.ttl = ttl
+        self.length = length
+        self._lock = threading.Lock()
+        # Insertion order is expiry order because every token lives for ttl
+        self._tokens = OrderedDict()
+        self._by_request = {}
+
+    def issue(self, merchant, amount, payment_id):
+        """Return a live token for the payment request"""
+        key = (merchant, amount, payment_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            token = self._by_request.get(key)
+            if token:
+                return token
+            token = new_token(self.length)
+            while token in self._tokens:
+                token = new_token(self.length)
+            self._tokens[token] = (
+                {'merchant': merchant, 'amount': amount, 'paymentId': payment_id},
+                now + self.ttl,
+            )
+            self._by_request[key] = token
+            return token
+
+    def resolve(self, token):
+        """Return the payment request for a token, or None if unknown or expired"""
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return dict(entry[0])
+
+    def _expire(self, now):
+        while self._tokens:
+            token, (request, expires) = next(iter(self._tokens.items()))
+            if expires > now:
+                break
+            del self._tokens[token]
+            key = (request['merchant'], request['amount'], request['paymentId'])
+            self._by_request.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
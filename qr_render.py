@@ -0,0 +1,111 @@
+import io
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+import qrcode
+from PIL import Image
+from qrcode import util
+
+# Rendered QR images kept in memory, keyed by payload and format
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "256"))
+# "png" for a 1-bit PNG or "svg" for a vector image
+QR_IMAGE_FORMAT = os.getenv("QR_IMAGE_FORMAT", "png")
+QR_BOX_SIZE = int(os.getenv("QR_BOX_SIZE", "10"))
+
+ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+
+
+def qr_version(data, error_correction=ERROR_CORRECTION):
+    """Return the smallest QR version that holds the payload in byte mode"""
+    payload_bits = 8 * len(data.encode('utf-8'))
+    limits = util.BIT_LIMIT_TABLE[error_correction]
+    # The length field is 8 bits wide up to version 9 and 16 bits after that
+    for length_bits, first, last in ((8, 1, 9), (16, 10, 40)):
+        version = bisect_left(limits, 4 + length_bits + payload_bits, first, last + 1)
+        if version <= last:
+            return version
+    raise qrcode.exceptions.DataOverflowError()
+
+
+class QRRenderer:
+    """LRU cache of rendered QR code images
+
+    A payload is encoded once with its version computed up front instead of
+    searched for, and the image bytes are reused for every later request of the
+    same payload and format, e.g. a terminal reprinting the same invoice. PNGs
+    are 1-bit; SVGs skip raster encoding entirely.
+    """
+
+    def __init__(self, max_entries=QR_CACHE_SIZE, box_size=QR_BOX_SIZE):
+        self.max_entries = max_entries
+        self.box_size = box_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def render(self, data, image_format=QR_IMAGE_FORMAT):
+        """Return the QR code for a payload as PNG bytes or SVG text"""
+        key = (data, image_format)
+        with self._lock:
+            image = self._cache.get(key)
+            if image is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+        image = self.encode(data, image_format)
+        with self._lock:
+            self._cache[key] = image
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return image
+
+    def encode(self, data, image_format=QR_IMAGE_FORMAT):
+        """Encode a payload without going through the cache"""
+        qr = qrcode.QRCode(
+            version=qr_version(data),
+            error_correction=ERROR_CORRECTION,
+            border=4,
+        )
+        qr.add_data(data, optimize=0)
+        qr.make(fit=False)
+        matrix = qr.get_matrix()
+        if image_format == "svg":
+            return _svg(matrix, self.box_size)
+        return _png(matrix, self.box_size)
+
+
+def _png(matrix, box_size):
+    # One pixel per module, then scaled up; much cheaper than drawing each box
+    size = len(matrix)
+    img = Image.new("1", (size, size))
+    img.putdata([0 if dark else 255 for row in matrix for dark in row])
+    img = img.resize((size * box_size, size * box_size), Image.NEAREST)
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+
+def _svg(matrix, box_size):
+    # One path of horizontal runs in module units; the viewBox does the scaling
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    size = len(matrix)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size * box_size}" '
+        f'height="{size * box_size}" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(runs)}" fill="#000"/></svg>'
+    )
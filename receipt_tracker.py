@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from web3.exceptions import TransactionNotFound
+
+from background_worker import BackgroundWorker
+from rpc_batch import RPC_BATCH_SIZE, to_int
+
+# How many blocks a payment needs on top of it before it counts as confirmed
+CONFIRMATION_DEPTH = int(os.getenv("CONFIRMATION_DEPTH", "1"))
+RECEIPT_POLL_INTERVAL = float(os.getenv("RECEIPT_POLL_INTERVAL", "1.0"))
+RECEIPT_MAX_POLL_INTERVAL = float(os.getenv("RECEIPT_MAX_POLL_INTERVAL", "8.0"))
+# Receipts requested per JSON-RPC batch
+RECEIPT_BATCH_SIZE = int(os.getenv("RECEIPT_BATCH_SIZE", str(RPC_BATCH_SIZE)))
+
+# Transaction states in the status table
+PENDING = "pending"
+MINED = "mined"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+
+
+def normalize_tx_hash(tx_hash):
+    """Return a tx hash as a 0x-prefixed lowercase hex string"""
+    if isinstance(tx_hash, (bytes, bytearray)):
+        tx_hash = tx_hash.hex()
+    tx_hash = tx_hash.lower()
+    return tx_hash if tx_hash.startswith("0x") else "0x" + tx_hash
+
+
+class ReceiptTracker(BackgroundWorker):
+    """Follows broadcast transactions to confirmation on a background thread
+
+    Submitters call ``track()`` right after ``send_raw_transaction`` and return
+    immediately. The tracker polls for receipts and keeps a status table that the
+    payment server and the dashboard read through ``status()`` and
+    ``status_for_payment()``.
+
+    All pending hashes share one poller: each round costs one ``eth_blockNumber``
+    call, and only when a new block has arrived (or new hashes were tracked) does
+    it send one JSON-RPC batch of ``eth_getTransactionReceipt`` calls. While the
+    chain head stands still the poll interval doubles up to ``max_poll_interval``.
+    """
+
+    def __init__(self, w3, confirmations=CONFIRMATION_DEPTH, poll_interval=RECEIPT_POLL_INTERVAL,
+                 max_poll_interval=RECEIPT_MAX_POLL_INTERVAL, batch_size=RECEIPT_BATCH_SIZE,
+                 max_entries=10000):
+        super().__init__("receipt-tracker")
+        self.w3 = w3
+        self.confirmations = max(1, confirmations)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.last_head = None
+        self._fresh = set()
+        self._lock = threading.Lock()
+        self._interval = poll_interval
+        self._statuses = OrderedDict()
+        self._payments = {}
+        self._subscribers = []
+
+    def track(self, tx_hash, payment_id=None, payment_ids=()):
+        """Add a broadcast transaction to the status table and return its entry
+
+        A transaction that settles several payments passes them as ``payment_ids``.
+        """
+        tx_hash = normalize_tx_hash(tx_hash)
+        payment_ids = list(payment_ids)
+        if payment_id is not None:
+            payment_ids.insert(0, payment_id)
+        entry = {
+            'tx_hash': tx_hash,
+            'payment_id': payment_id,
+            'payment_ids': payment_ids,
+            'status': PENDING,
+            'block_number': None,
+            'confirmations': 0,
+            'submitted_at': time.time(),
+            'completed_at': None,
+        }
+        with self._lock:
+            self._statuses[tx_hash] = entry
+            for tracked_payment in payment_ids:
+                self._payments[tracked_payment] = tx_hash
+            self._fresh.add(tx_hash)
+            self._evict()
+        # Look the new hash up right away and poll at full speed again
+        self._interval = self.poll_interval
+        self.wake()
+        return dict(entry)
+
+    def subscribe(self, callback):
+        """Call ``callback(tx_hash, receipt)`` when a tracked transaction is confirmed or fails"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def status(self, tx_hash):
+        """Return a copy of the status entry for a tx hash, or None if unknown"""
+        with self._lock:
+            entry = self._statuses.get(normalize_tx_hash(tx_hash))
+            return dict(entry) if entry else None
+
+    def status_for_payment(self, payment_id):
+        """Return the status entry of the latest transaction for a payment ID"""
+        with self._lock:
+            tx_hash = self._payments.get(payment_id)
+            entry = self._statuses.get(tx_hash) if tx_hash else None
+            return dict(entry) if entry else None
+
+    def pending(self):
+        """Return the tx hashes that have not reached a final state"""
+        with self._lock:
+            return [h for h, e in self._statuses.items() if e['status'] in (PENDING, MINED)]
+
+    def in_flight(self):
+        """Return how many tracked transactions are pending and mined but not yet confirmed"""
+        counts = {PENDING: 0, MINED: 0}
+        with self._lock:
+            for entry in self._statuses.values():
+                if entry['status'] in counts:
+                    counts[entry['status']] += 1
+        return counts
+
+    def _evict(self):
+        # Drop the oldest finished entries once the table is full
+        if len(self._statuses) <= self.max_entries:
+            return
+        for tx_hash in list(self._statuses):
+            if len(self._statuses) <= self.max_entries:
+                break
+            entry = self._statuses[tx_hash]
+            if entry['status'] in (CONFIRMED, FAILED):
+                del self._statuses[tx_hash]
+                for tracked_payment in entry['payment_ids']:
+                    if self._payments.get(tracked_payment) == tx_hash:
+                        del self._payments[tracked_payment]
+
+    def run_once(self):
+        if self.pending() and self.poll():
+            self._interval = self.poll_interval
+            return self._interval
+        # Nothing new on chain: back off until the next block shows up
+        return self.retry_delay()
+
+    def retry_delay(self):
+        self._interval = min(self._interval * 2, self.max_poll_interval)
+        return self._interval
+
+    def poll(self):
+        """Run one polling round and return True if receipts were requested
+
+        Receipts are only fetched when the chain head moved since the last round or
+        when newly tracked hashes have not been looked up yet.
+        """
+        head = self.w3.eth.block_number
+        with self._lock:
+            fresh, self._fresh = self._fresh, set()
+        if head == self.last_head:
+            hashes = [h for h in self.pending() if h in fresh]
+        else:
+            hashes = self.pending()
+        if not hashes:
+            self.last_head = head
+            return False
+        try:
+            receipts = self.fetch_receipts(hashes)
+        except Exception:
+            # Look the fresh hashes up again next round
+            with self._lock:
+                self._fresh |= fresh
+            raise
+        self.last_head = head
+        self.apply_receipts(receipts, head)
+        return True
+
+    def fetch_receipts(self, hashes):
+        """Return {tx_hash: receipt or None}, batching the lookups per JSON-RPC request"""
+        receipts = {}
+        for start in range(0, len(hashes), self.batch_size):
+            chunk = hashes[start:start + self.batch_size]
+            try:
+                responses = self.w3.provider.make_batch_request(
+                    [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in chunk]
+                )
+            except (NotImplementedError, AttributeError):
+                responses = None
+            if not isinstance(responses, list):
+                # Node or provider without batch support: fall back to one call per hash
+                receipts.update(self._fetch_receipts_individually(chunk))
+                continue
+            for tx_hash, response in zip(chunk, responses):
+                receipts[tx_hash] = response.get('result')
+        return receipts
+
+    def _fetch_receipts_individually(self, hashes):
+        receipts = {}
+        for tx_hash in hashes:
+            try:
+                receipts[tx_hash] = self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                receipts[tx_hash] = None
+        return receipts
+
+    def apply_receipts(self, receipts, head):
+        """Update the status table from a {tx_hash: receipt} map at chain head ``head``"""
+        now = time.time()
+        finished = []
+        with self._lock:
+            for tx_hash, receipt in receipts.items():
+                entry = self._statuses.get(tx_hash)
+                if not entry or receipt is None or entry['status'] in (CONFIRMED, FAILED):
+                    continue
+                entry['block_number'] = to_int(receipt['blockNumber'])
+                entry['confirmations'] = max(0, head - entry['block_number'] + 1)
+                if to_int(receipt['status']) != 1:
+                    entry['status'] = FAILED
+                    entry['completed_at'] = now
+                    finished.append((tx_hash, receipt))
+                elif entry['confirmations'] >= self.confirmations:
+                    entry['status'] = CONFIRMED
+                    entry['completed_at'] = now
+                    finished.append((tx_hash, receipt))
+                else:
+                    entry['status'] = MINED
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            for tx_hash, receipt in finished:
+                callback(tx_hash, receipt)
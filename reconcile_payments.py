@@ -0,0 +1,219 @@
+"""End-of-day reconciliation of invoices against the chain
+
+Reads payment IDs from a CSV or JSONL file (``payment_id`` plus optional
+``merchant`` and ``amount`` in ETH, e.g. a bulk_invoices manifest) or from a
+text file with one ID per line, and writes one CSV row per ID with its status:
+
+- ``matched``: settled, and merchant and amount agree with the invoice
+- ``missing``: not settled on chain
+- ``amount_mismatch`` / ``merchant_mismatch``: settled with different terms,
+  or the invoice's amount or merchant could not be parsed
+- ``unverified``: settled, but no PaymentProcessed log was found to compare
+
+Settlement flags come from ``processedPayments`` reads sent as JSON-RPC batches.
+Payment details come from the local payment ledger with ``--ledger``, or else
+from one pass over the contract's PaymentProcessed logs per run, in block
+windows, matched locally against every chunk of IDs.
+
+    python reconcile_payments.py invoices.csv -o reconciliation.csv --from-block 1200000
+"""
+import argparse
+import csv
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+
+from web3 import Web3
+
+import env_settings  # noqa: F401
+from bulk_invoices import read_invoices
+from contract_abi import payment_contract_at, payment_id_key
+from payment_events import LOG_MAX_BLOCK_RANGE, LOG_START_BLOCK, contract_events, payment_id_topic, read_logs
+from payment_ledger import PaymentLedger
+from rpc_batch import ReadBatch
+from web3_provider import make_web3
+
+# Payment IDs resolved per round of batched reads
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "2000"))
+
+MATCHED = "matched"
+MISSING = "missing"
+AMOUNT_MISMATCH = "amount_mismatch"
+MERCHANT_MISMATCH = "merchant_mismatch"
+UNVERIFIED = "unverified"
+
+RESULT_FIELDS = [
+    "payment_id", "status", "expected_merchant", "expected_amount",
+    "merchant", "payer", "amount", "block_number", "tx_hash",
+]
+
+
+def _amount_wei(amount):
+    try:
+        return Web3.to_wei(Decimal(amount), 'ether')
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def _checksum(address):
+    try:
+        return Web3.to_checksum_address(address)
+    except (ValueError, TypeError):
+        return None
+
+
+class PaymentReconciler:
+    """Resolves the on-chain state of many payment IDs with batched reads
+
+    Without a ledger the PaymentProcessed logs are read once per reconciler,
+    from ``from_block`` to the head as it was first needed, and only newer
+    blocks are read for later chunks.
+    """
+
+    def __init__(self, w3, contract, ledger=None, from_block=LOG_START_BLOCK,
+                 max_block_range=LOG_MAX_BLOCK_RANGE, chunk_size=RECONCILE_CHUNK_SIZE):
+        self.w3 = w3
+        self.contract = contract
+        self.ledger = ledger
+        self.from_block = from_block
+        self.max_block_range = max_block_range
+        self.chunk_size = chunk_size
+        self._events = contract_events(contract, ("PaymentProcessed",))
+        self._payments = {}
+        self._next_block = from_block
+
+    def reconcile(self, invoices):
+        """Yield a result row for every invoice dict, in input order"""
+        chunk = []
+        for invoice in invoices:
+            chunk.append(invoice)
+            if len(chunk) >= self.chunk_size:
+                yield from self._reconcile_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._reconcile_chunk(chunk)
+
+    def _reconcile_chunk(self, invoices):
+        payment_ids = [(invoice.get('payment_id') or '').strip() for invoice in invoices]
+        settled = self.settled(payment_ids)
+        hashes = {payment_id: Web3.to_hex(payment_id_topic(payment_id))
+                  for payment_id in payment_ids if settled.get(payment_id)}
+        details = self.payment_details(set(hashes.values()))
+        for payment_id, invoice in zip(payment_ids, invoices):
+            row = {
+                'payment_id': payment_id,
+                'expected_merchant': (invoice.get('merchant') or '').strip(),
+                'expected_amount': (str(invoice.get('amount') or '')).strip(),
+            }
+            if not settled.get(payment_id):
+                row['status'] = MISSING
+                yield row
+                continue
+            payment = details.get(hashes[payment_id])
+            if payment is None:
+                row['status'] = UNVERIFIED
+                yield row
+                continue
+            row.update(
+                merchant=payment['merchant'],
+                payer=payment['payer'],
+                amount=format(Web3.from_wei(payment['amount_wei'], 'ether'), 'f'),
+                block_number=payment['block_number'],
+                tx_hash=payment['tx_hash'],
+            )
+            row['status'] = MATCHED
+            # Unparseable invoice values cannot match and are reported on their row
+            if row['expected_amount'] and _amount_wei(row['expected_amount']) != payment['amount_wei']:
+                row['status'] = AMOUNT_MISMATCH
+            elif row['expected_merchant'] and _checksum(row['expected_merchant']) != payment['merchant']:
+                row['status'] = MERCHANT_MISMATCH
+            yield row
+
+    def settled(self, payment_ids):
+        """Return {payment_id: bool} from batched processedPayments reads"""
+        reads = ReadBatch(self.w3)
+        lookups = [
+            (payment_id, reads.call(self.contract.functions.processedPayments(
+                payment_id_key(self.contract, payment_id))))
+            for payment_id in set(payment_ids) if payment_id
+        ]
+        if lookups and not reads.execute():
+            raise ConnectionError("Could not read payment status from the node")
+        return {payment_id: read.value for payment_id, read in lookups}
+
+    def payment_details(self, payment_id_hashes):
+        """Return PaymentProcessed details keyed by payment ID hash"""
+        if not payment_id_hashes:
+            return {}
+        if self.ledger:
+            return self.ledger.payments_by_id_hash(payment_id_hashes)
+        if any(payment_id_hash not in self._payments for payment_id_hash in payment_id_hashes):
+            self._scan_logs()
+        return {payment_id_hash: self._payments[payment_id_hash]
+                for payment_id_hash in payment_id_hashes if payment_id_hash in self._payments}
+
+    def _scan_logs(self):
+        """Read PaymentProcessed logs from where the last scan stopped up to the head"""
+        head = self.w3.eth.block_number
+        for _, end, events in read_logs(self.w3, self.contract.address, self._events,
+                                        self._next_block, head, self.max_block_range):
+            for event in events:
+                args = event['args']
+                self._payments[Web3.to_hex(args['paymentId'])] = {
+                    'block_number': event['blockNumber'],
+                    'tx_hash': Web3.to_hex(event['transactionHash']),
+                    'merchant': args['merchant'],
+                    'payer': args['payer'],
+                    'amount_wei': args['amount'],
+                }
+            self._next_block = end + 1
+
+def read_payment_ids(path):
+    """Yield invoice dicts from a CSV/JSONL file or a text file of payment IDs"""
+    if path.endswith((".csv", ".jsonl")):
+        yield from read_invoices(path)
+        return
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield {'payment_id': line.strip()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile payment IDs against the PaymentGateway contract")
+    parser.add_argument("payment_ids", help="CSV/JSONL with payment_id (and merchant, amount) or a text file of IDs")
+    parser.add_argument("-o", "--output", help="CSV file to write (default: stdout)")
+    parser.add_argument("--url", default=os.getenv("BLOCKCHAIN_URL", "http://127.0.0.1:8545"))
+    parser.add_argument("--contract", default=os.getenv("SMART_CONTRACT_ADDRESS"))
+    parser.add_argument("--ledger", help="payment ledger database to read payment details from")
+    parser.add_argument("--from-block", type=int, default=LOG_START_BLOCK,
+                        help="first block searched for PaymentProcessed logs")
+    args = parser.parse_args(argv)
+    if not args.contract:
+        parser.error("--contract or SMART_CONTRACT_ADDRESS is required")
+
+    w3 = make_web3(args.url)
+    contract = payment_contract_at(w3, args.contract, os.getenv("PAYMENT_ID_FORMAT", "auto"))
+    ledger = None
+    if args.ledger:
+        ledger = PaymentLedger(w3, contract, db_path=args.ledger, from_block=args.from_block)
+        ledger.sync()
+    reconciler = PaymentReconciler(w3, contract, ledger=ledger, from_block=args.from_block)
+
+    output = open(args.output, "w", newline='') if args.output else sys.stdout
+    counts = {}
+    try:
+        writer = csv.DictWriter(output, RESULT_FIELDS)
+        writer.writeheader()
+        for row in reconciler.reconcile(read_payment_ids(args.payment_ids)):
+            writer.writerow(row)
+            counts[row['status']] = counts.get(row['status'], 0) + 1
+    finally:
+        if args.output:
+            output.close()
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())), file=sys.stderr)
+    return 0 if set(counts) <= {MATCHED} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
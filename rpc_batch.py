@@ -0,0 +1,134 @@
+import os
+
+from web3 import Web3
+
+# Calls per JSON-RPC batch request; nodes commonly cap batches at 1000 calls
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", "500"))
+
+
+class BatchRead:
+    """Placeholder for one read in a ReadBatch, filled in by ``execute()``"""
+
+    def __init__(self, method, params, formatter):
+        self.method = method
+        self.params = params
+        self.formatter = formatter
+        self.done = False
+        self.error = None
+        self._value = None
+
+    @property
+    def value(self):
+        """The formatted result; raises if the read failed or has not run yet"""
+        if not self.done:
+            raise RuntimeError(f"{self.method} has not been executed")
+        if self.error is not None:
+            raise self.error
+        return self._value
+
+    def resolve(self, response):
+        self.done = True
+        if 'error' in response:
+            error = response['error']
+            message = error.get('message', error) if isinstance(error, dict) else error
+            self.error = RuntimeError(f"{self.method} failed: {message}")
+        else:
+            try:
+                self._value = self.formatter(response.get('result'))
+            except Exception as e:
+                self.error = e
+
+    def fail(self, error):
+        self.done = True
+        self.error = error
+
+
+def to_int(value):
+    """Return a JSON-RPC quantity, hex string or already decoded, as an int"""
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def _normalize(output_type, value):
+    # The codec returns lowercase addresses; contract .call() checksums them
+    if output_type == 'address':
+        return Web3.to_checksum_address(value)
+    if output_type.startswith('address['):
+        return [Web3.to_checksum_address(address) for address in value]
+    return value
+
+
+class ReadBatch:
+    """Collects the node reads a page needs and sends them in one JSON-RPC batch
+
+    Add reads with ``block_number()``, ``call()`` or ``add()``; each returns a
+    BatchRead whose ``value`` is available after ``execute()``. Providers or
+    nodes without batch support get the same reads as individual requests.
+    """
+
+    def __init__(self, w3, batch_size=RPC_BATCH_SIZE):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.reads = []
+
+    def add(self, method, params=(), formatter=lambda result: result):
+        """Queue a raw JSON-RPC read"""
+        read = BatchRead(method, list(params), formatter)
+        self.reads.append(read)
+        return read
+
+    def block_number(self):
+        """Queue eth_blockNumber"""
+        return self.add("eth_blockNumber", formatter=to_int)
+
+    def call(self, contract_function, block='latest'):
+        """Queue a view function call and decode its outputs like ``.call()`` would"""
+        output_types = [output['type'] for output in contract_function.abi['outputs']]
+
+        def decode(result):
+            data = bytes.fromhex(result[2:] if result.startswith("0x") else result)
+            values = [_normalize(output_type, value)
+                      for output_type, value in zip(output_types, self.w3.codec.decode(output_types, data))]
+            return values[0] if len(values) == 1 else list(values)
+
+        transaction = {
+            'to': contract_function.address,
+            'data': contract_function._encode_transaction_data(),
+        }
+        return self.add("eth_call", [transaction, block], decode)
+
+    def execute(self):
+        """Send every queued read and return True if the node answered"""
+        pending = [read for read in self.reads if not read.done]
+        answered = False
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            responses = self._send_batch(chunk)
+            if responses is None:
+                answered |= self._send_individually(chunk)
+                continue
+            answered = True
+            for read, response in zip(chunk, responses):
+                read.resolve(response)
+        return answered
+
+    def _send_batch(self, reads):
+        try:
+            responses = self.w3.provider.make_batch_request(
+                [(read.method, read.params) for read in reads]
+            )
+        except Exception:
+            return None
+        # A single error object instead of a list means the node refused the batch
+        if not isinstance(responses, list) or len(responses) != len(reads):
+            return None
+        return responses
+
+    def _send_individually(self, reads):
+        answered = False
+        for read in reads:
+            try:
+                read.resolve(self.w3.provider.make_request(read.method, read.params))
+                answered = True
+            except Exception as e:
+                read.fail(e)
+        return answered
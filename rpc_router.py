@@ -0,0 +1,298 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from eth_account import Account
+from web3.providers import JSONBaseProvider
+
+# Weight of the newest sample in the per-endpoint latency and error averages
+RPC_EWMA_ALPHA = float(os.getenv("RPC_EWMA_ALPHA", "0.2"))
+# A read is also sent to the next endpoint after this many times the primary's average latency...
+RPC_HEDGE_FACTOR = float(os.getenv("RPC_HEDGE_FACTOR", "3"))
+# ...but never sooner than this many seconds
+RPC_HEDGE_MIN_DELAY = float(os.getenv("RPC_HEDGE_MIN_DELAY", "0.05"))
+# Consecutive transport failures that take an endpoint out of rotation
+RPC_EJECT_AFTER = int(os.getenv("RPC_EJECT_AFTER", "3"))
+# Seconds an ejected endpoint stays out before it gets traffic again
+RPC_EJECT_SECONDS = float(os.getenv("RPC_EJECT_SECONDS", "30"))
+# Share of reads sent to a random healthy endpoint so slow ones get re-measured
+RPC_EXPLORE_RATIO = float(os.getenv("RPC_EXPLORE_RATIO", "0.02"))
+RPC_ROUTER_WORKERS = int(os.getenv("RPC_ROUTER_WORKERS", "16"))
+
+# Methods that change state and stay on the sender's endpoint
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+# Filters live on the node that created them
+FILTER_METHODS = {
+    "eth_newFilter", "eth_newBlockFilter", "eth_newPendingTransactionFilter",
+    "eth_getFilterChanges", "eth_getFilterLogs", "eth_uninstallFilter",
+}
+# Position of the block parameter of reads that name a block
+BLOCK_PARAMS = {
+    "eth_getBlockByNumber": 0,
+    "eth_getBlockTransactionCountByNumber": 0,
+    "eth_call": 1,
+    "eth_estimateGas": 1,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+}
+
+
+def split_urls(url):
+    """Return the endpoints of a comma-separated BLOCKCHAIN_URL"""
+    return [part.strip() for part in url.split(",") if part.strip()]
+
+
+def _block_number(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith("0x") and len(value) < 66:
+        return int(value, 16)
+    # "latest", "pending", block hashes
+    return None
+
+
+def required_block(method, params):
+    """Return the block number a read needs the node to have, or None"""
+    params = params or []
+    if method == "eth_getLogs" and params and isinstance(params[0], dict):
+        return _block_number(params[0].get('toBlock'))
+    position = BLOCK_PARAMS.get(method)
+    if position is not None and len(params) > position:
+        return _block_number(params[position])
+    return None
+
+
+def sender_of(method, params):
+    """Return the account whose nonce order a request depends on, or None"""
+    if method == "eth_sendRawTransaction":
+        try:
+            return Account.recover_transaction(params[0]).lower()
+        except Exception:
+            return None
+    if method == "eth_sendTransaction":
+        return str(params[0].get('from', '')).lower() or None
+    if method == "eth_getTransactionCount" and len(params) > 1 and params[1] == "pending":
+        return str(params[0]).lower()
+    return None
+
+
+class Endpoint:
+    """Health and latency statistics of one node"""
+
+    def __init__(self, url, provider):
+        self.url = url
+        self.provider = provider
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.hedges_won = 0
+        # Highest block number this node has reported
+        self.head = None
+
+    def healthy(self, now):
+        return now >= self.ejected_until
+
+    def has_block(self, block_number):
+        return block_number is None or (self.head is not None and self.head >= block_number)
+
+    def score(self):
+        """Lower is better; unmeasured endpoints go first so they get measured"""
+        return (self.latency or 0.0) * (1 + 10 * self.error_rate) + self.error_rate
+
+
+class RoutingProvider(JSONBaseProvider):
+    """Spreads JSON-RPC requests over several nodes of the same chain
+
+    Every endpoint keeps an exponentially weighted average of its latency and
+    transport error rate. Reads go to the healthy endpoint with the best score;
+    when it has not answered after ``hedge_factor`` times its average latency the
+    same read is also sent to the runner-up and the first answer wins. A read
+    that fails in transport is retried on the next endpoint. A small share of
+    reads is hedged right away to a random other healthy endpoint, so a node
+    that was slow is noticed when it recovers.
+
+    Every ``eth_blockNumber`` answer is remembered as that node's head. A read
+    that names a block number (``eth_getLogs`` up to a block, ``get_block(n)``,
+    a call at a block) only goes to nodes known to have that block, so a node
+    that lags behind the one that reported the head cannot answer with an
+    empty or short range. Nodes that are behind are a last resort.
+
+    Transactions and ``pending`` nonce reads of a sender stay on one endpoint so
+    its nonces and mempool view stay consistent; the sender moves only when its
+    endpoint is ejected. Filters stay on the first healthy endpoint. JSON-RPC
+    error responses (reverts, bad params) are answers, not failures.
+
+    An endpoint with ``eject_after`` consecutive transport failures is skipped
+    for ``eject_seconds`` and then tried again.
+    """
+
+    def __init__(self, urls, make_provider, alpha=RPC_EWMA_ALPHA, hedge_factor=RPC_HEDGE_FACTOR,
+                 hedge_min_delay=RPC_HEDGE_MIN_DELAY, eject_after=RPC_EJECT_AFTER,
+                 eject_seconds=RPC_EJECT_SECONDS, explore_ratio=RPC_EXPLORE_RATIO,
+                 max_workers=RPC_ROUTER_WORKERS):
+        super().__init__()
+        self.endpoints = [Endpoint(url, make_provider(url)) for url in urls]
+        self.alpha = alpha
+        self.hedge_factor = hedge_factor
+        self.hedge_min_delay = hedge_min_delay
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.explore_ratio = explore_ratio
+        self._lock = threading.Lock()
+        self._sticky = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rpc-router")
+
+    def __str__(self):
+        return f"RoutingProvider({', '.join(endpoint.url for endpoint in self.endpoints)})"
+
+    def make_request(self, method, params):
+        """Send one request to the endpoint chosen for its method"""
+        def send(endpoint):
+            response = endpoint.provider.make_request(method, params)
+            if method == "eth_blockNumber":
+                self._note_head(endpoint, response)
+            return response
+
+        if method in FILTER_METHODS:
+            return self._send_sticky("filters", send, failover=False)
+        sender = sender_of(method, params)
+        if sender:
+            # A node-signed transaction must not be sent twice
+            return self._send_sticky(sender, send, failover=method != "eth_sendTransaction")
+        if method in WRITE_METHODS:
+            return self._send_in_order(self.ranked()[:1], send)
+        return self._send_read(send, min_block=required_block(method, params))
+
+    def make_batch_request(self, requests):
+        """Send a batch of reads to the best endpoint, failing over but not hedging"""
+        def send(endpoint):
+            responses = endpoint.provider.make_batch_request(requests)
+            if isinstance(responses, list):
+                for (method, _), response in zip(requests, responses):
+                    if method == "eth_blockNumber":
+                        self._note_head(endpoint, response)
+            return responses
+
+        blocks = [block for block in (required_block(method, params) for method, params in requests)
+                  if block is not None]
+        return self._send_read(send, hedge=False, min_block=max(blocks) if blocks else None)
+
+    def stats(self):
+        """Return a snapshot of every endpoint's health"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'url': endpoint.url,
+                'latency_ms': round(endpoint.latency * 1000, 1) if endpoint.latency is not None else None,
+                'error_rate': round(endpoint.error_rate, 3),
+                'ejected': not endpoint.healthy(now),
+                'requests': endpoint.requests,
+                'hedges_won': endpoint.hedges_won,
+                'head': endpoint.head,
+            } for endpoint in self.endpoints]
+
+    def ranked(self, min_block=None):
+        """Return healthy endpoints that have ``min_block`` best first, then the ones behind
+        (highest head first), then ejected ones as a last resort"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.healthy(now)]
+            ready = sorted((e for e in healthy if e.has_block(min_block)), key=Endpoint.score)
+            behind = sorted((e for e in healthy if not e.has_block(min_block)), key=lambda e: -(e.head or -1))
+            ejected = sorted((e for e in self.endpoints if not e.healthy(now)), key=lambda e: e.ejected_until)
+        return ready + behind + ejected
+
+    def _note_head(self, endpoint, response):
+        result = response.get('result') if isinstance(response, dict) else None
+        head = _block_number(result)
+        if head is not None:
+            with self._lock:
+                endpoint.head = head if endpoint.head is None else max(endpoint.head, head)
+
+    def _send_sticky(self, key, send, failover):
+        with self._lock:
+            endpoint = self._sticky.get(key)
+        if endpoint is None or not endpoint.healthy(time.monotonic()):
+            endpoint = self.ranked()[0]
+            with self._lock:
+                self._sticky[key] = endpoint
+        try:
+            return self._timed(endpoint, send)
+        except Exception:
+            if not failover or len(self.endpoints) == 1:
+                raise
+        # Signed transactions and nonce reads are safe to repeat on another node
+        fallback = next(e for e in self.ranked() if e is not endpoint)
+        with self._lock:
+            self._sticky[key] = fallback
+        return self._timed(fallback, send)
+
+    def _send_read(self, send, hedge=True, min_block=None):
+        candidates = self.ranked(min_block)
+        if len(candidates) == 1 or not hedge:
+            return self._send_in_order(candidates, send)
+        primary = candidates[0]
+        now = time.monotonic()
+        healthy = [e for e in candidates[1:] if e.healthy(now) and e.has_block(min_block)]
+        futures = {self._executor.submit(self._timed, primary, send): primary}
+        if healthy and random.random() < self.explore_ratio:
+            runner_up = random.choice(healthy)
+            futures[self._executor.submit(self._timed, runner_up, send)] = runner_up
+        elif healthy:
+            delay = max(self.hedge_min_delay, self.hedge_factor * (primary.latency or 0.0))
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                futures[self._executor.submit(self._timed, healthy[0], send)] = healthy[0]
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1:
+                        with self._lock:
+                            futures[future].hedges_won += 1
+                    return future.result()
+        # Every attempt failed in transport: try the endpoints that were not asked yet
+        return self._send_in_order([e for e in candidates if e not in futures.values()], send,
+                                   error=next(iter(futures)).exception())
+
+    def _send_in_order(self, endpoints, send, error=None):
+        for endpoint in endpoints:
+            try:
+                return self._timed(endpoint, send)
+            except Exception as e:
+                error = e
+        raise error
+
+    def _timed(self, endpoint, send):
+        start = time.perf_counter()
+        try:
+            response = send(endpoint)
+        except Exception:
+            self._record(endpoint, time.perf_counter() - start, failed=True)
+            raise
+        self._record(endpoint, time.perf_counter() - start, failed=False)
+        return response
+
+    def _record(self, endpoint, elapsed, failed):
+        alpha = self.alpha
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.error_rate = (1 - alpha) * endpoint.error_rate + alpha * (1.0 if failed else 0.0)
+            if failed:
+                endpoint.failures += 1
+                if endpoint.failures >= self.eject_after:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                    endpoint.failures = 0
+                return
+            endpoint.failures = 0
+            if endpoint.latency is None:
+                endpoint.latency = elapsed
+            else:
+                endpoint.latency = (1 - alpha) * endpoint.latency + alpha * elapsed
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from eth_account import Account
+from web3 import Web3
+
+# Signing processes; 0 means one per CPU
+SIGNING_WORKERS = int(os.getenv("SIGNING_WORKERS", "0"))
+# Batches smaller than this are signed inline, where a process hop costs more than it saves
+SIGNING_MIN_BATCH = int(os.getenv("SIGNING_MIN_BATCH", "32"))
+# Transactions per task sent to a signing process
+SIGNING_CHUNK_SIZE = int(os.getenv("SIGNING_CHUNK_SIZE", "64"))
+
+
+class SigningError(Exception):
+    """A transaction could not be signed; the message never contains key material"""
+
+
+def _redact(message, private_key):
+    key_hex = Web3.to_hex(private_key) if isinstance(private_key, (bytes, bytearray)) else str(private_key)
+    for form in {key_hex, key_hex[2:] if key_hex.startswith("0x") else key_hex}:
+        if form:
+            message = message.replace(form, "<redacted>")
+    return message
+
+
+def sign_chunk(items):
+    """Sign (index, transaction, private_key) items in order and return the raw transactions"""
+    raw_transactions = []
+    for index, transaction, private_key in items:
+        try:
+            raw_transactions.append(bytes(Account.sign_transaction(transaction, private_key).raw_transaction))
+        except Exception as e:
+            # Raised without the original exception so its arguments never reach a log
+            raise SigningError(
+                f"Could not sign transaction {index}: {type(e).__name__}: {_redact(str(e), private_key)}"
+            ) from None
+    return raw_transactions
+
+
+class TransactionSigner:
+    """Signs built transactions, in parallel worker processes for large batches
+
+    ``sign()`` signs one transaction inline. ``sign_many()`` takes a list of
+    ``(transaction, private_key)`` pairs and returns the raw transactions in the
+    same order; batches of ``min_batch`` or more are split into chunks that a
+    pool of worker processes signs in parallel, so secp256k1 signing and RLP
+    encoding use every core instead of one thread under the GIL.
+
+    Keys only travel to the workers over their private pipes. Errors are
+    re-raised as SigningError with the key removed from the message and without
+    the original exception attached.
+    """
+
+    def __init__(self, workers=SIGNING_WORKERS, min_batch=SIGNING_MIN_BATCH, chunk_size=SIGNING_CHUNK_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_batch = min_batch
+        self.chunk_size = max(1, chunk_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __repr__(self):
+        return f"TransactionSigner(workers={self.workers})"
+
+    def sign(self, transaction, private_key):
+        """Return the raw signed transaction, signed on the calling thread"""
+        return sign_chunk([(0, transaction, private_key)])[0]
+
+    def sign_many(self, items):
+        """Return raw signed transactions for (transaction, private_key) pairs, in order"""
+        items = [(index, transaction, private_key) for index, (transaction, private_key) in enumerate(items)]
+        if len(items) < self.min_batch or self.workers == 1:
+            return sign_chunk(items)
+        # Even chunks so every worker gets a share, but not so small that pickling dominates
+        chunk_size = max(self.chunk_size, -(-len(items) // (self.workers * 4)))
+        chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+        try:
+            signed = list(self._pool().map(sign_chunk, chunks))
+        except BrokenProcessPool:
+            # A worker died; sign this batch inline and start a fresh pool next time
+            self.close()
+            return sign_chunk(items)
+        return [raw_transaction for chunk in signed for raw_transaction in chunk]
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned, not forked, so workers never hold a copy of the app's memory and the keys in it
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def close(self):
+        """Shut the worker processes down"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
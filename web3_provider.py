@@ -0,0 +1,59 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+
+from payment_metrics import MetricsProvider, endpoint_label
+from rpc_router import RoutingProvider, split_urls
+
+# Keep-alive connections kept open to the node
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "20"))
+RPC_CONNECT_TIMEOUT = float(os.getenv("RPC_CONNECT_TIMEOUT", "3"))
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "30"))
+
+
+def make_session(pool_size=RPC_POOL_SIZE):
+    """Return a requests session with a keep-alive pool shared by all threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def make_provider(url, pool_size=RPC_POOL_SIZE, timeout=RPC_TIMEOUT):
+    """Return a provider for an http(s)://, ws(s):// or IPC endpoint
+
+    HTTP endpoints share one pooled session across every thread of the process.
+    WebSocket and IPC endpoints skip HTTP framing entirely and are the lower
+    latency choice for a node on the same machine.
+    """
+    if url.startswith(("ws://", "wss://")):
+        return Web3.LegacyWebSocketProvider(url, websocket_timeout=timeout)
+    if url.startswith("ipc://"):
+        return Web3.IPCProvider(url[len("ipc://"):], timeout=timeout)
+    if url.endswith(".ipc"):
+        return Web3.IPCProvider(url, timeout=timeout)
+    return Web3.HTTPProvider(
+        url,
+        session=make_session(pool_size),
+        request_kwargs={'timeout': (RPC_CONNECT_TIMEOUT, timeout)},
+    )
+
+
+def make_web3(url, metrics=None, **kwargs):
+    """Return a Web3 client for the endpoint, or routed over several comma-separated endpoints
+
+    With a PaymentMetrics registry every request to each endpoint is recorded in it.
+    """
+    def endpoint_provider(endpoint):
+        provider = make_provider(endpoint, **kwargs)
+        if metrics is None:
+            return provider
+        return MetricsProvider(provider, metrics, endpoint_label(endpoint))
+
+    urls = split_urls(url)
+    if len(urls) > 1:
+        return Web3(RoutingProvider(urls, endpoint_provider))
+    return Web3(endpoint_provider(url))